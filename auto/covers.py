@@ -0,0 +1,112 @@
+import math
+# The cover moves are planned on the OT2 computer when the dispensing plan is loaded, so this
+# module only uses the standard library.
+
+
+class CoverDeck():
+    """The state of the covers: which blocks of source vials are uncovered and how many covers
+    are stacked on each side of the cover deck.
+
+    A location is either a block of vials (slot, k), see `layout.cover_blocks`, or a stack of
+    the cover deck (deck_slot, side). All the blocks are covered unless listed in `uncovered`.
+
+    Parameters
+    ----------
+    deck_slot : int
+        The slot of the cover deck.
+    stacks : list[int], optional
+        The number of covers on each stack of the deck. The default is two empty stacks.
+    uncovered : list[tuple(int, int)], optional
+        The blocks without cover.
+    """
+    def __init__(self, deck_slot:int, stacks:list=None, uncovered:list=()):
+        self.deck_slot = deck_slot
+        self.stacks = list(stacks or [0, 0])
+        self.uncovered = set(tuple(b) for b in uncovered)
+
+    def is_deck(self, location) -> bool:
+        return location[0] == self.deck_slot
+
+    def has_cover(self, location) -> bool:
+        if self.is_deck(location):
+            return self.stacks[location[1]] > 0
+        return tuple(location) not in self.uncovered
+
+    def check_move(self, from_location, to_location) -> None:
+        """Raise a ValueError if the cover cannot be moved from `from_location` to `to_location`."""
+        from_location, to_location = tuple(from_location), tuple(to_location)
+        if from_location == to_location:
+            raise ValueError(f"The cover is moved from {from_location} to itself.")
+        for location in (from_location, to_location):
+            if self.is_deck(location) and not 0 <= location[1] < len(self.stacks):
+                raise ValueError(f"The cover deck has no stack {location[1]}.")
+        if not self.has_cover(from_location):
+            raise ValueError(f"There is no cover at {from_location}.")
+        if not self.is_deck(to_location) and self.has_cover(to_location):
+            raise ValueError(f"{to_location} is already covered.")
+
+    def move(self, from_location, to_location) -> None:
+        """Move one cover and update the state, see `check_move`."""
+        self.check_move(from_location, to_location)
+        from_location, to_location = tuple(from_location), tuple(to_location)
+        if self.is_deck(from_location):
+            self.stacks[from_location[1]] -= 1
+        else:
+            self.uncovered.add(from_location)
+        if self.is_deck(to_location):
+            self.stacks[to_location[1]] += 1
+        else:
+            self.uncovered.discard(to_location)
+
+    def nearest_stack(self, location, positions:dict=None, loaded:bool=False) -> tuple:
+        """Return the deck stack closest to `location`, among the non-empty ones if `loaded`.
+        Without positions, the stack with the most covers is picked from and the one with the
+        fewest covers is put on.
+        """
+        sides = [s for s, n in enumerate(self.stacks) if n > 0 or not loaded]
+        if not sides:
+            raise ValueError("The cover deck is empty.")
+        if positions:
+            x, y = positions[tuple(location)]
+            key = lambda s: math.hypot(x - positions[(self.deck_slot, s)][0], y - positions[(self.deck_slot, s)][1])
+        else:
+            key = lambda s: -self.stacks[s] if loaded else self.stacks[s]
+        return (self.deck_slot, min(sides, key=key))
+
+
+def plan_cover_moves(covers:list, deck:CoverDeck, positions:dict=None) -> list:
+    """Plan the cover moves of a dispensing plan. Only the block being dispensed is uncovered:
+    the first block is uncovered onto the nearest deck stack, then the cover of each next block
+    is moved directly onto the previous block, and the deck cover closes the last block. This
+    takes n + 1 moves for n blocks instead of 2n round trips to the deck.
+
+    Parameters
+    ----------
+    covers : list[tuple(int, int)]
+        The cover of each block of the plan, see `DispensingPlan.covers`.
+    deck : CoverDeck
+        The state of the covers before dispensing. It is updated with the planned moves.
+    positions : dict, optional
+        The (x, y) position of the blocks and deck stacks, to pick the closest deck stack.
+
+    Returns
+    -------
+    moves : list[list[tuple]]
+        `moves[b]` are the (from, to) moves before block `b`, and `moves[-1]` the moves after the
+        last block.
+    """
+    moves = [[] for _ in range(len(covers) + 1)]
+    opened = None # the block that is currently uncovered
+    for b, cover in enumerate(covers):
+        cover = tuple(cover)
+        if cover == opened:
+            continue
+        to_location = opened if opened is not None else deck.nearest_stack(cover, positions)
+        deck.move(cover, to_location)
+        moves[b].append((cover, to_location))
+        opened = cover
+    if opened is not None:
+        from_location = deck.nearest_stack(opened, positions, loaded=True)
+        deck.move(from_location, opened)
+        moves[-1].append((from_location, opened))
+    return moves
@@ -0,0 +1,145 @@
+import os
+import json
+import math
+# The inventory is updated by the protocol on the OT2 computer and read on the control PC when a
+# plan is compiled, so this module only uses the standard library.
+
+
+def well_area(well:dict) -> float:
+    """Return the cross-section (mm2) of a well from its labware definition. When the opening is
+    narrower than the body of the vial, i.e. the capacity does not fit in the opening times the
+    depth, the mean cross-section of the capacity is used, which keeps the computed liquid level
+    below the real one.
+    """
+    if well.get("shape") == "circular":
+        area = math.pi * (well["diameter"] / 2) ** 2
+    else:
+        area = well["xDimension"] * well["yDimension"]
+    return max(area, well.get("totalLiquidVolume", 0) / well["depth"])
+
+
+def liquid_height(volume:float, well:dict) -> float:
+    """Return the height (mm) of `volume` uL of liquid above the bottom of a straight-walled well."""
+    return min(max(volume, 0.0) / well_area(well), well["depth"])
+
+
+def location_key(location:tuple) -> str:
+    """The key of a (slot, well) location in the inventory file, e.g. (5, "A1") -> "5:A1"."""
+    return f"{location[0]}:{location[1]}"
+
+
+class StockInventory():
+    """The volume left in every source well, persisted between runs.
+
+    Each well is registered with its geometry from the labware definition, so the liquid level is
+    known at every transfer. The pipette aspirates `submerge` mm below the level it leaves, never
+    closer than `clearance` mm to the bottom, instead of always at the bottom of the well. The
+    volume of a well is unknown until it is saved, given or refilled: an unknown well is not
+    tracked and the pipette aspirates from it at its fixed height.
+
+    >>> inventory = StockInventory("inventory.json")
+    >>> inventory.add_well((5, "A1"), definition["wells"]["A1"])
+    >>> z = inventory.aspiration_height((5, "A1"), 500)
+    >>> inventory.consume((5, "A1"), 500)
+
+    Parameters
+    ----------
+    path : str, optional
+        The json file the volumes are saved to after every transfer. None to not persist them.
+    clearance : float, optional
+        The lowest aspiration height above the bottom of the well in mm.
+    submerge : float, optional
+        The depth of the tip below the liquid level in mm.
+    dead_volume : float, optional
+        The volume (uL) which cannot be aspirated from a well.
+    warn_volume : float, optional
+        A warning is printed when the usable volume of a well falls below it (uL).
+    """
+    def __init__(self, path:str=None, clearance:float=1.0, submerge:float=3.0,
+                 dead_volume:float=0.0, warn_volume:float=2000.0):
+        self.path = path
+        self.clearance = clearance
+        self.submerge = submerge
+        self.dead_volume = dead_volume
+        self.warn_volume = warn_volume
+        self.wells = {} # {key: labware definition of the well}
+        self.volumes = {} # {key: volume left in uL, None if unknown}
+        self._saved = {} # the volumes of the file, used when a well is registered
+        if path is not None and os.path.isfile(path):
+            with open(path, "r") as f:
+                self._saved = json.load(f)["volumes"]
+
+    def add_well(self, location:tuple, well:dict, volume:float=None) -> None:
+        """Register a source well. Its volume is the saved one, else `volume`, else unknown."""
+        key = location_key(location)
+        self.wells[key] = well
+        self.volumes[key] = self._saved.get(key, volume)
+
+    def volume(self, location:tuple) -> float:
+        """The volume left in a well in uL, None if unknown."""
+        return self.volumes[location_key(location)]
+
+    def available(self, location:tuple) -> float:
+        """The volume which can still be aspirated from a well in uL, None if unknown."""
+        if self.volume(location) is None:
+            return None
+        return max(self.volume(location) - self.dead_volume, 0.0)
+
+    def height(self, location:tuple) -> float:
+        """The liquid level above the bottom of a well in mm."""
+        key = location_key(location)
+        return liquid_height(self.volumes[key], self.wells[key])
+
+    def aspiration_height(self, location:tuple, volume:float) -> float:
+        """The height (mm) above the bottom of the well to aspirate `volume` uL from, so that the
+        tip stays submerged until the end of the aspiration."""
+        key = location_key(location)
+        level = liquid_height(self.volumes[key] - volume, self.wells[key])
+        return max(level - self.submerge, self.clearance)
+
+    def consume(self, location:tuple, volume:float) -> None:
+        """Record the aspiration of `volume` uL from a well. The run is checked before it starts
+        (see `check`), so a well which holds less only prints a warning and is left empty."""
+        if self.volume(location) is None:
+            return
+        if volume > self.available(location):
+            print(f"Warning: source {location} has {self.available(location):g} uL left, {volume:g} uL needed.")
+        self.volumes[location_key(location)] = max(self.volume(location) - volume, 0.0)
+        if self.available(location) < self.warn_volume:
+            print(f"Warning: source {location} is running dry, {self.available(location):g} uL left.")
+        self.save()
+
+    def refill(self, location:tuple, volume:float=None) -> None:
+        """Record a refilled well, full by default."""
+        key = location_key(location)
+        self.volumes[key] = self.wells[key]["totalLiquidVolume"] if volume is None else volume
+        self.save()
+
+    def check(self, needs:dict) -> list:
+        """Return a warning for every well which will not hold enough liquid, or which will fall
+        below `warn_volume`, after the transfers `needs` = {location: volume in uL}. The wells of
+        unknown volume are not checked."""
+        warnings = []
+        for location, volume in needs.items():
+            if self.volume(location) is None:
+                continue
+            left = self.available(location) - volume
+            if left < 0:
+                warnings.append(f"Source {location} will run dry: {volume:g} uL needed, {self.available(location):g} uL left.")
+            elif left < self.warn_volume:
+                warnings.append(f"Source {location} will be low: {left:g} uL left after this run.")
+        return warnings
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self._saved.update({key: v for key, v in self.volumes.items() if v is not None})
+        with open(self.path, "w") as f:
+            json.dump({"volumes": self._saved}, f, indent=4)
+
+
+def saved_volumes(path:str, locations:list) -> list:
+    """Return the saved volume of each location of an inventory file, None where unknown."""
+    with open(path, "r") as f:
+        volumes = json.load(f)["volumes"]
+    return [volumes.get(location_key(location)) for location in locations]
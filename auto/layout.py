@@ -0,0 +1,141 @@
+import os
+import re
+import json
+# The layout is derived on the control PC when compiling a plan and on the OT2 computer when
+# loading the configuration, so this module only uses the standard library.
+
+COVER_SHAPE = [2, 2] # rows and columns of the wells under one cover
+SLOT_PITCH = [132.5, 90.5] # x and y distance (mm) between two neighbouring deck slots
+
+
+def slot_position(n:int) -> tuple:
+    """Return the (x, y) position (mm) of the front left corner of deck slot `n`. The slots
+    are numbered from 1 to 11, three per row from the front left.
+    """
+    return ((n - 1) % 3 * SLOT_PITCH[0], (n - 1) // 3 * SLOT_PITCH[1])
+
+
+def load_definition(definition:str, labware_dir:str="") -> dict:
+    """Load the definition of a labware.
+
+    Parameters
+    ----------
+    definition : str
+        The json file of a custom labware, or the load name of a standard Opentrons labware.
+    labware_dir : str, optional
+        The directory of the custom labware files. The default is the working directory.
+
+    Returns
+    -------
+    definition : dict
+        The labware definition, with the geometry of every well in `definition["wells"]`.
+
+    Raises
+    ------
+    ValueError
+        If no labware is given, or if a standard labware is used without opentrons installed.
+    """
+    if not definition:
+        raise ValueError("No labware is placed in that slot.")
+    if definition.endswith(".json"):
+        with open(os.path.join(labware_dir, definition), "r") as f:
+            return json.load(f)
+    try:
+        from opentrons.protocols.labware import get_labware_definition
+    except ModuleNotFoundError:
+        raise ValueError(f"Opentrons is required to load the standard labware '{definition}'.")
+    return get_labware_definition(definition)
+
+
+def split_well_name(well:str) -> tuple:
+    """Split a well name into its row and column, e.g. "AB12" -> ("AB", 12)."""
+    row, column = re.fullmatch(r"([A-Z]+)(\d+)", well).groups()
+    return row, int(column)
+
+
+def cover_blocks(definition:dict, cover_shape:list=COVER_SHAPE) -> list:
+    """Group the wells of a plate into the blocks covered by one cover.
+
+    The grid of the plate is tiled with `cover_shape` blocks, from left to right and then from
+    top to bottom, and the wells of each block are listed row by row. For the 2x4 plate:
+    [["A1", "A2", "B1", "B2"], ["A3", "A4", "B3", "B4"]].
+
+    Parameters
+    ----------
+    definition : dict
+        The labware definition.
+    cover_shape : list[int, int], optional
+        The number of rows and columns of wells under one cover.
+
+    Returns
+    -------
+    blocks : list[list[str]]
+        The well names of each block.
+    """
+    wells = set(definition["wells"])
+    names = [split_well_name(well) for well in wells]
+    rows = sorted({row for row, _ in names}, key=lambda row: (len(row), row))
+    columns = sorted({column for _, column in names})
+    height, width = cover_shape
+    blocks = []
+    for r in range(0, len(rows), height):
+        for c in range(0, len(columns), width):
+            block = [
+                f"{row}{column}" for row in rows[r: r + height] for column in columns[c: c + width]
+            ]
+            block = [well for well in block if well in wells]
+            if block:
+                blocks.append(block)
+    return blocks
+
+
+def plate_layout(plates:list, definitions:dict, cover_shape:list=COVER_SHAPE) -> tuple:
+    """Return all the well locations of the given plates in dispensing order and the cover block
+    of each location.
+
+    Parameters
+    ----------
+    plates : list[int]
+        The slots of the plates, in the order they are used.
+    definitions : dict
+        The labware definition of each slot.
+    cover_shape : list[int, int], optional
+        The number of rows and columns of wells under one cover.
+
+    Returns
+    -------
+    locations : list[tuple(int, str)]
+        e.g. [(2, "A1"), (2, "A2"), (2, "B1"), ..., (6, "B4")].
+    blocks : list[tuple(int, int)]
+        The (slot, block index) of each location, e.g. [(2, 0), (2, 0), (2, 0), ..., (6, 1)].
+    """
+    locations, blocks = [], []
+    for n in plates:
+        for k, wells in enumerate(cover_blocks(definitions[n], cover_shape)):
+            locations.extend((n, well) for well in wells)
+            blocks.extend([(n, k)] * len(wells))
+    return locations, blocks
+
+
+def config_layout(config:dict, key:str, labware_dir:str="") -> tuple:
+    """Return the layout of the plates listed under `config[key]`, e.g. "chemical_wells", see
+    `plate_layout`. `config` is the OT2 section of the configuration and may set the
+    "cover_shape" of the plates.
+    """
+    definitions = {
+        n: load_definition(config["labwares"][str(n)], labware_dir) for n in config[key]
+    }
+    return plate_layout(config[key], definitions, config.get("cover_shape", COVER_SHAPE))
+
+
+def config_capacities(config:dict, key:str, labware_dir:str="") -> list:
+    """Return the capacity (uL) of every well of the plates listed under `config[key]`, in the
+    order of `config_layout`. Wells without "totalLiquidVolume" have an infinite capacity.
+    """
+    definitions = {
+        n: load_definition(config["labwares"][str(n)], labware_dir) for n in config[key]
+    }
+    locations, _ = plate_layout(config[key], definitions, config.get("cover_shape", COVER_SHAPE))
+    return [
+        definitions[n]["wells"][well].get("totalLiquidVolume", float("inf")) for n, well in locations
+    ]
@@ -0,0 +1,105 @@
+import time
+
+
+class ClosedLoop():
+    """Run the self-driving loop without human input: poll the pending recipes, wait until they
+    fill a plate (or until the oldest has waited too long), run the plate and start again.
+
+    The recipes of a plate are remembered, so they are not run twice while their results are on
+    their way to the database, and forgotten once they are no longer pending. A plate which fails
+    is reported and its recipes are released, so they are run again by a later plate.
+
+    >>> loop = ClosedLoop(lambda: pending_recipes(comp_id, db), run_plate, capacity=16)
+    >>> loop.run_forever()
+
+    Parameters
+    ----------
+    poll : function() -> pandas.DataFrame
+        Return the pending recipes, with a "unique_id" column.
+    run : function(pandas.DataFrame)
+        Run a plate of recipes and push its results.
+    capacity : int
+        The number of recipes of a plate.
+    min_fill : int, optional
+        The number of pending recipes which starts a plate. The default is a full plate.
+    max_wait : float, optional
+        The time in seconds after which a plate starts with fewer recipes than `min_fill`, counted
+        from the first pending recipe. None to always wait for `min_fill` recipes.
+    poll_interval : float, optional
+        The time in seconds between two polls.
+    clock, sleep : function, optional
+        The clock and sleep functions, in seconds.
+    """
+    def __init__(self, poll, run, capacity:int, min_fill:int=None, max_wait:float=3600,
+                 poll_interval:float=60, clock=time.time, sleep=time.sleep):
+        self.poll = poll
+        self.run = run
+        self.capacity = capacity
+        self.min_fill = min(min_fill or capacity, capacity)
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.submitted = set() # the unique_id of the recipes run and still pending
+        self.plates = [] # (start time, end time, number of recipes) of every plate
+        self.failures = [] # (time, error) of every plate which failed
+        self._start = None
+        self._first_pending = None # when a pending recipe was first seen
+
+    def next_batch(self, timeout:float=None):
+        """Poll until a plate can start and return its recipes, or None after `timeout` seconds."""
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            pending = self.poll()
+            self.submitted &= set(pending["unique_id"]) # the others have their results
+            pending = pending.loc[~pending["unique_id"].isin(self.submitted)]
+            now = self.clock()
+            if len(pending) == 0:
+                self._first_pending = None
+            elif self._first_pending is None:
+                self._first_pending = now
+            waited_enough = (
+                self.max_wait is not None and self._first_pending is not None
+                and now - self._first_pending >= self.max_wait
+            )
+            if len(pending) >= self.min_fill or (len(pending) > 0 and waited_enough):
+                self._first_pending = None
+                return pending.head(self.capacity)
+            if deadline is not None and now >= deadline:
+                return None
+            self.sleep(self.poll_interval)
+
+    def run_forever(self, max_plates:int=None, timeout:float=None) -> None:
+        """Run plates until `max_plates` are done, or until no plate starts within `timeout` s.
+        A plate which raises an exception does not count and the loop waits `poll_interval` before
+        polling again."""
+        if self._start is None:
+            self._start = self.clock()
+        while max_plates is None or len(self.plates) < max_plates:
+            batch = self.next_batch(timeout)
+            if batch is None:
+                return
+            self.submitted.update(batch["unique_id"])
+            start = self.clock()
+            try:
+                self.run(batch)
+            except Exception as e:
+                self.submitted.difference_update(batch["unique_id"])
+                self.failures.append((start, e))
+                print(f"Plate of {len(batch)} recipes failed: {type(e).__name__}: {e}")
+                self.sleep(self.poll_interval)
+                continue
+            self.plates.append((start, self.clock(), len(batch)))
+            print(f"Plate {len(self.plates)}: {len(batch)} recipes in {self.clock() - start:.0f} s")
+
+    def plates_per_day(self) -> float:
+        elapsed = self.clock() - self._start if self._start is not None else 0.0
+        return len(self.plates) * 86400 / elapsed if elapsed > 0 else 0.0
+
+    def report(self) -> str:
+        recipes = sum(n for _, _, n in self.plates)
+        fill = recipes / (len(self.plates) * self.capacity) if self.plates else 0.0
+        return (
+            f"{len(self.plates)} plates, {recipes} recipes, {fill:.0%} average fill, "
+            f"{self.plates_per_day():.1f} plates/day"
+        ) + (f", {len(self.failures)} failed" if self.failures else "")
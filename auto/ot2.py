@@ -1,24 +1,58 @@
 import sys
 import os
 import json
-from itertools import product
-import pandas as pd
-import numpy as np
 sys.path.append("./")
+# This module is loaded by the protocol on the OT2 computer. Do not import pandas or numpy here:
+# each of them adds seconds to the protocol startup on the robot.
 try:
-    from robots import Robot, ConductivityMeter
+    from robots import Robot, ConductivityMeter, read_csv_records
 except ModuleNotFoundError:
-    from auto.robots import Robot, ConductivityMeter
+    from auto.robots import Robot, ConductivityMeter, read_csv_records
 
 try:
-    from sockets import SocketServer
+    from sockets import EventServer
 except ModuleNotFoundError:
-    from auto.sockets import SocketServer
+    from auto.sockets import EventServer
+try:
+    from squidstat import SquidStatRPC
+except ModuleNotFoundError:
+    from auto.squidstat import SquidStatRPC
+
+try:
+    from plan import DispensingPlan, build_plan
+except ModuleNotFoundError:
+    from auto.plan import DispensingPlan, build_plan
+
+try:
+    from layout import COVER_SHAPE, load_definition, cover_blocks, config_layout, slot_position
+except ModuleNotFoundError:
+    from auto.layout import COVER_SHAPE, load_definition, cover_blocks, config_layout, slot_position
+
+try:
+    from covers import CoverDeck, plan_cover_moves
+except ModuleNotFoundError:
+    from auto.covers import CoverDeck, plan_cover_moves
+
+try:
+    from inventory import StockInventory
+except ModuleNotFoundError:
+    from auto.inventory import StockInventory
+
+try:
+    from telemetry import Tracer, traced, summarize, format_summary
+except ModuleNotFoundError:
+    from auto.telemetry import Tracer, traced, summarize, format_summary
+
+try:
+    from route import TRASH_SLOT, MotionModel, plan_route, slot_center, well_position
+except ModuleNotFoundError:
+    from auto.route import TRASH_SLOT, MotionModel, plan_route, slot_center, well_position
 
 try:
     from opentrons import protocol_api, types
 except ModuleNotFoundError:
     from auto import protocol_api
+    from auto.protocol_api import types
 
 try:
     from pump_raspi import raspi_comm
@@ -31,6 +65,7 @@ class OT2(Robot):
         super().__init__(config=config)
         self.server = None # by default the server is down
         self.client = None
+        self.squidstat = None # the remote procedures of the SquidStat, once the server is up
         self.protocol = protocol
         self.lot = {i:None for i in range(1, 12)} # initiate plate 1 to 11
         self.arm = {"left": None, "right": None} # Initiate left and right arm
@@ -40,16 +75,26 @@ class OT2(Robot):
         self.formulations = None # Initiate formulations
         self._source_locations = [] # locations where the source chemical is stored
         self._source_locations_viscous = [] # locations where the source chemical is viscous
+        self._source_blocks = [] # the cover block of each source location
+        self.inventory = None # the volume left in each source location, see `inventory.StockInventory`
+        self.max_speeds = {} # the configured maximum speed of each axis in mm/s
+        self.motion = MotionModel() # predicts the travel time of the gantry
+        self.tracer = Tracer() # records the timing of the actions, see `telemetry.Tracer`
         self._target_locations = [] # locations where the target chemical is stored
         self._target_locations_dispensed = []
         self._last_source = None # the last source location
         self.dispensing_queue = [] # the queue of dispensing actions
-        self.cover_deck_status = [0, 0] # initialize the tower stack status (empty)
+        self.plan = None # the dispensing plan the queue is generated from
+        self.cover_deck = None # the state of the covers, see `covers.CoverDeck`
+        self.cover_moves = [] # the cover moves before each block of the dispensing queue
         self.cover_deck_plate_index = None # the index of the cover deck plate
         self.cover_thickness = None # the thickness of the cover
-        self.cover_offset = None # the offset of the cover deck w.r.t. top left vial
+        self._cover_offsets = {} # the first well of each cover block and the offset of its center
+        self._cover_positions = {} # the (x, y) position of each cover block and deck stack
         self.cover_deck_0 = None # the left side of the cover deck plate
         self.cover_deck_1 = None # the right side of the cover deck plate
+        self.pump = None # the vacuum pump drying the conductivity meter, see `raspi_comm.PumpController`
+        self._dry_time = 6.5 # the time the pump blows on the conductivity meter in seconds
         self.config = {} # the configuration of the OT2
         if config:
             self.load_config(config)
@@ -98,39 +143,67 @@ class OT2(Robot):
         self.cover_deck_plate_index = config["cover_deck"][0] # plate number for cover deck
         self.cover_deck_0 = self.lot[self.cover_deck_plate_index]["A1"]
         self.cover_deck_1 = self.lot[self.cover_deck_plate_index]["A2"]
-        source_plate_config_json = config["labwares"][str(config["chemical_wells"][0])]
-        with open(source_plate_config_json, "r") as f:
-            _config = json.load(f)
-            locations = np.array([
-                [_config["wells"][well]["x"], _config["wells"][well]["y"]]
-                for well in ["A1", "A2", "B1", "B2"]
-            ])
-            center = locations.mean(axis=0) # center of the left blocks
-            offset = center - locations[0] # offset of the center of left block w.r.t. A1
-        # load the cover thickness
-        with open(config["labwares"][str(self.cover_deck_plate_index)], "r") as f:
-            _config = json.load(f)
-            self.cover_thickness = _config["wells"]["A1"]["depth"]
-        
-        # x, y, z offset of the cover deck
-        self.cover_offset = types.Point(x=offset[0], y=offset[1], z=self.cover_thickness)
-        # Create a list of all possible source locations
-        self._source_locations = list(product( # [(2, "A3"), (2, "A4"), (6, "B3"), (6, "B4"), etc.]
-            config["chemical_wells"], 
-            ["A1", "A2", "B1", "B2", "A3", "A4", "B3", "B4"]
-        ))
-        self._source_locations_viscous = [tuple(v) for v in config["viscous"]] # viscous sources
+        # load the cover thickness, all the stacks of the deck are empty
+        cover_deck = load_definition(config["labwares"][str(self.cover_deck_plate_index)])
+        self.cover_thickness = cover_deck["wells"]["A1"]["depth"]
+        self.cover_deck = CoverDeck(self.cover_deck_plate_index, stacks=[0, 0])
+        x0, y0 = slot_position(self.cover_deck_plate_index)
+        for side, well in enumerate(["A1", "A2"]):
+            well = cover_deck["wells"][well]
+            self._cover_positions[(self.cover_deck_plate_index, side)] = (x0 + well["x"], y0 + well["y"])
+
+        # x, y, z offset of the center of each cover block w.r.t. its first vial
+        for n in config["chemical_wells"]:
+            plate = load_definition(config["labwares"][str(n)])
+            for k, wells in enumerate(cover_blocks(plate, config.get("cover_shape", COVER_SHAPE))):
+                locations = [(plate["wells"][well]["x"], plate["wells"][well]["y"]) for well in wells]
+                center = [sum(c) / len(locations) for c in zip(*locations)]
+                offset = types.Point(
+                    x=center[0] - locations[0][0], y=center[1] - locations[0][1], z=self.cover_thickness
+                )
+                self._cover_offsets[(n, k)] = (wells[0], offset)
+                x0, y0 = slot_position(n)
+                self._cover_positions[(n, k)] = (x0 + center[0], y0 + center[1])
+
+        # Create a list of all possible source locations, derived from the labware definitions
+        # [(2, "A1"), (2, "A2"), (2, "B1"), (2, "B2"), (2, "A3"), etc.], and the cover block of each
+        self._source_locations, self._source_blocks = config_layout(config, "chemical_wells")
+        self._source_locations_viscous = [tuple(v) for v in config.get("viscous", [])] # viscous sources
+
+        # Track the volume left in each source if the inventory section is set, saved to its "file"
+        # if any. The sources of unknown volume are aspirated from at a fixed height.
+        self.inventory = None
+        if "inventory" in config:
+            inventory_config = dict(config["inventory"])
+            inventory_file = inventory_config.pop("file", None)
+            self.inventory = StockInventory(
+                os.path.join(cwd, inventory_file) if inventory_file else None, **inventory_config
+            )
+            plates = {n: load_definition(config["labwares"][str(n)]) for n in config["chemical_wells"]}
+            for n, well in self._source_locations:
+                self.inventory.add_well((n, well), plates[n]["wells"][well])
 
         # Create a list of all possible target locations
-        self._target_locations = list(product( # [(2, "A3"), (2, "A4"), (6, "B3"), (6, "B4"), etc.]
-            config["formula_wells"], 
-            ["A1", "A2", "B1", "B2", "A3", "A4", "B3", "B4"]
-        ))
+        self._target_locations, _ = config_layout(config, "formula_wells")
+
+        # Record the timing of the actions, saved to the "file" of the trace section if any
+        trace_file = config.get("trace", {}).get("file")
+        self.tracer = Tracer(os.path.join(cwd, trace_file) if trace_file else None)
+
+        # Set the maximum speed of the axes, the opentrons defaults otherwise
+        self.max_speeds = dict(config.get("max_speeds", {}))
+        for axis, speed in self.max_speeds.items():
+            self.protocol.max_speeds[axis] = speed
+        self.motion = MotionModel(self.max_speeds)
+
+        self.pump = raspi_comm.PumpController(raspi_comm.RaspiChannel.from_config(self.config))
 
         # Mount pippetes and conductivity measure
         for key, value in config["pipettes"].items():
             if key == "max_volume":
                 self._pip_max_volume = value # the maximum volume of the pipette in uL
+            elif key in ("resolution", "min_volume"): # used when the plan is compiled
+                continue
             elif value == "conductivity":
                 self.arm[key] = self.protocol.load_instrument("p300_single_gen2", key)
                 self.cond_arm = self.arm[key]
@@ -144,12 +217,15 @@ class OT2(Robot):
 
     
     def start_server(self, host="169.254.230.44", port=23):
-        self.server = SocketServer(host=host, port=port)
+        """Start the event server of the instruments on a background thread, see `sockets.EventServer`."""
+        self.server = EventServer(host=host, port=port)
+        self.squidstat = SquidStatRPC(self.server)
+        self.server.start()
 
 
-    def send_message(self, message=None):
-        message = self.server.client_start("Start SquidStat")
-        return message
+    def send_message(self, message=None, client="squidstat", timeout=10):
+        """Send a text message to a connected instrument and return its answer."""
+        return self.server.request(client, "message", {"text": message}, timeout=timeout)
 
 
     def movearound(self) -> None:
@@ -165,6 +241,7 @@ class OT2(Robot):
         """Pause for `t` seconds."""
         self.protocol.delay(t)
 
+    @traced("pick_up_tip")
     def pick_up_tip(self, location=None) -> None:
         """Pick up a tip from the tiprack.
         """
@@ -172,6 +249,7 @@ class OT2(Robot):
         self.pip_arm.pick_up_tip(location)
         self._has_tip = True
     
+    @traced("drop_tip")
     def drop_tip(self, location=None) -> None:
         """Drop the tip to the waste.
         """
@@ -179,6 +257,7 @@ class OT2(Robot):
         self.pip_arm.drop_tip(location)
         self._has_tip = False
 
+    @traced("aspirate", "volume", "z")
     def aspirate(self, volume, location, speed_factor=1, z=5):
         """ Pippete will aspirate at `z`mm above the bottom of the well. 
         """
@@ -192,6 +271,7 @@ class OT2(Robot):
 
     
     
+    @traced("dispense", "volume")
     def dispense(self, volume, location, speed_factor=1, z=-5):
         """ Pippete will dispense at `z`mm below the top of the well and push out extra 10 uL. 
         """
@@ -203,6 +283,7 @@ class OT2(Robot):
         self.sleep(1.0)
 
 
+    @traced("dispense_chemical", "source", "target", "volume")
     def dispense_chemical(
             self, 
             source:tuple=(None,None),  
@@ -245,21 +326,25 @@ class OT2(Robot):
         # slow down the z-axis speed for viscous chemicals
         if speed_factor < 1:
             self.protocol.max_speeds['a'] = 60
-        self.aspirate(volume, self.lot[m][i], speed_factor=speed_factor)
+        # aspirate below the liquid level the transfer leaves, rather than at a fixed height, when
+        # the volume of the source is known
+        z = 5
+        if self.inventory is not None and self.inventory.volume(source) is not None:
+            z = self.inventory.aspiration_height(source, volume)
+            self.inventory.consume(source, volume)
+        self.aspirate(volume, self.lot[m][i], speed_factor=speed_factor, z=z)
         self.dispense(volume, self.lot[n][j], speed_factor=speed_factor)
         # reset the max z-axis speed
-        try: 
-            del self.protocol.max_speeds['a']
-        except KeyError:
-            pass
+        self.reset_speed('a')
         # Update the last source as a reference for the next dispensing action
         self._last_source = source
 
 
     def load_formulations(self, formula_input_path:str=""):
         """ Load the formulations from a csv file. 
-        The formulations are stored in `self.formulations`. It contains the following columns:
-        unique_id, locations, Chemical1, Chemical2, ..., Chemical16. 
+        The formulations are stored in `self.formulations`, a list with one dictionary per
+        formulation. Each dictionary has the following keys:
+        unique_id, location, Chemical1, Chemical2, ..., Chemical16. 
         
         Parameters
         ----------
@@ -271,10 +356,20 @@ class OT2(Robot):
         chemical_names : list
             A list of chemical names.
         """
-        df = pd.read_csv(formula_input_path).reset_index(drop=True)
-        chemical_names = [s for s in df.columns if "Chemical" in s]
-        df["location"] = self._target_locations[: len(df)]
-        self.formulations = df.loc[:, ["unique_id", "location"] + chemical_names]
+        columns, records = read_csv_records(formula_input_path)
+        chemical_names = [s for s in columns if "Chemical" in s]
+        if len(records) > len(self._target_locations):
+            raise ValueError(
+                f"{len(records)} formulations but only {len(self._target_locations)} target locations."
+            )
+        self.formulations = [
+            dict(
+                unique_id=record["unique_id"], 
+                location=location, 
+                **{name: record[name] or 0 for name in chemical_names} # empty field means 0 uL
+            )
+            for record, location in zip(records, self._target_locations)
+        ]
         self.chemical_names = chemical_names
     
 
@@ -288,7 +383,7 @@ class OT2(Robot):
         Given the target formulations and chemical sources, create a queue of aspiration/dispensing actions
         for individual source and target. The generated queue is stored in dictionary `self.dispensing_queue`. 
         The keys are block names and the values are blocks of continuous dispensing actions.
-        There are at maximum 16 source locations and 16 target locations. The total number of entries in the queue is 16*16=256.
+        The source and target locations are all the wells of the plates in "chemical_wells" and "formula_wells".
 
         Parameters
         ----------
@@ -330,48 +425,70 @@ class OT2(Robot):
         ...
 
         """
-        _dispensing_queue = []
-        _cont_dispensing_queue = [] # The dispensing queue for each chemical
         # Read the formulations and get all the chemical names in the formulations
         if formula_input_path is None:
             formula_input_path = self._formulation_input_path
         self.load_formulations(formula_input_path)
 
         assert self.chemical_names is not [], "Call 'ot2.load_formulations()' first"
-        # Generate the dispensing queue
-        for i, name in enumerate(self.chemical_names):
-            volume_all = self.formulations[name]
-            # Check if the total volume of the chemical exceeds the limit
-            if volume_all.sum() > volume_limit: 
-                raise ValueError(f"Volume of {name} exceeds {volume_limit} uL.")
-            source = self._source_locations[i] # The source location of the chemical
-            if source in self._source_locations_viscous:
-                speed_factor = 0.5 # slow down the pipette speed for viscous chemicals
-            else:
-                speed_factor = 1
-            # Generate the dispensing queue for each chemical
-            for j, volume in volume_all.items():
-                if volume == 0: continue # skip empty volume
-                target = self._target_locations[j] # The target location of the chemical
-                # If the volume is larger than the max volume of the pipette, divide the volume into smaller volumes
-                _dispensing_volumes = []
-                while volume > self._pip_max_volume:
-                    _dispensing_volumes.append(self._pip_max_volume)
-                    volume -= self._pip_max_volume
-                else:
-                    _dispensing_volumes.append(volume)
-                for volume in _dispensing_volumes:
-                    _cont_dispensing_queue.append([source, target, volume, speed_factor])
-            if not ((i+1) % 4):  # add to the queue every 4 chemicals
-                if _cont_dispensing_queue:
-                    _dispensing_queue.append(_cont_dispensing_queue)
-                _cont_dispensing_queue = []  # reset the sub queue
-        
-        # Append a last void sub-queue to the queue to indicate the end of the dispensing
-        _dispensing_queue.append([[(None, None), (None, None), 0, 1]]) 
+        # Generate the dispensing plan and the queue from it
+        plan = build_plan(
+            self.formulations,
+            chemical_names=self.chemical_names,
+            sources=self._source_locations,
+            targets=self._target_locations,
+            blocks=self._source_blocks,
+            viscous=self._source_locations_viscous,
+            pip_max_volume=self._pip_max_volume,
+            volume_limit=volume_limit
+        )
+        self.load_plan(plan, verbose=verbose)
+
+
+    def load_plan(self, plan, verbose:bool=False):
+        """ Load a dispensing plan compiled on the control PC (see `plan.compile_plan`) and set
+        `self.formulations` and `self.dispensing_queue` from it. No csv is read on the robot.
+
+        Parameters
+        ----------
+        plan : str or DispensingPlan
+            The plan or the path to its json file.
+        verbose : bool, optional
+            If True, print the queue. The default is False.
+
+        Raises
+        ------
+        ValueError
+            If a source of known volume does not hold enough liquid for the plan.
+        """
+        if isinstance(plan, str):
+            plan = DispensingPlan.load(plan)
+        plan.validate()
+        self.plan = plan
+        self.chemical_names = plan.chemical_names
+        self.formulations = plan.formulations()
         # Update the target locations that will have been dispensed
-        self._target_locations_dispensed = self._target_locations[: len(self.formulations)]
-        self.dispensing_queue = _dispensing_queue
+        self._target_locations_dispensed = list(plan.targets)
+        self.dispensing_queue = plan.queue()
+        # Plan the cover moves on a copy of the cover deck, which is updated as the covers move
+        if self.cover_deck is not None:
+            deck = CoverDeck(self.cover_deck.deck_slot, self.cover_deck.stacks, self.cover_deck.uncovered)
+            self.cover_moves = plan_cover_moves(plan.covers, deck, self._cover_positions)
+        # Stop before the run if a source will run dry, and warn about the ones which will be low
+        if self.inventory is not None:
+            needs = {}
+            for source, volume in zip(plan.source, plan.volume):
+                location = plan.sources[source]
+                needs[location] = needs.get(location, 0) + volume
+            warnings = self.inventory.check(needs)
+            dry = [
+                location for location, volume in needs.items()
+                if self.inventory.volume(location) is not None and volume > self.inventory.available(location)
+            ]
+            if dry:
+                raise ValueError("\n".join(warnings))
+            for warning in warnings:
+                print(f"Warning: {warning}")
 
         if verbose:
             for sub_queue in self.dispensing_queue:
@@ -379,14 +496,18 @@ class OT2(Robot):
                 for queue in sub_queue:
                     print(queue)
 
-    def _block_to_location(self, block, status=None):
+    @property
+    def cover_deck_status(self):
+        """The number of covers on each stack of the cover deck."""
+        return self.cover_deck.stacks if self.cover_deck else [0, 0]
+
+    def _block_to_location(self, block):
         """Get the average location of the block.
         Parameters
         ----------
         block : tuple(int, int)
-            The block name. The definition is (plate_index, 0 or 1), where 0 and 1 are the left and right block of the plate.
-        status : list[int, int], optional
-            The status of the cover deck. The default is None.
+            The block name. The definition is (plate_index, k), where k is the index of the block on the plate
+            (see `layout.cover_blocks`). On the cover deck, k is 0 or 1 for the left and right stack.
         
         Returns
         -------
@@ -394,70 +515,62 @@ class OT2(Robot):
             The location of the block.
         """
         n, side = block
-        # If it involves the cover deck, update the status and adjust the height where the pipette moves to.
-        if status:
-            if side == 0:
-                loc = self.cover_deck_0.top().move(types.Point(x=0, y=0, z=status[0]*self.cover_thickness))
-            elif side == 1:
-                loc = self.cover_deck_1.top().move(types.Point(x=0, y=0, z=status[1]*self.cover_thickness))
-            else:
+        # If it involves the cover deck, adjust the height to the top of the stack.
+        if n == self.cover_deck_plate_index:
+            if side not in (0, 1):
                 raise ValueError("The block name is not valid.")
+            well = self.cover_deck_0 if side == 0 else self.cover_deck_1
+            loc = well.top().move(types.Point(x=0, y=0, z=self.cover_deck_status[side]*self.cover_thickness))
         else:
-            if side == 0:
-                loc = self.lot[n]["A1"].top().move(self.cover_offset)
-            elif side == 1:
-                loc = self.lot[n]["A3"].top().move(self.cover_offset)
-            else:
+            if block not in self._cover_offsets:
                 raise ValueError("The block name is not valid.")
+            well, offset = self._cover_offsets[block]
+            loc = self.lot[n][well].top().move(offset)
         
         return loc
 
 
+    @traced("move_cover", "from_block", "to_block")
     def move_cover(self, from_block, to_block, verbose=False):
-        """Move the pipette to cover the source vials.
+        """Move one cover. The move is checked against the state of the covers (see `covers.CoverDeck`)
+        before the arm moves.
         Parameters
         ----------
         from_block : tuple(int, int)
-            The source block name. The definition is (plate_index, 0 or 1), where 0 and 1 are the left and right block of the plate.
+            The source block name, (plate_index, k), or "deck" for the closest loaded stack. See `_block_to_location`.
         to_block : tuple(int, int)
-            The target block name. The definition is the same as `from_block`.
+            The target block name, (plate_index, k), or "deck" for the closest stack.
         verbose : bool, optional
             If True, print the movement. The default is False.
+
+        Raises
+        ------
+        ValueError
+            If there is no cover at `from_block` or `to_block` is already covered.
         """
         if self._has_tip: # make sure the tip is dropped before moving the cover
             self.drop_tip()
 
-        status = self.cover_deck_status # get the status of the cover deck
-        
-        # always pick cover from higher side and put cover to lower side
-        assert from_block != to_block, "The source and target blocks are the same."
-        
-        # translate the blocks to locations
+        deck = self.cover_deck
         if from_block == "deck":
-            from_block = (self.cover_deck_plate_index, np.argmax(status)) 
-            from_location = self._block_to_location(from_block, status=status)
-            status[from_block[1]] -= 1 
-        else:
-            from_location = self._block_to_location(from_block)
+            from_block = deck.nearest_stack(to_block, self._cover_positions, loaded=True)
         if to_block == "deck":
-            to_block = (self.cover_deck_plate_index, np.argmin(status))
-            to_location = self._block_to_location(to_block, status=status)
-            status[to_block[1]] += 1   
-        else:
-            to_location = self._block_to_location(to_block)
-        assert min(status) >= 0, "Cover deck is empty."
+            to_block = deck.nearest_stack(from_block, self._cover_positions)
+        deck.check_move(from_block, to_block)
+        from_location = self._block_to_location(from_block)
+        to_location = self._block_to_location(to_block)
+        deck.move(from_block, to_block)
 
         # move the cover around
         self.pip_arm.move_to(from_location)
-        ot2.pip_arm.pick_up_tip(from_location)
+        self.pip_arm.pick_up_tip(from_location)
         self.pip_arm.move_to(to_location)
-        ot2.pip_arm.drop_tip(to_location)
+        self.pip_arm.drop_tip(to_location)
         if verbose:
-            print(f"Cover from {from_block} to {to_block} moved. Deck status: {status}")
-        
-        self.cover_deck_status = status # update the status of the cover deck
+            print(f"Cover from {from_block} to {to_block} moved. Deck status: {deck.stacks}")
 
 
+    @traced("rinse", "n")
     def rinse_cond_arm(self, n:int=None):
         """ Rinse the conductivity meter arm. After measuring conductivity for one solution, the
         conductivity meter arm will move to the plate with four water wells. The conductivity meter
@@ -482,17 +595,23 @@ class OT2(Robot):
                 self.cond_arm.move_to(self.adjust(well.bottom(48.4)))
                 self.cond_arm.move_to(self.adjust(well.bottom(75)))
             self.sleep(3)
+        self.reset_speed('x') # only the rinse is slow, not the travel to the sponge
                 
         print("Conductivity meter arm rinsed.")
 
 
-    def dry_cond_arm(self, n:int=None):
-        """ Dry the conductivity meter arm. After rinsing itself in the four solvent wells, the arm will move to the sponge deck position. It will then trigger the blow dryer and move slowly up and down to dry the probe evenly.
+    @traced("dry")
+    def dry_cond_arm(self, n:int=None, wait:bool=True):
+        """ Dry the conductivity meter arm. After rinsing itself in the four solvent wells, the arm will move to the sponge deck position. It will then start the blow dryer and move slowly up and down to dry the probe evenly.
+        The pump runs for `self._dry_time` seconds and stops by itself, so the passes overlap with the pump run instead of waiting for it.
+        On a legacy channel the Pi runs the pump for its own fixed time, so the probe keeps the fixed dwell of the legacy protocol.
         
         Paramters
         ---------
         n : int
             The index of the sponge deck.
+        wait : bool, optional
+            If True, keep the probe in the dryer until the pump stops. The default is True.
         """
         if not n:
             n = self.config["Robots"]["OT2"]["sponge_deck"][0]
@@ -501,16 +620,30 @@ class OT2(Robot):
         self.cond_arm.move_to(self.adjust(deck.top(55.5)))
         self.cond_arm.move_to(self.adjust(deck.top(15.5)))
         self.cond_arm.move_to(self.adjust(deck.top(93)))
-        raspi_comm.trigger_pump()
+        legacy = self.pump.channel.legacy # the pump run is not acknowledged nor timed by the protocol
+        self.pump.start(self._dry_time) # returns immediately, see `raspi_comm.PumpController`
         self.protocol.max_speeds['z'] = 14
-        self.sleep(3.5)
+        if legacy:
+            self.sleep(3.5)
         self.cond_arm.move_to(self.adjust(deck.top(102)))
         self.cond_arm.move_to(self.adjust(deck.top(74)))
         self.cond_arm.move_to(self.adjust(deck.top(93)))
-        self.sleep(3)
-        self.protocol.max_speeds['z'] = None
+        if legacy:
+            self.sleep(3)
+        self.reset_speed('z')
+        if wait and not legacy:
+            self.sleep(self.pump.remaining())
         self.cond_arm.move_to(self.adjust(deck.top(15.5)))
-        self.sleep(1)
+        if legacy:
+            self.sleep(1)
+
+
+    def reset_speed(self, axis:str) -> None:
+        """Set the maximum speed of an axis back to its configured value, or to the default."""
+        if axis in self.max_speeds:
+            self.protocol.max_speeds[axis] = self.max_speeds[axis]
+        else:
+            self.protocol.max_speeds.pop(axis, None)
 
 
     def adjust(self, location):
@@ -530,6 +663,32 @@ class OT2(Robot):
         return location.move(types.Point(x=x_off, y=y_off, z=z_off))
 
 
+    @traced("measure", well=lambda a: a["formulation"]["location"])
+    def measure_formulation(self, cond_meter:ConductivityMeter, formulation:dict, rinse:int=None):
+        """ Measure the conductivity of one formulation, then rinse and dry the conductivity meter arm.
+        Parameters
+        ----------
+        cond_meter : ConductivityMeter
+            The conductivity meter object.
+        formulation : dict
+            The formulation, one of `self.formulations`.
+        rinse : int, optional
+            The plate of water wells to rinse the arm in. The default is the first one.
+        """
+        n, i = formulation["location"]
+        row = self.formulations.index(formulation) # the row of the formulation file
+        well = self.lot[n][i]
+        self.cond_arm.move_to(self.adjust(well.top(50)))
+        self.cond_arm.move_to(self.adjust(well.bottom(49)))
+        self.sleep(1)
+        with self.tracer.span("read"):
+            cond_meter.read_cond(uid=formulation["unique_id"], append=True, row=row)
+        self.cond_arm.move_to(self.adjust(well.top(50)))
+        print(f"Conductivity measured: {(n, i)}!")
+        self.rinse_cond_arm(rinse) # Rinse the arm
+        self.dry_cond_arm() # Dry the arm
+
+
     def measure_conductivity(self, cond_meter:ConductivityMeter):
         """ Measure conductivity of the plate. `adjust` the location of the well for the conductivity meter arm.
         Parameters
@@ -538,18 +697,140 @@ class OT2(Robot):
             The conductivity meter object.
         """
 
-        # Measure conductivity for each formulation
-        for _, row in self.formulations.iterrows():
-            n, i = row["location"]
-            well = self.lot[n][i]
-            self.cond_arm.move_to(self.adjust(well.top(50)))
-            self.cond_arm.move_to(self.adjust(well.bottom(49)))
-            self.sleep(1)
-            cond_meter.read_cond(uid=row["unique_id"], append=True)
-            self.cond_arm.move_to(self.adjust(well.top(50)))
-            print(f"Conductivity measured: {(n, i)}!")
-            self.rinse_cond_arm() # Rinse the arm
-            self.dry_cond_arm() # Dry the arm
+        # Measure conductivity for each formulation, in the order of the shortest route
+        order, rinses, travel_time = self.measurement_route()
+        print(f"Predicted travel time of the conductivity meter arm: {travel_time:.0f} s")
+        for j, n in zip(order, rinses):
+            self.measure_formulation(cond_meter, self.formulations[j], rinse=n)
+
+
+    def measurement_route(self, formulations:list=None, start:tuple=None) -> tuple:
+        """ Plan the route of the conductivity meter arm through the formulations, see `route.plan_route`.
+        Every plate listed under "water_wells" is a rinse station, rinsed in from A1 to A4, and the
+        arm is dried on the "A4" position of the sponge deck.
+
+        Parameters
+        ----------
+        formulations : list[dict], optional
+            The formulations to measure. The default is `self.formulations`.
+        start : tuple, optional
+            The (x, y) position of the arm before the first formulation. The default is the fixed
+            trash, where the pipette dropped its last tip.
+
+        Returns
+        -------
+        order : list[int]
+            The indices of `formulations` in the order of measurement.
+        rinses : list[int]
+            The plate of water wells to rinse the arm in after each formulation of `order`.
+        travel_time : float
+            The predicted travel time of the arm in seconds.
+        """
+        if formulations is None:
+            formulations = self.formulations
+        config = self.config["Robots"]["OT2"]
+        definitions = {}
+        def position(n, well):
+            if n not in definitions:
+                definitions[n] = load_definition(config["labwares"][str(n)])
+            return well_position(n, well, definitions[n])
+
+        wells = [tuple(f["location"]) for f in formulations]
+        positions = {well: position(*well) for well in wells}
+        rinses = [(position(n, "A1"), position(n, "A4")) for n in config["water_wells"]]
+        sponge = position(config["sponge_deck"][0], "A4")
+        if start is None:
+            start = slot_center(TRASH_SLOT)
+        order, stations, travel_time = plan_route(wells, positions, rinses, sponge, self.motion, start)
+        return order, [config["water_wells"][k] for k in stations], travel_time
+
+
+    def schedule(self, interleave:bool=True, move_covers:bool=False) -> list:
+        """ Order the operations of both arms for the loaded plan. With `interleave`, each formulation is
+        measured right after the block that completes it, instead of after all the dispensing.
+
+        Both arms are on the same gantry, so their moves cannot overlap in time: interleaving makes the
+        results available earlier, while the total time stays the same. The conductivity meter arm only
+        goes to a formulation that receives no more chemical and only while the pipette holds no tip.
+        The formulations measured together are ordered by `measurement_route` when the "water_wells"
+        and the "sponge_deck" are configured, in the order of the plan otherwise.
+
+        Parameters
+        ----------
+        interleave : bool, optional
+            If False, measure all the formulations after dispensing. The default is True.
+        move_covers : bool, optional
+            If True, include the cover moves of `self.cover_moves`. The default is False.
+
+        Returns
+        -------
+        steps : list[tuple(str, object)]
+            ("cover", (from_block, to_block)), ("dispense", [source, target, volume, speed_factor]) or
+            ("measure", [formulation, rinse]). A dispensing action with a `None` source drops the tip, a
+            `None` rinse uses the first plate of water wells.
+        """
+        assert self.plan is not None, "Call 'ot2.load_plan()' first"
+        plan = self.plan
+        config = self.config.get("Robots", {}).get("OT2", {}) if self.config else {}
+        routed = bool(config.get("water_wells") and config.get("sponge_deck"))
+        def measure(formulations):
+            if not routed or not formulations:
+                return [("measure", [f, None]) for f in formulations]
+            order, rinses, _ = self.measurement_route(formulations)
+            return [("measure", [formulations[j], n]) for j, n in zip(order, rinses)]
+
+        void = [(None, None), (None, None), 0, 1]
+        # the last block dispensing into each formulation, -1 if none
+        last_block = [-1] * len(plan.targets)
+        for b in range(plan.n_blocks):
+            for k in range(plan.block_starts[b], plan.block_starts[b + 1]):
+                last_block[plan.target[k]] = b
+        measure_after = last_block if interleave else [plan.n_blocks] * len(plan.targets)
+
+        steps = measure([f for j, f in enumerate(self.formulations) if measure_after[j] < 0])
+        has_tip = False
+        for b in range(plan.n_blocks + 1):
+            if move_covers and self.cover_moves:
+                steps.extend(("cover", move) for move in self.cover_moves[b])
+            if b < plan.n_blocks:
+                steps.extend(("dispense", list(action)) for action in plan.actions(b))
+                has_tip = True
+            measured = [f for j, f in enumerate(self.formulations) if measure_after[j] == b]
+            if has_tip and (measured or b == plan.n_blocks):
+                steps.append(("dispense", void)) # drop the tip before the other arm moves
+                has_tip = False
+            steps.extend(measure(measured))
+        return steps
+
+
+    def run_schedule(self, cond_meter:ConductivityMeter, interleave:bool=True, move_covers:bool=False, verbose:bool=False):
+        """ Dispense the loaded plan and measure the formulations in the order of `schedule`.
+        Parameters
+        ----------
+        cond_meter : ConductivityMeter
+            The conductivity meter object.
+        interleave, move_covers : bool, optional
+            See `schedule`.
+        verbose : bool, optional
+            If True, print the actions. The default is False.
+        """
+        for operation, argument in self.schedule(interleave=interleave, move_covers=move_covers):
+            if operation == "cover":
+                self.move_cover(*argument, verbose=verbose)
+            elif operation == "dispense":
+                self.dispense_chemical(*argument, verbose=verbose)
+            else:
+                self.measure_formulation(cond_meter, *argument)
+        print("Dispensing and measurement finished...")
+
+
+    def trace_summary(self) -> str:
+        """ Summarize the time spent per phase, per chemical and per well of the recorded actions,
+        see `telemetry.summarize`."""
+        chemicals = None
+        if self.plan is not None:
+            chemicals = dict(zip(self.plan.sources, self.plan.chemical_names))
+        return format_summary(summarize(self.tracer.spans, chemicals))
         
     
 if __name__ == "__main__":
@@ -0,0 +1,490 @@
+import sys
+import json
+import hashlib
+import os
+sys.path.append("./")
+# The plan is compiled on the control PC and executed on the OT2 computer, so loading and running a
+# plan only needs the standard library. numpy is imported when a plan is built.
+try:
+    from robots import read_csv_records
+    from layout import config_layout, config_capacities
+    from inventory import saved_volumes
+except ModuleNotFoundError:
+    from auto.robots import read_csv_records
+    from auto.layout import config_layout, config_capacities
+    from auto.inventory import saved_volumes
+
+PLAN_VERSION = 2
+ACTION_DTYPE = [ # the fields of one dispensing action, see `dispensing_actions`
+    ("source", "i4"), ("target", "i4"), ("volume", "f8"), ("liquid_class", "i1"), ("block", "i4")
+]
+LIQUID_CLASSES = [ # the speed factor of the pipette for each class of liquid
+    {"name": "default", "speed_factor": 1},
+    {"name": "viscous", "speed_factor": 0.5},
+]
+
+
+def file_digest(path:str) -> str:
+    """Return a short sha256 digest of a file."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def config_digest(config:dict) -> str:
+    """Return a short sha256 digest of the OT2 section of a configuration."""
+    text = json.dumps(config["Robots"]["OT2"], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+class DispensingPlan():
+    """A compiled list of dispensing actions that `OT2` executes without any preprocessing.
+
+    The actions are stored as flat arrays of equal length: `source` and `target` are indices into
+    `sources` and `targets`, `volume` is in uL and `liquid_class` is an index into
+    `liquid_classes`. Actions `block_starts[b]` to `block_starts[b+1]` form block `b`, a
+    continuous run of dispensing between two cover moves, from the sources under cover
+    `covers[b]` = [slot, block index] (see `layout.cover_blocks`).
+    """
+    def __init__(
+            self,
+            chemical_names:list=None,
+            sources:list=None,
+            unique_ids:list=None,
+            targets:list=None,
+            source:list=None,
+            target:list=None,
+            volume:list=None,
+            liquid_class:list=None,
+            block_starts:list=None,
+            covers:list=None,
+            liquid_classes:list=None,
+            pip_max_volume:float=1000,
+            inputs:dict=None,
+            version:int=PLAN_VERSION
+        ):
+        self.version = version
+        self.chemical_names = list(chemical_names or [])
+        self.sources = [tuple(s) for s in sources or []] # one source location per chemical
+        self.unique_ids = list(unique_ids or [])
+        self.targets = [tuple(t) for t in targets or []] # one target location per formulation
+        self.source = list(source or [])
+        self.target = list(target or [])
+        self.volume = list(volume or [])
+        self.liquid_class = list(liquid_class or [])
+        self.block_starts = list(block_starts or [0])
+        self.covers = [tuple(c) for c in covers or []] # the cover over the sources of each block
+        self.liquid_classes = list(liquid_classes or LIQUID_CLASSES)
+        self.pip_max_volume = pip_max_volume
+        self.inputs = dict(inputs or {}) # digests of the files the plan is compiled from
+
+    def __len__(self):
+        return len(self.volume)
+
+    @property
+    def n_blocks(self):
+        return len(self.block_starts) - 1
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "inputs": self.inputs,
+            "pip_max_volume": self.pip_max_volume,
+            "liquid_classes": self.liquid_classes,
+            "chemical_names": self.chemical_names,
+            "sources": [list(s) for s in self.sources],
+            "unique_ids": self.unique_ids,
+            "targets": [list(t) for t in self.targets],
+            "block_starts": self.block_starts,
+            "covers": [list(c) for c in self.covers],
+            "source": self.source,
+            "target": self.target,
+            "volume": self.volume,
+            "liquid_class": self.liquid_class,
+        }
+
+    @classmethod
+    def from_dict(cls, d:dict):
+        return cls(**d)
+
+    def save(self, path:str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    @classmethod
+    def load(cls, path:str):
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+    def validate(self) -> None:
+        """Check that the plan is consistent and executable.
+
+        Raises
+        ------
+        ValueError
+            Listing every problem found in the plan.
+        """
+        errors = []
+        if self.version != PLAN_VERSION:
+            errors.append(f"Plan version {self.version} is not supported (expected {PLAN_VERSION}).")
+        if len(self.chemical_names) != len(self.sources):
+            errors.append("Each chemical must have exactly one source.")
+        if len(self.unique_ids) != len(self.targets):
+            errors.append("Each formulation must have exactly one target.")
+        if len(set(self.targets)) != len(self.targets):
+            errors.append("Two formulations share the same target location.")
+        if set(self.sources) & set(self.targets):
+            errors.append("A location is used both as source and target.")
+        n = len(self.volume)
+        if not len(self.source) == len(self.target) == len(self.liquid_class) == n:
+            errors.append("The action arrays do not have the same length.")
+        if any(not 0 <= i < len(self.sources) for i in self.source):
+            errors.append("Source index out of range.")
+        if any(not 0 <= j < len(self.targets) for j in self.target):
+            errors.append("Target index out of range.")
+        if any(not 0 <= c < len(self.liquid_classes) for c in self.liquid_class):
+            errors.append("Liquid class index out of range.")
+        if any(not 0 < v <= self.pip_max_volume for v in self.volume):
+            errors.append(f"Volumes must be positive and at most {self.pip_max_volume} uL.")
+        starts = self.block_starts
+        if not starts or starts[0] != 0 or starts[-1] != n or any(a > b for a, b in zip(starts, starts[1:])):
+            errors.append("Block boundaries must increase from 0 to the number of actions.")
+        if len(self.covers) != self.n_blocks:
+            errors.append("Each block must have exactly one cover.")
+        if errors:
+            raise ValueError("Invalid dispensing plan:\n" + "\n".join(errors))
+
+    def actions(self, block:int=None):
+        """Yield (source, target, volume, speed_factor) of every action, or of one block."""
+        start, end = (0, len(self)) if block is None else self.block_starts[block: block + 2]
+        for k in range(start, end):
+            yield (
+                self.sources[self.source[k]],
+                self.targets[self.target[k]],
+                self.volume[k],
+                self.liquid_classes[self.liquid_class[k]]["speed_factor"]
+            )
+
+    def queue(self) -> list:
+        """Return the plan in the format of `OT2.dispensing_queue`: a list of blocks, each a list of
+        [source, target, volume, speed_factor], followed by a void block marking the end.
+        """
+        queue = [[list(action) for action in self.actions(b)] for b in range(self.n_blocks)]
+        queue.append([[(None, None), (None, None), 0, 1]])
+        return queue
+
+    def formulations(self) -> list:
+        """Return the formulations in the format of `OT2.formulations`, the volume of each
+        chemical summed over its actions.
+        """
+        formulations = [
+            dict(unique_id=uid, location=location, **{name: 0 for name in self.chemical_names})
+            for uid, location in zip(self.unique_ids, self.targets)
+        ]
+        for i, j, v in zip(self.source, self.target, self.volume):
+            formulations[j][self.chemical_names[i]] += v
+        return formulations
+
+
+def dispensing_actions(volumes, pip_max_volume:float=1000, liquid_classes=None, blocks=None,
+                       min_volume:float=0, resolution:float=None):
+    """Compute all the dispensing actions of a volume matrix at once.
+
+    Parameters
+    ----------
+    volumes : array_like
+        Shape (F, C), the volume (uL) of chemical `i` in formulation `j` is `volumes[j, i]`.
+    pip_max_volume : float
+        The maximum volume of the pipette in uL. Larger volumes are split into
+        `ceil(volume / pip_max_volume)` actions, all full but the last one.
+    min_volume : float, optional
+        The minimum volume of the pipette in uL. If the last action of a split volume is smaller,
+        it is merged with the previous one and the two are split evenly.
+    resolution : float, optional
+        The smallest volume step of the pipette in uL. The first half of a merged pair is rounded
+        down to it and the second one takes the rest, so both stay on the grid of the volumes.
+    liquid_classes : array_like, optional
+        Shape (C,), the liquid class of each chemical. The default is 0 for all.
+    blocks : array_like, optional
+        Shape (C,), the block of each chemical, non-decreasing. The default is 0 for all.
+
+    Returns
+    -------
+    actions : numpy.ndarray
+        A structured array of dtype `ACTION_DTYPE`, ordered by chemical, then formulation.
+    """
+    import numpy as np
+    volumes = np.atleast_2d(np.asarray(volumes, dtype=float))
+    n_chemicals = volumes.shape[1]
+    if liquid_classes is None:
+        liquid_classes = np.zeros(n_chemicals, dtype="i1")
+    if blocks is None:
+        blocks = np.zeros(n_chemicals, dtype="i4")
+    pairs = np.where(volumes.T > 0, volumes.T, 0).ravel() # chemical-major (chemical, formulation) pairs
+    counts = np.ceil(pairs / pip_max_volume).astype(int) # number of actions of each pair
+    pair_index = np.repeat(np.arange(pairs.size), counts)
+    # position of each action within its pair: 0, 1, ..., counts - 1
+    chunk = np.arange(pair_index.size) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    actions = np.empty(pair_index.size, dtype=ACTION_DTYPE)
+    actions["source"], actions["target"] = np.divmod(pair_index, volumes.shape[0])
+    actions["volume"] = np.minimum(pip_max_volume, pairs[pair_index] - chunk * pip_max_volume)
+    if min_volume > 0: # share the last two actions of a pair if the last one is too small
+        last = np.flatnonzero((chunk > 0) & (chunk == counts[pair_index] - 1) & (actions["volume"] < min_volume))
+        total = pip_max_volume + actions["volume"][last]
+        half = total / 2
+        if resolution:
+            half = np.floor(half / resolution + 1e-9) * resolution
+        actions["volume"][last - 1], actions["volume"][last] = half, total - half
+    actions["liquid_class"] = np.asarray(liquid_classes)[actions["source"]]
+    actions["block"] = np.asarray(blocks)[actions["source"]]
+    return actions
+
+
+def quantize_volumes(volumes, resolution:float=None, min_volume:float=0) -> tuple:
+    """Round a volume matrix to the resolution of the pipette and drop the volumes it cannot
+    dispense.
+
+    Parameters
+    ----------
+    volumes : array_like
+        Shape (F, C), the volume (uL) of chemical `i` in formulation `j` is `volumes[j, i]`.
+    resolution : float, optional
+        The smallest volume step of the pipette in uL. None to not round.
+    min_volume : float, optional
+        The minimum volume of the pipette in uL. Smaller positive volumes are dropped.
+
+    Returns
+    -------
+    volumes : numpy.ndarray
+        The quantized volumes.
+    dropped : numpy.ndarray
+        Shape (D, 2), the (formulation, chemical) indices of the dropped volumes.
+    """
+    import numpy as np
+    volumes = np.asarray(volumes, dtype=float)
+    if resolution:
+        volumes = np.round(volumes / resolution) * resolution
+    small = (volumes > 0) & (volumes < min_volume)
+    return np.where(small, 0.0, volumes), np.argwhere(small)
+
+
+def check_feasibility(volumes, chemical_names:list, unique_ids:list, capacities:list=None,
+                      stocks:list=None, volume_limit:float=None) -> list:
+    """Check a whole batch at once against the wells and stocks of the deck.
+
+    Parameters
+    ----------
+    volumes : array_like
+        Shape (F, C), the volume (uL) of chemical `i` in formulation `j` is `volumes[j, i]`.
+    chemical_names, unique_ids : list
+        The names of the columns and rows of `volumes`, for the report.
+    capacities : list[float], optional
+        The capacity (uL) of the target well of each formulation.
+    stocks : list[float], optional
+        The volume (uL) available in the source well of each chemical.
+    volume_limit : float, optional
+        The maximum total volume of one chemical in uL.
+
+    Returns
+    -------
+    errors : list[str]
+        One message per overfilled target or depleted source, empty if the batch is feasible.
+    """
+    import numpy as np
+    volumes = np.asarray(volumes, dtype=float).reshape(len(unique_ids), len(chemical_names))
+    errors = []
+    totals = volumes.sum(axis=1)
+    if capacities is not None:
+        capacities = np.asarray(capacities[: len(unique_ids)], dtype=float)
+        for j in np.flatnonzero(totals > capacities):
+            errors.append(
+                f"Formulation {unique_ids[j]} needs {totals[j]:g} uL but its well holds {capacities[j]:g} uL."
+            )
+    used = volumes.sum(axis=0)
+    available = np.full(len(chemical_names), np.inf)
+    if stocks is not None:
+        available = np.minimum(available, np.asarray(stocks[: len(chemical_names)], dtype=float))
+    if volume_limit is not None:
+        available = np.minimum(available, volume_limit)
+    for i in np.flatnonzero(used > available):
+        errors.append(f"Volume of {chemical_names[i]} ({used[i]:g} uL) exceeds {available[i]:g} uL.")
+    return errors
+
+
+def build_plan(
+        formulations:list,
+        chemical_names:list,
+        sources:list,
+        targets:list,
+        blocks:list=None,
+        viscous:list=(),
+        pip_max_volume:float=1000,
+        volume_limit:float=40000,
+        resolution:float=None,
+        min_volume:float=0,
+        capacities:list=None,
+        stocks:list=None
+    ) -> DispensingPlan:
+    """Build the dispensing plan of the given formulations. Chemical `i` is taken from
+    `sources[i]` and formulation `j` is made in `targets[j]`, over as many plates as the
+    locations span. The volumes are quantized to the pipette (see `quantize_volumes`) and the
+    whole batch is checked (see `check_feasibility`) before any action is built. Volumes larger
+    than `pip_max_volume` are split into several actions and the chemicals under the same cover
+    form a block.
+
+    Parameters
+    ----------
+    formulations : list[dict]
+        One dictionary per formulation with its "unique_id" and the volume (uL) of each chemical.
+    chemical_names : list[str]
+        The chemicals to dispense, in the order of `sources`.
+    sources, targets : list[tuple(int, str)]
+        The available source and target locations, see `layout.plate_layout`.
+    blocks : list[tuple(int, int)], optional
+        The cover block of each source location, see `layout.plate_layout`. The default is a
+        single block.
+    viscous : list[tuple(int, str)]
+        The source locations holding viscous chemicals.
+    pip_max_volume : float
+        The maximum volume of the pipette in uL.
+    volume_limit : float
+        The maximum total volume of one chemical in uL.
+    resolution, min_volume : float, optional
+        The volume step and the minimum volume of the pipette in uL.
+    capacities : list[float], optional
+        The capacity (uL) of each target location.
+    stocks : list[float], optional
+        The volume (uL) available in each source location.
+
+    Raises
+    ------
+    ValueError
+        If there are more chemicals or formulations than locations, or if the batch overfills a
+        target or depletes a source, with one line per problem.
+    """
+    import numpy as np
+    if len(chemical_names) > len(sources):
+        raise ValueError(f"{len(chemical_names)} chemicals but only {len(sources)} source locations.")
+    if len(formulations) > len(targets):
+        raise ValueError(f"{len(formulations)} formulations but only {len(targets)} target locations.")
+    volumes = np.array(
+        [[f[name] or 0 for name in chemical_names] for f in formulations], dtype=float
+    ).reshape(len(formulations), len(chemical_names))
+    unique_ids = [f["unique_id"] for f in formulations]
+    volumes, dropped = quantize_volumes(volumes, resolution, min_volume)
+    for j, i in dropped:
+        print(f"Dropped {chemical_names[i]} from formulation {unique_ids[j]}: below {min_volume:g} uL.")
+    errors = check_feasibility(volumes, chemical_names, unique_ids, capacities, stocks, volume_limit)
+    if errors:
+        raise ValueError("Infeasible plan:\n" + "\n".join(errors))
+    viscous = [tuple(v) for v in viscous]
+    covers = [tuple(b) for b in blocks[: len(chemical_names)]] if blocks else [(0, 0)] * len(chemical_names)
+    block_index = {} # number the covers of the chemicals in order of appearance
+    actions = dispensing_actions(
+        volumes,
+        pip_max_volume=pip_max_volume,
+        liquid_classes=[1 if tuple(s) in viscous else 0 for s in sources[: len(chemical_names)]],
+        blocks=[block_index.setdefault(c, len(block_index)) for c in covers],
+        min_volume=min_volume,
+        resolution=resolution
+    )
+    # A block starts where the block number changes, empty blocks do not appear
+    block_starts = [0] + (np.flatnonzero(np.diff(actions["block"])) + 1).tolist() if len(actions) else []
+    return DispensingPlan(
+        chemical_names=chemical_names,
+        sources=sources[: len(chemical_names)],
+        unique_ids=unique_ids,
+        targets=targets[: len(formulations)],
+        source=actions["source"].tolist(),
+        target=actions["target"].tolist(),
+        volume=actions["volume"].tolist(),
+        liquid_class=actions["liquid_class"].tolist(),
+        block_starts=block_starts + [len(actions)],
+        covers=[covers[actions["source"][k]] for k in block_starts],
+        pip_max_volume=pip_max_volume
+    )
+
+
+def compile_plan(
+        formula_input_path:str,
+        config:dict,
+        volume_limit:float=40000,
+        output_path:str=None,
+        labware_dir:str=None
+    ) -> DispensingPlan:
+    """Compile "experiment.csv" and "config.json" into a validated dispensing plan. This runs on
+    the control PC so that the OT2 only has to load the plan.
+
+    Parameters
+    ----------
+    formula_input_path : str
+        The path to the csv file containing the formulations.
+    config : dict
+        The configuration, with the layout of the OT2 in `config["Robots"]["OT2"]`.
+    volume_limit : float, optional
+        The maximum total volume of one chemical in uL.
+    output_path : str, optional
+        If given, save the plan there. If a plan compiled from the same inputs (the formulations,
+        the OT2 configuration, the custom labware files and the inventory file) is already there,
+        it is loaded instead of compiled again.
+    labware_dir : str, optional
+        The directory of the custom labware files. The default is the directory of
+        `formula_input_path`, i.e. the experiment folder.
+
+    The pipette section of the configuration may set the "resolution" and "min_volume" (uL) of
+    the pipette. Each formulation must fit in its target well and each source must hold its
+    chemical, see `build_plan`. The volume of a source is the one saved in the "file" of the
+    inventory section (see `inventory.StockInventory`) if the file is in `labware_dir`, else a
+    full well is assumed, less the "dead_volume" of the inventory section.
+
+    Returns
+    -------
+    plan : DispensingPlan
+    """
+    ot2_config = config["Robots"]["OT2"]
+    if labware_dir is None:
+        labware_dir = os.path.dirname(formula_input_path)
+    inventory_path = os.path.join(labware_dir, ot2_config.get("inventory", {}).get("file") or "")
+    # the plan also depends on the custom labware files and on the stock volumes left
+    inputs = {"experiment": file_digest(formula_input_path), "config": config_digest(config)}
+    for name in sorted(set(ot2_config["labwares"].values())):
+        if name.endswith(".json") and os.path.isfile(os.path.join(labware_dir, name)):
+            inputs[name] = file_digest(os.path.join(labware_dir, name))
+    if os.path.isfile(inventory_path):
+        inputs["inventory"] = file_digest(inventory_path)
+    if output_path is not None and os.path.isfile(output_path):
+        plan = DispensingPlan.load(output_path)
+        if plan.inputs == inputs and plan.version == PLAN_VERSION:
+            plan.validate()
+            return plan
+
+    sources, blocks = config_layout(ot2_config, "chemical_wells", labware_dir)
+    targets, _ = config_layout(ot2_config, "formula_wells", labware_dir)
+    columns, formulations = read_csv_records(formula_input_path)
+    pipettes = ot2_config["pipettes"]
+    stocks = config_capacities(ot2_config, "chemical_wells", labware_dir)
+    if os.path.isfile(inventory_path):
+        saved = saved_volumes(inventory_path, sources)
+        stocks = [stock if volume is None else volume for stock, volume in zip(stocks, saved)]
+    # the dead volume of a well cannot be aspirated
+    dead_volume = ot2_config.get("inventory", {}).get("dead_volume", 0)
+    stocks = [max(stock - dead_volume, 0) for stock in stocks]
+    plan = build_plan(
+        formulations,
+        chemical_names=[c for c in columns if "Chemical" in c],
+        sources=sources,
+        targets=targets,
+        blocks=blocks,
+        viscous=ot2_config.get("viscous", []),
+        pip_max_volume=pipettes.get("max_volume", 1000),
+        volume_limit=volume_limit,
+        resolution=pipettes.get("resolution"),
+        min_volume=pipettes.get("min_volume", 0),
+        capacities=config_capacities(ot2_config, "formula_wells", labware_dir),
+        stocks=stocks
+    )
+    plan.inputs = inputs
+    plan.validate()
+    if output_path is not None:
+        plan.save(output_path)
+    return plan
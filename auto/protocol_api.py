@@ -1,8 +1,43 @@
 ### A dummy protocol api for the testing purpose ###
+# It keeps a simulated clock: `delay` advances it by the given time and every move of an
+# instrument by `move_time` seconds, so that protocols can be timed without a robot.
+from collections import namedtuple
+
+
+class types():
+    Point = namedtuple("Point", ["x", "y", "z"])
+
+
+class Location():
+    def __init__(self, name="", point=types.Point(0, 0, 0)):
+        self.name = name
+        self.point = point
+    def top(self, z=0): return Location(self.name, types.Point(0, 0, z))
+    def bottom(self, z=0): return Location(self.name, types.Point(0, 0, z))
+    def move(self, point): return Location(self.name, point)
+
+
+class Labware(dict):
+    def __missing__(self, well): return Location(well)
+
+
+class InstrumentContext():
+    def __init__(self, protocol=None):
+        self.protocol = protocol
+        self.flow_rate = type("FlowRate", (), {"aspirate": 1.0, "dispense": 1.0, "blow_out": 1.0})()
+        self.tip_racks = []
+    def _move(self, *args, **kwargs):
+        if self.protocol is not None:
+            self.protocol.elapsed += self.protocol.move_time
+    move_to = pick_up_tip = drop_tip = aspirate = dispense = blow_out = touch_tip = _move
+
 
 class ProtocolContext():
-    def __init__(self): ...
-    def load_labware_from_definition(self, *args, **kwargs): ...
-    def load_labware(self, *args, **kwargs): ...
-    def load_instrument(self, *args, **kwargs): ...
-    def delay(self, *args, **kwargs): ...
\ No newline at end of file
+    def __init__(self, move_time=0.0):
+        self.elapsed = 0.0 # simulated time in seconds
+        self.move_time = move_time # simulated time of one instrument move in seconds
+        self.max_speeds = {}
+    def load_labware_from_definition(self, *args, **kwargs): return Labware()
+    def load_labware(self, *args, **kwargs): return Labware()
+    def load_instrument(self, *args, **kwargs): return InstrumentContext(self)
+    def delay(self, seconds=0, *args, **kwargs): self.elapsed += seconds
@@ -8,30 +8,225 @@ This file is subject to the terms and conditions defined in file 'LICENSE.TXT',
 import socket
 import time
 import os
+import threading
 
-def cond_conn_check():
-    """Check connection with meter"""
-    UDP_IP = "169.254.239.206"
-    UDP_PORT = 5005
+PUMP_ADDRESS = ("169.254.239.206", 5005) # the UDP server of the Raspberry Pi
+LEGACY_PUMP_TRIGGER = "8" # starts the pump for a fixed time on the legacy server of the Pi
+
+
+class RaspiChannel():
+    """A request/response channel to the UDP server of the Raspberry Pi over one long-lived socket.
+
+    Each request is sent as "<seq> <command> [args]" and answered with "<seq> ack [result]" or
+    "<seq> error <reason>". A request without answer within `timeout` is sent again with the same
+    sequence number, up to `retries` times; the server answers a repeated sequence number without
+    executing the command twice. Late answers to earlier requests are discarded. `RaspiStandIn`
+    implements the server side of this protocol, which the server of the deployed Pi does not
+    answer yet: until it does, the configuration keeps "legacy" on.
+
+    With `legacy`, the channel talks to the server of the Pi which predates this protocol: the
+    bare command is sent once and nothing is waited for, so nothing is known of its execution.
+
+    Parameters
+    ----------
+    address : tuple(str, int), optional
+        The IP and UDP port of the server.
+    timeout : float, optional
+        The time to wait for an answer in seconds.
+    retries : int, optional
+        The number of times a request is sent again.
+    legacy : bool, optional
+        If True, send the commands without sequence number nor answer.
+    """
+    def __init__(self, address:tuple=PUMP_ADDRESS, timeout:float=0.5, retries:int=3, legacy:bool=False):
+        self.address = tuple(address)
+        self.timeout = timeout
+        self.retries = retries
+        self.legacy = legacy
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config:dict):
+        """Create the channel from `config["Remote Stations"]["Raspberry Pi"]`, with the keys "ip",
+        "port", "timeout", "retries" and "legacy". Missing keys take the default values, except
+        "legacy" which is True: the deployed Pi runs the legacy server until it is updated.
+        """
+        raspi = config.get("Remote Stations", {}).get("Raspberry Pi", {})
+        return cls(
+            address=(raspi.get("ip", PUMP_ADDRESS[0]), raspi.get("port", PUMP_ADDRESS[1])),
+            timeout=raspi.get("timeout", 0.5),
+            retries=raspi.get("retries", 3),
+            legacy=raspi.get("legacy", True)
+        )
+
+    def request(self, command:str, *args) -> str:
+        """Send a command and return the result of its acknowledgement ("" if none), or None on
+        a legacy channel.
 
-    MESSAGE = "check_cond"
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.sendto(MESSAGE.encode(), (UDP_IP, UDP_PORT))
+        Raises
+        ------
+        TimeoutError
+            If no answer arrives after all the retries.
+        RuntimeError
+            If the server answers with an error.
+        """
+        if self.legacy: # fire and forget
+            self.sock.sendto(" ".join([command] + [str(a) for a in args]).encode(), self.address)
+            return None
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            message = " ".join([str(seq), command] + [str(a) for a in args])
+            for _ in range(self.retries + 1):
+                self.sock.sendto(message.encode(), self.address)
+                deadline = time.monotonic() + self.timeout
+                while time.monotonic() < deadline:
+                    self.sock.settimeout(max(deadline - time.monotonic(), 1e-3))
+                    try:
+                        data, _ = self.sock.recvfrom(1024)
+                    except socket.timeout:
+                        break
+                    reply_seq, status, *result = data.decode().split(" ", 2) + [""]
+                    if reply_seq != str(seq): # the answer to an earlier request
+                        continue
+                    if status != "ack":
+                        raise RuntimeError(f"The Raspberry Pi failed to execute '{command}': {result[0]}")
+                    return result[0]
+        raise TimeoutError(
+            f"No answer to '{command}' from {self.address} after {self.retries + 1} attempts."
+        )
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+_channel = None # the default channel of the module functions
+
+
+def default_channel() -> RaspiChannel:
+    global _channel
+    if _channel is None:
+        _channel = RaspiChannel()
+    return _channel
+
+
+def cond_conn_check(channel:RaspiChannel=None) -> None:
+    """Check connection with meter"""
+    (channel or default_channel()).request("check_cond")
     
-def get_conductivity():
-    """Get conductivity from meter"""
-    UDP_IP = "169.254.239.206"
-    UDP_PORT = 5005
-
-    MESSAGE = "cond"
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.sendto(MESSAGE.encode(), (UDP_IP, UDP_PORT))
+def get_conductivity(channel:RaspiChannel=None) -> float:
+    """Get conductivity from meter, None from the legacy server which does not answer"""
+    result = (channel or default_channel()).request("cond")
+    return None if result is None else float(result)
     
-def trigger_pump():
-    """Trigger vacuum pump"""
-    UDP_IP = "169.254.239.206"
-    UDP_PORT = 5005
-
-    MESSAGE = "8"
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.sendto(MESSAGE.encode(), (UDP_IP, UDP_PORT))
\ No newline at end of file
+def trigger_pump(duration:float=6.5, channel:RaspiChannel=None) -> None:
+    """Trigger vacuum pump for `duration` seconds"""
+    PumpController(channel or default_channel()).start(duration)
+
+
+class PumpController():
+    """Start and stop the vacuum pump without blocking the protocol. The Raspberry Pi acknowledges
+    every command, runs the pump for the requested duration and then stops it by itself, so the
+    arm can keep moving while the pump runs.
+
+    On a legacy channel, the pump is started by the legacy trigger and runs for the fixed time of
+    the Pi: `duration` is then only the expected run time, and `stop` does nothing.
+
+    Parameters
+    ----------
+    channel : RaspiChannel, optional
+        The channel to the Raspberry Pi. The default is the channel of the module.
+    """
+    def __init__(self, channel:RaspiChannel=None):
+        self.channel = channel or default_channel()
+        self._stop_time = 0.0 # when the pump stops, on the monotonic clock
+
+    def start(self, duration:float) -> None:
+        """Run the pump for `duration` seconds and return as soon as the start is acknowledged."""
+        if self.channel.legacy:
+            self.channel.request(LEGACY_PUMP_TRIGGER)
+        else:
+            self.channel.request("pump_start", f"{duration:g}")
+        self._stop_time = time.monotonic() + duration
+
+    def stop(self) -> None:
+        """Stop the pump before the end of its duration. The legacy server of the Pi has no stop
+        command, so the pump runs until its fixed time on a legacy channel."""
+        if self.channel.legacy:
+            return
+        self.channel.request("pump_stop")
+        self._stop_time = time.monotonic()
+
+    def remaining(self) -> float:
+        """The time in seconds until the pump stops."""
+        return max(0.0, self._stop_time - time.monotonic())
+
+    @property
+    def running(self) -> bool:
+        return self.remaining() > 0
+
+
+class RaspiStandIn(threading.Thread):
+    """A UDP stand-in of the server of the Raspberry Pi to test `RaspiChannel` off-robot. It
+    answers the commands of `RaspiChannel`, records the executed ones in `commands` and keeps the
+    state of the pump. `drop` packets are ignored first to simulate losses.
+
+    >>> server = RaspiStandIn()
+    >>> server.start()
+    >>> pump = PumpController(RaspiChannel(server.address))
+    """
+    def __init__(self, host:str="127.0.0.1", port:int=0, conductivity:float=0.0, drop:int=0):
+        super().__init__(daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.1)
+        self.address = self.sock.getsockname()
+        self.conductivity = conductivity # the reading returned by "cond"
+        self.drop = drop # the number of packets to ignore
+        self.commands = [] # the commands executed, in order
+        self._stop_time = 0.0
+        self._replies = {} # the last reply to each client, to answer repeated requests
+        self._closed = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return time.monotonic() < self._stop_time
+
+    def execute(self, command:str, args:list) -> str:
+        """Execute a command and return its result. Raise ValueError if it is not understood."""
+        if command == "pump_start" and len(args) == 1:
+            self._stop_time = time.monotonic() + float(args[0])
+        elif command == "pump_stop" and not args:
+            self._stop_time = 0.0
+        elif command == "cond" and not args:
+            return f"{self.conductivity}"
+        elif command != "check_cond" or args:
+            raise ValueError(f"unknown command '{command}'")
+        return ""
+
+    def run(self) -> None:
+        while not self._closed.is_set():
+            try:
+                data, client = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            if self.drop > 0:
+                self.drop -= 1
+                continue
+            seq, command, *args = data.decode().split()
+            last_seq, reply = self._replies.get(client, (None, None))
+            if seq != last_seq: # a new request, not a repeated one
+                self.commands.append(" ".join([command] + args))
+                try:
+                    reply = f"{seq} ack {self.execute(command, args)}".rstrip()
+                except ValueError as e:
+                    reply = f"{seq} error {e}"
+                self._replies[client] = (seq, reply)
+            self.sock.sendto(reply.encode(), client)
+
+    def close(self) -> None:
+        self._closed.set()
+        self.join()
+        self.sock.close()
@@ -109,7 +109,7 @@ class RemoteStation(SSHClient):
     def put(self, 
             local_path:str=None, 
             remote_path:str=None, 
-            modules:list=["ot2.py", "robots.py", "sockets.py", "pump_raspi"]
+            modules:list=["ot2.py", "robots.py", "plan.py", "layout.py", "covers.py", "sockets.py", "squidstat.py", "inventory.py", "route.py", "telemetry.py", "pump_raspi"]
         ) -> None:
         """ A wrapper of `transfer` method to upload experiment folder to remote station.
         It first copies modules (e.g. robots.py, ot2.py, etc.) to the experiment folder which is 
@@ -128,7 +128,8 @@ class RemoteStation(SSHClient):
         modules : list[str]
             A list of modules (or module files) to be put to the experiment folder on the remote
         station. This ensures the experiment imports the latest module. By default it contains the
-        following files: `ot2.py`, `robots.py` and `sockets.py`.
+        following files: `ot2.py`, `robots.py`, `plan.py`, `layout.py`, `covers.py`, `sockets.py`,
+        `squidstat.py`, `inventory.py`, `route.py` and `telemetry.py`.
         
         """
         # Define path to the experiment folder to be put to the remote station
@@ -1,8 +1,45 @@
 import os
-import serial
+import csv
 from abc import ABC
-import pandas as pd
 from datetime import datetime
+# Modules here run on the OT2 computer, where every import adds to the protocol startup time.
+# Keep them to the standard library (`serial` is imported when the meter is read).
+
+
+def parse_csv_value(value:str):
+    """Convert a csv field to an int, a float or `None` (empty field). Other strings are
+    returned stripped.
+    """
+    value = value.strip()
+    if not value:
+        return None
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            continue
+    return value
+
+
+def read_csv_records(path:str):
+    """Read a csv file into its column names and a list of rows (dictionaries) whose values are
+    parsed by `parse_csv_value`.
+    """
+    with open(path, "r", newline="") as f:
+        reader = csv.DictReader(f)
+        records = [{k: parse_csv_value(v or "") for k, v in row.items()} for row in reader]
+        return list(reader.fieldnames), records
+
+
+def write_csv_records(path:str, columns:list, records:list):
+    """Write rows (dictionaries) to a csv file with the given column order. `None` is written as
+    an empty field.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for record in records:
+            writer.writerow({k: ("" if v is None else v) for k, v in record.items()})
 
 class Robot(ABC):
     def __init__(self, config=None): 
@@ -27,7 +64,8 @@ class ConductivityMeter(Robot):
         cwd = os.path.dirname(__file__)
         self._formulation_input_path = os.path.join(cwd, "experiment.csv")
 
-    def read_cond(self, uid=None, verbose=False, append=True):
+    def read_cond(self, uid=None, verbose=False, append=True, row=None):
+        import serial
         port = "/dev/serial/by-id/usb-Prolific_Technology_Inc._USB-Serial_Controller-if00-port0"
         self._check = False
         with serial.Serial(port, 9600, timeout=2) as ser:
@@ -60,6 +98,7 @@ class ConductivityMeter(Robot):
             self.result_list.append(
                 {
                     "uid": uid, 
+                    "row": row,
                     "Conductivity": self._cond, 
                     "Temperature": self._temp,
                     "Time": self._time
@@ -80,17 +119,30 @@ class ConductivityMeter(Robot):
             Clear the cache after exporting the result.
         """
 
-        df = pd.read_csv(self._formulation_input_path, index_col="unique_id")
+        columns, records = read_csv_records(self._formulation_input_path)
+        columns += [c for c in ["Conductivity", "Temperature", "Time"] if c not in columns]
+        # A result fills the row of its formulation. The formulations are not measured in row
+        # order and may have no uid (e.g. training sets), so a result without row fills the first
+        # unfilled row with the same uid.
+        filled = set(r["row"] for r in self.result_list if r.get("row") is not None)
         for result in self.result_list:
-            uid = result["uid"]
-            df.loc[uid, "Conductivity"] = result["Conductivity"]
-            df.loc[uid, "Temperature"] = result["Temperature"]
-            df.loc[uid, "Time"] = result["Time"]
+            i = result.get("row")
+            if i is None:
+                i = next(
+                    (i for i, record in enumerate(records)
+                     if i not in filled and record["unique_id"] == result["uid"]),
+                    None
+                )
+                if i is None:
+                    continue
+                filled.add(i)
+            records[i]["Conductivity"] = result["Conductivity"]
+            records[i]["Temperature"] = result["Temperature"]
+            records[i]["Time"] = result["Time"]
 
         if file_path is None:
             file_path = self._formulation_input_path
-        df.reset_index(inplace=True)
-        df.to_csv(file_path, index=False)
+        write_csv_records(file_path, columns, records)
 
         if clear_cache:
             self.clear_cache()
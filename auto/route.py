@@ -0,0 +1,107 @@
+try:
+    from layout import slot_position
+except ModuleNotFoundError:
+    from auto.layout import slot_position
+# The route is planned on the OT2 computer before measuring a plate, so this module only uses the
+# standard library.
+
+MAX_SPEEDS = {"x": 600, "y": 400, "z": 125} # default maximum speeds of the OT2 gantry in mm/s
+TRASH_SLOT = 12 # the fixed trash, where the pipette drops its last tip before measuring
+SLOT_CENTER = [63.88, 42.74] # x and y offset (mm) of the center of a slot from its corner
+
+
+def well_position(n:int, well:str, definition:dict) -> tuple:
+    """Return the (x, y) position (mm) on the deck of a well of the labware in slot `n`."""
+    x0, y0 = slot_position(n)
+    return (x0 + definition["wells"][well]["x"], y0 + definition["wells"][well]["y"])
+
+
+def slot_center(n:int) -> tuple:
+    """Return the (x, y) position (mm) of the center of deck slot `n`."""
+    x0, y0 = slot_position(n)
+    return (x0 + SLOT_CENTER[0], y0 + SLOT_CENTER[1])
+
+
+class MotionModel():
+    """Predict the travel time of the gantry between two positions of the deck.
+
+    The x and y axes move at the same time, each at its maximum speed, and every move between two
+    labwares lifts the arm by `lift` mm and lowers it again. Acceleration is neglected.
+
+    Parameters
+    ----------
+    max_speeds : dict, optional
+        The maximum speed (mm/s) of the "x", "y" and "z" axes, the defaults of `MAX_SPEEDS`
+        otherwise.
+    lift : float, optional
+        The height (mm) the arm is lifted by to travel between labwares.
+    """
+    def __init__(self, max_speeds:dict=None, lift:float=20.0):
+        self.speeds = dict(MAX_SPEEDS)
+        self.speeds.update({axis: v for axis, v in (max_speeds or {}).items() if v})
+        self.lift = lift
+
+    def time(self, p:tuple, q:tuple) -> float:
+        """The travel time in seconds from position `p` to position `q`."""
+        if tuple(p) == tuple(q):
+            return 0.0
+        xy = max(abs(q[0] - p[0]) / self.speeds["x"], abs(q[1] - p[1]) / self.speeds["y"])
+        return xy + 2 * self.lift / self.speeds["z"]
+
+
+def plan_route(wells:list, positions:dict, rinses:list, sponge:tuple, model:MotionModel, start:tuple=None) -> tuple:
+    """Order the measurement of the wells and pick the rinse station of each, to minimize the
+    travel of the conductivity meter arm. Each well is measured, then the probe is rinsed in
+    every well of one station, from the first to the last, and dried on the sponge.
+
+    The probe always leaves from the sponge, so only the first well of the order changes the
+    travel time: it is the one which is the closest to `start` relative to the sponge, and the
+    others keep their order. This route is the shortest one.
+
+    Parameters
+    ----------
+    wells : list[tuple(int, str)]
+        The locations of the wells to measure.
+    positions : dict
+        The (x, y) position of each location of `wells`.
+    rinses : list[tuple(tuple, tuple)]
+        The position of the first and the last well of every rinse station.
+    sponge : tuple
+        The position of the sponge.
+    model : MotionModel
+        Predicts the travel time of the arm.
+    start : tuple, optional
+        The position of the arm before the first well. The default is the sponge.
+
+    Returns
+    -------
+    order : list[int]
+        The indices of `wells` in the order of measurement.
+    stations : list[int]
+        The index in `rinses` of the station used after each well of `order`.
+    travel_time : float
+        The predicted travel time in seconds, without the time spent in the wells.
+    """
+    def cycle(well):
+        """The rinse station and the travel time from the well to the sponge through it."""
+        times = [
+            model.time(positions[well], first) + model.time(last, sponge) for first, last in rinses
+        ]
+        station = min(range(len(times)), key=times.__getitem__)
+        return station, times[station]
+
+    if not wells:
+        return [], [], 0.0
+    cycles = [cycle(well) for well in wells]
+    if start is None:
+        start = sponge
+    # the first well replaces a leg from the sponge by a leg from the start
+    first = min(
+        range(len(wells)),
+        key=lambda k: model.time(start, positions[wells[k]]) - model.time(sponge, positions[wells[k]])
+    )
+    order = [first] + [k for k in range(len(wells)) if k != first]
+    travel_time = sum(
+        model.time(start if k == first else sponge, positions[wells[k]]) + cycles[k][1] for k in order
+    )
+    return order, [cycles[k][0] for k in order], travel_time
@@ -1,49 +1,288 @@
-from socket import socket
-from time import sleep
-
-class SocketServer(socket):
-    def __init__(self, host, port):
-        super().__init__()
-        self.client = None
-        self.start(host=host, port=port)
-
-    def client_start(self, message, delay=1):
-        self.settimeout(delay)
-        # send a command to start squidstat
-        self.client.send(str.encode(message))
-        # keep receving response from squidstat 
-        while True:
-            try:
-                message = self.client.recv(2048).decode("utf-8")
-                if message == "In Progress":
-                    print("Measurement in progress...")
-                elif message == "Finish":
-                    print("Measurement completed...")
-                    break
-            except socket.timeout:
-                continue
-        return message
-
-
-    def start(self, host, port):
-        self.bind((host, port))
-        sleep(2)
-        print(f'Server is up and listing on the port {port}...')
-        self.listen()
+import json
+import struct
+import asyncio
+import itertools
+import threading
+# The event server runs on the OT2 computer next to the protocol, so this module only uses the
+# standard library.
+
+HEADER = struct.Struct(">I") # the length of the json body, before every message
+MAX_FRAME = 16 * 1024 * 1024 # the largest message accepted in bytes
+
+
+def encode_frame(message:dict) -> bytes:
+    """Encode a message as a length-prefixed json frame."""
+    body = json.dumps(message).encode("utf-8")
+    return HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader:asyncio.StreamReader) -> dict:
+    """Read one length-prefixed json frame.
+
+    Raises
+    ------
+    asyncio.IncompleteReadError
+        If the connection is closed.
+    ValueError
+        If the frame is larger than `MAX_FRAME`.
+    """
+    (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame of {length} bytes is too large.")
+    return json.loads(await reader.readexactly(length))
+
+
+class Connection():
+    """One end of a framed connection. Messages are dictionaries:
+
+    - {"type": "request", "id": 1, "method": "status", "params": {...}}
+    - {"type": "response", "id": 1, "result": ...} or {"type": "response", "id": 1, "error": "..."}
+    - {"type": "event", "method": "completed", "params": {...}}
+
+    Requests are answered by the handler registered for their method, responses are matched to
+    their request by id, and events are passed to the handler of their method without answer.
+    """
+    def __init__(self, reader, writer, handlers:dict, name:str=None):
+        self.reader = reader
+        self.writer = writer
+        self.handlers = handlers # {method: function(connection, params)}, sync or async
+        self.name = name
+        self._ids = itertools.count(1)
+        self._pending = {} # {id: future} of the requests waiting for a response
+
+    async def send(self, message:dict) -> None:
+        self.writer.write(encode_frame(message))
+        await self.writer.drain()
+
+    async def request(self, method:str, params:dict=None, timeout:float=10):
+        """Send a request and return the result of its response.
+
+        Raises
+        ------
+        asyncio.TimeoutError
+            If no response arrives within `timeout` seconds.
+        RuntimeError
+            If the other end answers with an error.
+        """
+        id_ = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[id_] = future
         try:
-            self.client, self.address = self.accept()
-            print(f"Connected to Client at: {self.address}!")
+            await self.send({"type": "request", "id": id_, "method": method, "params": params or {}})
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(id_, None)
+
+    async def notify(self, method:str, params:dict=None) -> None:
+        """Send an event, which is not answered."""
+        await self.send({"type": "event", "method": method, "params": params or {}})
+
+    async def _call(self, method:str, params:dict):
+        if method not in self.handlers:
+            raise KeyError(f"Unknown method '{method}'")
+        result = self.handlers[method](self, params)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    async def _answer(self, message:dict) -> None:
+        try:
+            result = await self._call(message["method"], message.get("params", {}))
+            response = {"type": "response", "id": message["id"], "result": result}
         except Exception as e:
-            print(e)
-    
-
-class SocketClient(socket):
-    def __init__(self, host, port):
-        super().__init__()
-        self.server = None
-        self.connect(host=host, port=port)
-
-if __name__ == "__main__":
-    HOST = "169.254.230.44"  # Standard loopback interface address (localhost)
-    PORT = 24  # Port to listen on (non-privileged ports are > 1023)
-    s = SocketServer(host=HOST, port=PORT)
+            response = {"type": "response", "id": message["id"], "error": f"{type(e).__name__}: {e}"}
+        await self.send(response)
+
+    async def serve(self) -> None:
+        """Dispatch the incoming messages until the connection is closed, or until a frame is too
+        large or not json, which closes it. Requests are handled concurrently so a slow handler
+        does not hold the other messages.
+        """
+        try:
+            while True:
+                message = await read_frame(self.reader)
+                kind = message.get("type")
+                if kind == "request":
+                    asyncio.ensure_future(self._answer(message))
+                elif kind == "response":
+                    future = self._pending.get(message.get("id"))
+                    if future is not None and not future.done():
+                        if "error" in message:
+                            future.set_exception(RuntimeError(message["error"]))
+                        else:
+                            future.set_result(message.get("result"))
+                elif kind == "event" and message.get("method") in self.handlers:
+                    asyncio.ensure_future(self._call(message["method"], message.get("params", {})))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("The connection is closed."))
+            self.writer.close()
+
+
+class EventServer():
+    """An asyncio server for the instrument clients (e.g. SquidStat). Every client first sends a
+    "hello" request with its name and is then addressed by that name.
+
+    The server can run on its own thread with `start`, so that the synchronous robot protocol
+    calls `request` and `notify` without blocking on the network.
+
+    >>> server = EventServer("169.254.230.44", 23)
+    >>> server.on("completed", lambda connection, params: print(params))
+    >>> server.start()
+    >>> server.request("squidstat", "status", timeout=5)
+    """
+    def __init__(self, host:str="127.0.0.1", port:int=0):
+        self.host = host
+        self.port = port
+        self.clients = {} # {name: Connection}
+        self.handlers = {"hello": self._hello}
+        self.loop = None
+        self._server = None
+        self._thread = None
+
+    def on(self, method:str, handler=None):
+        """Register the handler of the requests and events of `method`, also as a decorator."""
+        if handler is None:
+            return lambda handler: self.on(method, handler)
+        self.handlers[method] = handler
+        return handler
+
+    def _hello(self, connection:Connection, params:dict):
+        connection.name = params["name"]
+        self.clients[connection.name] = connection
+        return {"name": connection.name}
+
+    async def _handle_client(self, reader, writer) -> None:
+        connection = Connection(reader, writer, self.handlers)
+        try:
+            await connection.serve()
+        finally:
+            if self.clients.get(connection.name) is connection:
+                del self.clients[connection.name]
+
+    async def serve(self) -> None:
+        """Start listening. `self.port` is updated if the port was 0 (any free port)."""
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def start(self) -> None:
+        """Run the server on a background thread and return once it listens.
+
+        Raises
+        ------
+        OSError
+            If the server cannot listen on its port, e.g. the port is in use.
+        """
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        errors = []
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.serve())
+            except BaseException as e:
+                errors.append(e)
+                return
+            finally:
+                started.set()
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            self._thread.join()
+            self.loop.close()
+            raise errors[0]
+        print(f"Server is up and listening on the port {self.port}...")
+
+    def _run(self, coroutine, timeout:float=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def wait_for_client(self, name:str, timeout:float=60) -> None:
+        """Block until the client `name` is connected.
+
+        Raises
+        ------
+        TimeoutError
+            If the client does not connect within `timeout` seconds.
+        """
+        async def wait():
+            while name not in self.clients:
+                await asyncio.sleep(0.05)
+        try:
+            self._run(asyncio.wait_for(wait(), timeout))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{name} did not connect within {timeout} s.")
+
+    def request(self, name:str, method:str, params:dict=None, timeout:float=10):
+        """Send a request to the client `name` and return the result. See `Connection.request`."""
+        if name not in self.clients:
+            raise KeyError(f"{name} is not connected.")
+        try:
+            return self._run(self.clients[name].request(method, params, timeout))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{name} did not answer '{method}' within {timeout} s.")
+
+    def notify(self, name:str, method:str, params:dict=None) -> None:
+        """Send an event to the client `name`."""
+        self._run(self.clients[name].notify(method, params))
+
+    def stop(self) -> None:
+        """Close the connections and stop the background thread."""
+        async def close():
+            self._server.close()
+            for connection in list(self.clients.values()):
+                connection.writer.close()
+            await self._server.wait_closed()
+        self._run(close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class EventClient():
+    """The client end of `EventServer`, for the instruments. It registers with its name and
+    answers the requests of the server with its handlers.
+
+    >>> client = EventClient("squidstat")
+    >>> client.on("status", lambda connection, params: {"running": False})
+    >>> await client.connect("169.254.230.44", 23)
+    >>> await client.serve_forever()
+    """
+    def __init__(self, name:str):
+        self.name = name
+        self.handlers = {}
+        self.connection = None
+        self._task = None
+
+    def on(self, method:str, handler=None):
+        """Register the handler of the requests and events of `method`, also as a decorator."""
+        if handler is None:
+            return lambda handler: self.on(method, handler)
+        self.handlers[method] = handler
+        return handler
+
+    async def connect(self, host:str, port:int, timeout:float=10) -> None:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        self.connection = Connection(reader, writer, self.handlers, name=self.name)
+        self._task = asyncio.ensure_future(self.connection.serve())
+        await self.connection.request("hello", {"name": self.name}, timeout)
+
+    async def request(self, method:str, params:dict=None, timeout:float=10):
+        return await self.connection.request(method, params, timeout)
+
+    async def notify(self, method:str, params:dict=None) -> None:
+        await self.connection.notify(method, params)
+
+    async def serve_forever(self) -> None:
+        """Answer the server until the connection is closed."""
+        await self._task
+
+    async def close(self) -> None:
+        self.connection.writer.close()
+        await self._task
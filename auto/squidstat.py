@@ -0,0 +1,460 @@
+import sys
+import csv
+import json
+import time
+import array
+import struct
+import asyncio
+import threading
+from collections import deque
+sys.path.append("./")
+try:
+    from sockets import EventServer, EventClient
+except ModuleNotFoundError:
+    from auto.sockets import EventServer, EventClient
+# The remote procedures between the OT2 (the event server) and the computer driving the
+# SquidStat potentiostat (a client named "squidstat"):
+#   start_experiment {"channel", "uid", "experiment"} -> {"channel", "started"}
+#   status {"channel" (optional)} -> {"channels": {channel: "idle" | "running" | "completed"}}
+#   results {"channel"} -> {"channel", "uid", "columns", "rows"}
+# and the event pushed by the SquidStat computer when a channel finishes:
+#   channel_completed {"channel", "uid"}
+
+NAME = "squidstat"
+COLUMNS = ["Timestamp", "Working Electrode Voltage", "Current"] # the columns of the DC data
+BLOCK = struct.Struct("<I") # the number of rows of a block, or the length of the file header
+
+
+class SquidStatRPC():
+    """Call the SquidStat computer from the OT2 through the event server. Completed channels are
+    pushed by the SquidStat computer, so `wait_completed` returns as soon as a channel finishes
+    instead of polling.
+
+    Parameters
+    ----------
+    server : sockets.EventServer
+        The running event server the SquidStat computer connects to.
+    timeout : float, optional
+        The time to wait for an answer in seconds.
+    """
+    def __init__(self, server:EventServer, timeout:float=10):
+        self.server = server
+        self.timeout = timeout
+        self.completed = {} # {channel: the parameters of the last "channel_completed" event}
+        self._condition = threading.Condition()
+        server.on("channel_completed", self._on_completed)
+
+    def _on_completed(self, connection, params:dict) -> None:
+        with self._condition:
+            self.completed[int(params["channel"])] = params
+            self._condition.notify_all()
+
+    def call(self, method:str, **params):
+        return self.server.request(NAME, method, params, timeout=self.timeout)
+
+    def start_experiment(self, channel:int, uid=None, experiment:dict=None) -> dict:
+        """Start an experiment on a channel of the potentiostat."""
+        with self._condition:
+            self.completed.pop(channel, None)
+        return self.call("start_experiment", channel=channel, uid=uid, experiment=experiment or {})
+
+    def status(self, channel:int=None) -> dict:
+        """Return the state of all the channels, or of one channel."""
+        channels = self.call("status", channel=channel)["channels"]
+        return {int(c): state for c, state in channels.items()}
+
+    def results(self, channel:int) -> dict:
+        """Return the data of the last experiment of a channel."""
+        return self.call("results", channel=channel)
+
+    def wait_completed(self, channel:int, timeout:float=None) -> dict:
+        """Block until the channel pushes its completion and return the event parameters.
+
+        Raises
+        ------
+        TimeoutError
+            If the channel does not complete within `timeout` seconds.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: channel in self.completed, timeout):
+                raise TimeoutError(f"Channel {channel} did not complete within {timeout} s.")
+            return self.completed[channel]
+
+
+class SquidStatService():
+    """Serve the SquidStat remote procedures on the SquidStat computer. The instrument is driven by
+    a backend with the methods `start(channel, uid, experiment)`, `status()` -> {channel: state}
+    and `results(channel)` -> (columns, rows). The backend calls `channel_completed` when a
+    channel finishes, from any thread.
+
+    >>> service = SquidStatService(backend)
+    >>> asyncio.run(service.run("169.254.230.44", 23))
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.client = EventClient(NAME)
+        self.client.on("start_experiment", self._start_experiment)
+        self.client.on("status", self._status)
+        self.client.on("results", self._results)
+        self.loop = None
+        self._uids = {} # {channel: uid of the last experiment}
+        if hasattr(backend, "service"):
+            backend.service = self
+
+    def _start_experiment(self, connection, params:dict) -> dict:
+        channel = int(params["channel"])
+        if self.backend.status().get(channel) == "running":
+            raise RuntimeError(f"Channel {channel} is already running.")
+        self._uids[channel] = params.get("uid")
+        self.backend.start(channel, params.get("uid"), params.get("experiment", {}))
+        return {"channel": channel, "started": True}
+
+    def _status(self, connection, params:dict) -> dict:
+        channels = self.backend.status()
+        if params.get("channel") is not None:
+            channels = {params["channel"]: channels[int(params["channel"])]}
+        return {"channels": {str(c): state for c, state in channels.items()}}
+
+    def _results(self, connection, params:dict) -> dict:
+        channel = int(params["channel"])
+        columns, rows = self.backend.results(channel)
+        return {"channel": channel, "uid": self._uids.get(channel), "columns": columns, "rows": rows}
+
+    def channel_completed(self, channel:int) -> None:
+        """Push the completion of a channel to the OT2. Safe to call from any thread."""
+        if self.loop is None or self.loop.is_closed(): # the connection is already closed
+            return
+        params = {"channel": channel, "uid": self._uids.get(channel)}
+        asyncio.run_coroutine_threadsafe(self.client.notify("channel_completed", params), self.loop)
+
+    async def connect(self, host:str, port:int) -> None:
+        self.loop = asyncio.get_running_loop()
+        await self.client.connect(host, port)
+
+    async def run(self, host:str, port:int) -> None:
+        """Connect to the OT2 and serve until the connection is closed."""
+        await self.connect(host, port)
+        await self.client.serve_forever()
+
+
+class FakeSquidStat():
+    """A backend of `SquidStatService` simulating the potentiostat: every experiment lasts
+    `duration` seconds and records `n_points` rows of (Timestamp, Voltage, Current).
+    """
+    COLUMNS = COLUMNS
+
+    def __init__(self, n_channels:int=4, duration:float=0.1, n_points:int=10):
+        self.n_channels = n_channels
+        self.duration = duration
+        self.n_points = n_points
+        self.service = None # set by the service to push completions
+        self.started = {} # {channel: time the last experiment started}
+        self._states = {channel: "idle" for channel in range(n_channels)}
+        self._data = {}
+
+    def start(self, channel:int, uid, experiment:dict) -> None:
+        if not 0 <= channel < self.n_channels:
+            raise ValueError(f"Channel {channel} does not exist.")
+        self._states[channel] = "running"
+        self.started[channel] = time.monotonic()
+        timer = threading.Timer(self.duration, self._complete, args=(channel,))
+        timer.daemon = True
+        timer.start()
+
+    def _complete(self, channel:int) -> None:
+        step = self.duration / max(self.n_points - 1, 1)
+        self._data[channel] = [[k * step, k * 0.1, 1e-3 * k] for k in range(self.n_points)]
+        self._states[channel] = "completed"
+        if self.service is not None:
+            self.service.channel_completed(channel)
+
+    def status(self) -> dict:
+        return dict(self._states)
+
+    def results(self, channel:int) -> tuple:
+        return self.COLUMNS, self._data.get(channel, [])
+
+
+class ChannelWriter():
+    """Record the samples of one channel in a buffer of typed arrays which is written to a binary
+    file in blocks when it is full, so the memory is bounded and the file is not touched for every
+    sample. Every block is stored column by column:
+
+    [header length][json list of the columns] ([n rows][n values of column 1]...[column m])...
+
+    with the values as float64 in the native byte order. Use `read_channel` or `export_csv` to get
+    the data back.
+
+    Parameters
+    ----------
+    path : str
+        The binary file of the channel.
+    columns : list[str], optional
+        The names of the values of every sample.
+    capacity : int, optional
+        The number of samples buffered before they are written.
+    echo_interval : float, optional
+        The minimum time in seconds between two samples printed to the console. None to not print.
+    name : str, optional
+        The name printed before the echoed samples, e.g. "channel 0".
+    """
+    def __init__(self, path:str, columns:list=COLUMNS, capacity:int=4096,
+                 echo_interval:float=1.0, name:str=""):
+        self.path = path
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.echo_interval = echo_interval
+        self.name = name
+        self.count = 0 # the number of samples in the buffer
+        self.total = 0 # the number of samples recorded
+        self._buffer = [array.array("d", bytes(8 * capacity)) for _ in self.columns]
+        self._last_echo = -float("inf")
+        header = json.dumps(self.columns).encode("utf-8")
+        self.file = open(path, "wb")
+        self.file.write(BLOCK.pack(len(header)) + header)
+
+    def add(self, *values) -> None:
+        """Record one sample, with one value per column."""
+        for column, value in zip(self._buffer, values):
+            column[self.count] = value
+        self.count += 1
+        self.total += 1
+        if self.count == self.capacity:
+            self.flush()
+        if self.echo_interval is not None:
+            now = time.monotonic()
+            if now - self._last_echo >= self.echo_interval:
+                self._last_echo = now
+                print(self.name, ", ".join(f"{c}: {v:.9f}" for c, v in zip(self.columns, values)))
+
+    def flush(self) -> None:
+        """Write the buffered samples as one block."""
+        if self.count == 0 or self.file.closed:
+            return
+        self.file.write(BLOCK.pack(self.count))
+        for column in self._buffer:
+            self.file.write(memoryview(column)[:self.count])
+        self.file.flush()
+        self.count = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+def read_channel(path:str) -> dict:
+    """Read the file of a `ChannelWriter` and return {column: array of float64}."""
+    with open(path, "rb") as f:
+        (length,) = BLOCK.unpack(f.read(BLOCK.size))
+        data = {column: array.array("d") for column in json.loads(f.read(length))}
+        while True:
+            head = f.read(BLOCK.size)
+            if len(head) < BLOCK.size:
+                return data
+            (n,) = BLOCK.unpack(head)
+            for column in data.values():
+                column.frombytes(f.read(8 * n))
+
+
+def export_csv(path:str, csv_path:str=None) -> str:
+    """Export the file of a `ChannelWriter` to csv, by default next to it, and return the csv path."""
+    if csv_path is None:
+        csv_path = path.rsplit(".", 1)[0] + ".csv"
+    data = read_channel(path)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(data.keys())
+        writer.writerows(zip(*data.values()))
+    return csv_path
+
+
+class CycleAnalyzer():
+    """Compute the features of every cycle of a cyclic voltammetry while its samples arrive. A
+    cycle ends at every second reversal of the voltage sweep; the reversal is detected once the
+    voltage has moved back by more than `tolerance` from its extreme. The features of a cycle are:
+
+    - "anodic_peak_current" and "anodic_peak_voltage": the largest current (A) and its voltage (V)
+    - "cathodic_peak_current" and "cathodic_peak_voltage": the smallest current and its voltage
+    - "onset_voltage": the voltage where the current first reaches `onset_current`, or None
+    - "charge": the integrated current (C)
+    - "failed": whether the anodic peak is below `min_peak_current`
+
+    Parameters
+    ----------
+    on_cycle : function(features), optional
+        Called with the features of every completed cycle.
+    onset_current : float, optional
+        The current (A) of the onset voltage.
+    tolerance : float, optional
+        The voltage (V) the sweep has to move back to count as a reversal.
+    min_peak_current : float, optional
+        The anodic peak current (A) below which a cycle has failed. None to never fail.
+    """
+    def __init__(self, on_cycle=None, onset_current:float=1e-4, tolerance:float=1e-3,
+                 min_peak_current:float=None):
+        self.on_cycle = on_cycle
+        self.onset_current = onset_current
+        self.tolerance = tolerance
+        self.min_peak_current = min_peak_current
+        self.cycles = [] # the features of the completed cycles
+        self._direction = 0 # +1 for an anodic sweep, -1 for a cathodic one, 0 before moving
+        self._extreme = None # the extreme voltage of the current sweep
+        self._reversals = 0
+        self._previous = None # the last sample
+        self._cycle = None
+
+    def _new_cycle(self, timestamp:float, voltage:float, current:float) -> None:
+        self._cycle = {
+            "cycle": len(self.cycles), "start": timestamp, "end": timestamp,
+            "anodic_peak_current": current, "anodic_peak_voltage": voltage,
+            "cathodic_peak_current": current, "cathodic_peak_voltage": voltage,
+            "onset_voltage": voltage if current >= self.onset_current else None, "charge": 0.0,
+        }
+
+    def add(self, timestamp:float, voltage:float, current:float) -> dict:
+        """Add a sample and return the features of the cycle it completes, else None."""
+        if self._cycle is None:
+            self._new_cycle(timestamp, voltage, current)
+            self._extreme = voltage
+            self._previous = (timestamp, voltage, current)
+            return None
+        cycle = self._cycle
+        cycle["end"] = timestamp
+        cycle["charge"] += 0.5 * (current + self._previous[2]) * (timestamp - self._previous[0])
+        if current > cycle["anodic_peak_current"]:
+            cycle["anodic_peak_current"], cycle["anodic_peak_voltage"] = current, voltage
+        if current < cycle["cathodic_peak_current"]:
+            cycle["cathodic_peak_current"], cycle["cathodic_peak_voltage"] = current, voltage
+        if cycle["onset_voltage"] is None and current >= self.onset_current:
+            cycle["onset_voltage"] = voltage
+        self._previous = (timestamp, voltage, current)
+        # follow the sweep and count its reversals
+        if self._direction == 0:
+            if abs(voltage - self._extreme) > self.tolerance:
+                self._direction = 1 if voltage > self._extreme else -1
+                self._extreme = voltage
+        elif (voltage - self._extreme) * self._direction > 0:
+            self._extreme = voltage
+        elif (self._extreme - voltage) * self._direction > self.tolerance:
+            self._direction = -self._direction
+            self._extreme = voltage
+            self._reversals += 1
+            if self._reversals % 2 == 0:
+                return self._complete(timestamp, voltage, current)
+        return None
+
+    def _complete(self, timestamp:float, voltage:float, current:float) -> dict:
+        features = self._cycle
+        features["failed"] = (
+            self.min_peak_current is not None and features["anodic_peak_current"] < self.min_peak_current
+        )
+        self.cycles.append(features)
+        self._new_cycle(timestamp, voltage, current) # the sample also starts the next cycle
+        if self.on_cycle is not None:
+            self.on_cycle(features)
+        return features
+
+    def close(self) -> dict:
+        """Complete the last, possibly partial, cycle and return its features (None if empty)."""
+        if self._cycle is None or self._cycle["end"] == self._cycle["start"]:
+            return None
+        features = self._complete(*self._previous)
+        self._cycle = None
+        return features
+
+
+class ChannelScheduler():
+    """Run a queue of experiments on the channels of a potentiostat. Every channel starts a job as
+    soon as it is free, so a channel which completes early takes the next job instead of waiting
+    for the whole batch.
+
+    Parameters
+    ----------
+    n_channels : int
+        The number of channels of the device, e.g. `handler.getNumberOfChannels()`.
+    jobs : list[dict]
+        The jobs in order, e.g. {"uid": "well_1", "channel": 0, "experiment": {...}}. A job with a
+        "channel" only runs on that channel, the others run on the first free channel.
+    launch : function(channel, job)
+        Upload and start the experiment of a job on a channel. An exception marks the job as failed.
+    clock : function, optional
+        The clock of the utilization, in seconds.
+
+    Raises
+    ------
+    ValueError
+        If a job asks for a channel the device does not have.
+    """
+    def __init__(self, n_channels:int, jobs:list, launch, clock=time.monotonic):
+        for job in jobs:
+            if not 0 <= job.get("channel", 0) < n_channels:
+                raise ValueError(f"Channel {job['channel']} of job {job.get('uid')} does not exist.")
+        self.n_channels = n_channels
+        self.pending = deque(jobs)
+        self.launch = launch
+        self.clock = clock
+        self.running = {} # {channel: (job, start time)}
+        self.completed = [] # [(channel, job)]
+        self.failed = [] # [(channel, job, error message)]
+        self._busy = [0.0] * n_channels # the time each channel has run experiments
+        self._start = None
+
+    def _next_job(self, channel:int):
+        for job in self.pending:
+            if job.get("channel", channel) == channel:
+                self.pending.remove(job)
+                return job
+        return None
+
+    def _fill(self, channel:int) -> None:
+        """Start the next job of a free channel, skipping the jobs which fail to start."""
+        while channel not in self.running:
+            job = self._next_job(channel)
+            if job is None:
+                return
+            try:
+                self.launch(channel, job)
+            except Exception as e:
+                self.failed.append((channel, job, f"{type(e).__name__}: {e}"))
+                continue
+            self.running[channel] = (job, self.clock())
+
+    def start(self) -> None:
+        """Start a job on every channel."""
+        self._start = self.clock()
+        for channel in range(self.n_channels):
+            self._fill(channel)
+
+    def complete_experiment(self, channel:int) -> None:
+        """Record the completion of the experiment of a channel and start its next job."""
+        if channel not in self.running:
+            return
+        job, start = self.running.pop(channel)
+        self._busy[channel] += self.clock() - start
+        self.completed.append((channel, job))
+        self._fill(channel)
+
+    def get_running_channels(self) -> list:
+        return list(self.running)
+
+    @property
+    def done(self) -> bool:
+        return not self.running and not self.pending
+
+    def utilization(self) -> dict:
+        """Return the fraction of the time since `start` that each channel ran experiments."""
+        now = self.clock()
+        elapsed = now - self._start if self._start is not None else 0.0
+        busy = list(self._busy)
+        for channel, (_, start) in self.running.items():
+            busy[channel] += now - start
+        return {channel: busy[channel] / elapsed if elapsed > 0 else 0.0 for channel in range(self.n_channels)}
+
+    def report(self) -> str:
+        lines = [
+            f"channel {channel}: {fraction:.0%} busy, "
+            f"{sum(c == channel for c, _ in self.completed)} completed"
+            for channel, fraction in self.utilization().items()
+        ]
+        lines += [f"job {job.get('uid')} failed on channel {channel}: {e}" for channel, job, e in self.failed]
+        return "\n".join(lines)
@@ -0,0 +1,199 @@
+import sys
+import json
+import time
+import inspect
+import argparse
+import functools
+import contextlib
+# The trace is recorded by the protocol on the OT2 computer and summarized on the control PC, so
+# this module only uses the standard library.
+
+
+class Tracer():
+    """Record timing spans of the robot actions, one json line per span.
+
+    A span has the `name` of the action, its `start` and `duration` in seconds from the start of
+    the run, the `depth` of the spans it is nested in and the fields given when it is opened.
+    Every run appends a header line and its spans to the file, so the trace keeps the history of
+    the plates. Each line is written out when its span ends, so a run which fails keeps the spans
+    recorded until then: this costs a write of tens of microseconds, nothing next to a move of
+    the robot.
+
+    >>> tracer = Tracer("trace.jsonl")
+    >>> with tracer.span("aspirate", volume=100):
+    ...     ot2.pip_arm.aspirate(100, location)
+    >>> tracer.close()
+
+    Parameters
+    ----------
+    path : str, optional
+        The json lines file of the trace, appended to. None to only keep the spans in `self.spans`.
+    clock : function, optional
+        The monotonic clock in seconds.
+    """
+    def __init__(self, path:str=None, clock=time.monotonic):
+        self.path = path
+        self.clock = clock
+        self.spans = []
+        self.depth = 0 # the number of open spans
+        self._t0 = clock()
+        self._file = None
+        if path is not None:
+            self._file = open(path, "a", buffering=1) # line buffered
+            # the wall clock time of the start, which separates the runs
+            self._file.write(json.dumps({"started": time.time()}) + "\n")
+
+    @contextlib.contextmanager
+    def span(self, name:str, **fields):
+        """Time the block of the `with` statement. A block which raises is recorded with the
+        name of the exception in the "error" field."""
+        start = self.clock()
+        self.depth += 1
+        try:
+            yield
+        except BaseException as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            self.depth -= 1
+            end = self.clock()
+            self.record(dict(
+                name=name, start=start - self._t0, duration=end - start, depth=self.depth, **fields
+            ))
+
+    def record(self, span:dict) -> None:
+        self.spans.append(span)
+        if self._file is not None:
+            self._file.write(json.dumps(span, default=str) + "\n")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def traced(name:str, *arguments, **derived):
+    """Record every call of a method in a span of the `tracer` attribute of its object.
+
+    >>> @traced("dispense_chemical", "source", "target", "volume")
+    ... def dispense_chemical(self, source, target, volume): ...
+    >>> @traced("measure", well=lambda a: a["formulation"]["location"])
+    ... def measure_formulation(self, cond_meter, formulation): ...
+
+    Parameters
+    ----------
+    name : str
+        The name of the spans.
+    arguments : str
+        The arguments of the method recorded as fields of the span.
+    derived : function(dict)
+        Fields computed from the arguments of the method, given by name.
+    """
+    def decorate(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            tracer = getattr(self, "tracer", None)
+            if tracer is None:
+                return method(self, *args, **kwargs)
+            fields = {}
+            if arguments or derived:
+                bound = signature.bind(self, *args, **kwargs)
+                bound.apply_defaults()
+                fields = {a: bound.arguments[a] for a in arguments}
+                fields.update({f: get(bound.arguments) for f, get in derived.items()})
+            with tracer.span(name, **fields):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def read_trace(path:str, run:int=-1) -> list:
+    """Return the spans of one run of a trace file, the last one by default."""
+    runs = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "name" in record:
+                if not runs:
+                    runs.append([])
+                runs[-1].append(record)
+            elif "started" in record:
+                runs.append([])
+    return runs[run] if runs else []
+
+
+def summarize(spans:list, chemicals:dict=None) -> dict:
+    """Summarize the spans of a trace: the count and self time of each phase (span name), the
+    time spent dispensing each chemical and the time spent on each well. The self time of a span
+    excludes the spans nested in it, so the phases add up to the time of the run.
+
+    Parameters
+    ----------
+    spans : list[dict]
+        The spans, see `Tracer`.
+    chemicals : dict, optional
+        The name of the chemical of each source location. The sources are used otherwise.
+
+    Returns
+    -------
+    summary : dict
+        {"total": seconds, "phase": {name: (count, self seconds)}, "chemical": {chemical: seconds},
+        "well": {location: seconds}}. A well sums the dispensing spans into it ("target") and the
+        spans measuring it ("well").
+    """
+    summary = {"total": 0.0, "phase": {}, "chemical": {}, "well": {}}
+    # a span is recorded after the spans nested in it: the time of the ended spans of each depth
+    # is subtracted from the next span which ends one level up
+    nested = {}
+    for span in spans:
+        duration, depth = span["duration"], span.get("depth", 0)
+        summary["total"] = max(summary["total"], span["start"] + duration)
+        nested[depth] = nested.get(depth, 0.0) + duration
+        count, total = summary["phase"].get(span["name"], (0, 0.0))
+        summary["phase"][span["name"]] = (count + 1, total + duration - nested.pop(depth + 1, 0.0))
+        source = span.get("source")
+        if span.get("target") is not None and source is not None and source[0] is not None:
+            source = tuple(source)
+            chemical = chemicals.get(source, source) if chemicals else source
+            summary["chemical"][chemical] = summary["chemical"].get(chemical, 0.0) + duration
+        well = span.get("well", span.get("target"))
+        if well is not None and well[0] is not None:
+            well = tuple(well)
+            summary["well"][well] = summary["well"].get(well, 0.0) + duration
+    return summary
+
+
+def format_summary(summary:dict) -> str:
+    """Format a summary as a table, the longest entries first."""
+    total = summary["total"] or 1.0
+    lines = [f"Traced run: {summary['total']:.1f} s"]
+    lines.append(f"{'phase':<24s}{'count':>8s}{'self (s)':>12s}{'share':>8s}")
+    for name, (count, seconds) in sorted(summary["phase"].items(), key=lambda p: -p[1][1]):
+        lines.append(f"{name:<24s}{count:>8d}{seconds:>12.1f}{seconds / total:>8.1%}")
+    for key in ["chemical", "well"]:
+        lines.append(f"{key:<32s}{'time (s)':>12s}{'share':>8s}")
+        for name, seconds in sorted(summary[key].items(), key=lambda p: -p[1]):
+            lines.append(f"{str(name):<32s}{seconds:>12.1f}{seconds / total:>8.1%}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the trace of an OT2 run.")
+    parser.add_argument("trace", help="the json lines trace file")
+    parser.add_argument("--plan", help="the plan.json of the run, to name the chemicals")
+    parser.add_argument("--run", type=int, default=-1, help="the index of the run, the last by default")
+    args = parser.parse_args(argv)
+    chemicals = None
+    if args.plan:
+        with open(args.plan, "r") as f:
+            plan = json.load(f)
+        chemicals = {tuple(s): c for s, c in zip(plan["sources"], plan["chemical_names"])}
+    print(format_summary(summarize(read_trace(args.trace, args.run), chemicals)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
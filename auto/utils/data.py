@@ -96,31 +96,153 @@ def parse_output_data(
     return df
 
 
-def parse_metadata(experiment_path: str, db=None) -> pd.DataFrame:
+def parse_metadata(experiment_path: str, db=None, batch_number: int = None) -> pd.DataFrame:
     """Given the ourput metadata as a json, generate the csv file that is consistent with "OT-2_dispensing" table in database. 
+    The experiment_id is `batch_number` if given, else the next one of the database.
     """
     if not db:
         db = Database(db=TEST_DB)
     metadata_path = os.path.join(experiment_path, "metadata.json")
     metadata = json.load(open(metadata_path, "r"))
-    metadata["experiment_id"] = get_new_batch_number(source="lab", db=db)
+    if batch_number is None:
+        batch_number = get_new_batch_number(source="lab", db=db)
+    metadata["experiment_id"] = batch_number
     mdf = pd.DataFrame(metadata, index=[0])
     return mdf
 
 
-def ask_for_composition_id(trial=0):
-    """Helper function to get the composition_id for the training set. 
-    Repeat until a valid integer is given."""
-    
-    if trial == 3:
-        raise ValueError("You have tried 3 times, please contact the administrator for help.")
-    try:
+def ask_for_composition_id(composition_id=None, attempts=3) -> int:
+    """Helper function to get the composition_id for the training set. A given `composition_id`
+    is returned without asking, otherwise ask until a valid integer is given."""
+    if composition_id is not None:
+        return int(composition_id)
+    for _ in range(attempts):
         comp_id = input("Please introduce the Composition_id for this training set round:\n>> ")
-        trial += 1
-        return int(comp_id)
-    except:
-        print("Composition_id needs to be an integer, try again!\r")
-        return ask_for_composition_id(trial=trial)
+        try:
+            return int(comp_id)
+        except ValueError:
+            print("Composition_id needs to be an integer, try again!\r")
+    raise ValueError(f"You have tried {attempts} times, please contact the administrator for help.")
+
+
+def within_constraints(x: np.ndarray, constraints: list) -> np.ndarray:
+    """Return whether each recipe satisfies all the constraints, like
+    `AutomatDataset.check_constraint` but vectorized with numpy and without torch.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        The fractions of the recipes, of shape (N, M).
+    constraints : list
+        The constraints of `AutomatDataset.generate_constraints`: (name, (index, coeff, target)),
+        satisfied when sum(x[:, index] * coeff) > target, or equal to target if name starts with "eq:".
+
+    Returns
+    -------
+    mask : np.ndarray
+        Boolean array of shape (N,).
+    """
+    mask = np.ones(len(x), dtype=bool)
+    for name, (index, coeff, target) in constraints:
+        values = x[:, np.asarray(index)] @ np.asarray(coeff, dtype=float)
+        if name.startswith("eq:"):
+            mask &= np.isclose(values, float(target))
+        else:
+            mask &= values > float(target)
+    return mask
+
+
+def _unit_cube(n: int, dim: int, method: str, rng: np.random.Generator) -> np.ndarray:
+    """Draw `n` points in the unit cube of dimension `dim`."""
+    if method == "lhs": # one point in each of the n strata of every dimension
+        strata = rng.permuted(np.tile(np.arange(n), (dim, 1)), axis=1).T
+        return (strata + rng.random((n, dim))) / n
+    if method == "sobol":
+        try:
+            from scipy.stats import qmc
+        except ModuleNotFoundError:
+            raise ValueError("scipy is required for Sobol sampling.")
+        return qmc.Sobol(dim, seed=rng).random(n)
+    raise ValueError(f"Unknown sampling method '{method}', use 'dirichlet', 'lhs' or 'sobol'.")
+
+
+def sample_recipes(
+        n: int,
+        num_chemical: int,
+        method: str = "dirichlet",
+        seed=None,
+        constraints: list = None,
+        alpha: float = 1.0,
+        max_rounds: int = 100
+    ) -> np.ndarray:
+    """Draw random recipes (fractions summing to 1) in one batch.
+
+    Parameters
+    ----------
+    n : int
+        The number of recipes.
+    num_chemical : int
+        The number of chemicals of each recipe.
+    method : str, optional
+        "dirichlet" for independent draws from a Dirichlet(`alpha`) distribution, or "lhs" (Latin
+        hypercube) and "sobol" for space-filling designs. The space-filling points of the unit cube
+        are mapped to the simplex by normalizing their exponential transforms, which gives the
+        uniform distribution on the simplex.
+    seed : int or np.random.Generator, optional
+        The seed of the random generator, for reproducible recipes.
+    constraints : list, optional
+        Recipes outside the constraints are rejected and drawn again, see `within_constraints`.
+    alpha : float, optional
+        The concentration of the Dirichlet distribution.
+    max_rounds : int, optional
+        The largest number of batches drawn to replace the rejected recipes.
+
+    Returns
+    -------
+    x : np.ndarray
+        The fractions, of shape (n, num_chemical).
+
+    Raises
+    ------
+    ValueError
+        If not enough recipes satisfy the constraints after `max_rounds` batches.
+    """
+    rng = np.random.default_rng(seed)
+    batches, accepted = [], 0
+    for _ in range(max_rounds):
+        size = n if not batches else max(2 * (n - accepted), 64) # top up the rejected recipes
+        if method == "dirichlet":
+            x = rng.dirichlet(np.full(num_chemical, alpha), size=size)
+        else:
+            x = -np.log1p(-_unit_cube(size, num_chemical, method, rng))
+            x /= x.sum(axis=1, keepdims=True)
+        if constraints:
+            x = x[within_constraints(x, constraints)]
+        batches.append(x)
+        accepted += len(x)
+        if accepted >= n:
+            return np.concatenate(batches)[:n]
+    raise ValueError(f"Only {accepted} of {n} recipes satisfy the constraints.")
+
+
+def generate_random_training_set(
+        num_recipe: int = 16,
+        num_chemical: int = 16,
+        total_volume_mL: float = TOTAL_VOLUME_mL,
+        max_num_chemical: int = 16,
+        **kwargs
+    ) -> pd.DataFrame:
+    """Generate random candidate recipes in the format of the training set, with the volumes in
+    milliliters. Only the first `num_chemical` chemicals are used. `kwargs` are passed to
+    `sample_recipes`, e.g. `seed`, `method` or `constraints`.
+    """
+    x = np.zeros((num_recipe, max_num_chemical))
+    x[:, :num_chemical] = sample_recipes(num_recipe, num_chemical, **kwargs) * total_volume_mL
+    df = pd.DataFrame(x, columns=[f"Chemical{i+1}" for i in range(max_num_chemical)])
+    df.insert(0, "unique_id", None)
+    for c in ["Conductivity", "Temperature", "Time"]:
+        df[c] = None
+    return df
 
 
 def generate_training_set(
@@ -128,7 +250,10 @@ def generate_training_set(
         max_num_chemical: int = 16,
         num_chemical: int = 16,
         total_volume_mL: int = TOTAL_VOLUME_mL,
-        stock_solution_indices: list = []
+        stock_solution_indices: list = [],
+        seed=None,
+        method: str = "dirichlet",
+        constraints: list = None
     ) -> pd.DataFrame:
     """Generate a random initial training set for the SDWF experiment. 
 
@@ -144,37 +269,146 @@ def generate_training_set(
         The total volume in milliliters for each recipe. Default is TOTAL_VOLUME_mL.
     stock_solution_indices : list, optional
         The indices of stock solutions to measure. Default is an empty list.
+    seed : int or np.random.Generator, optional
+        The seed of the random recipes.
+    method, constraints : optional
+        The sampling method and the constraints of the random recipes, see `sample_recipes`.
 
     Returns
     -------
     df : pandas.DataFrame
         The training set. Its format is defined in Table 1 in the proposal.
     """
-    df_list = []
     chemical_names = [f"Chemical{i+1}" for i in range(max_num_chemical)]
     num_recipe = len(stock_solution_indices) if stock_solution_indices else num_recipe
     
-    for i in range(num_recipe):
-        unique_id = [None] # unique_id is None because it is not generated by Machine learning
-        if i == 0 or i == num_recipe - 1: # the first and last recipes are dummy solutions
-            percentage_composition = np.ones(max_num_chemical) / max_num_chemical
-        else:
-            percentage_composition = np.zeros(max_num_chemical)
-            if stock_solution_indices: # create recipes for stock solutions only
-                percentage_composition[stock_solution_indices[i] - 1] = 1
-            else: # create random recipes with only `num_chemical` chemicals activated
-                percentage_composition[:num_chemical] = np.random.dirichlet(np.ones(num_chemical), size=1).squeeze()
-        volume_composition = list(percentage_composition * total_volume_mL * FACTOR)
-        other = [None, None, None]
-        row = unique_id + volume_composition + other 
-        df_list.append(row)
+    percentage_composition = np.zeros((num_recipe, max_num_chemical))
+    if stock_solution_indices: # create recipes for stock solutions only
+        rows = np.arange(num_recipe)
+        percentage_composition[rows, np.asarray(stock_solution_indices) - 1] = 1
+    else: # create random recipes with only `num_chemical` chemicals activated
+        percentage_composition[:, :num_chemical] = sample_recipes(
+            num_recipe, num_chemical, method=method, seed=seed, constraints=constraints
+        )
+    # the first and last recipes are dummy solutions
+    percentage_composition[[0, -1]] = 1 / max_num_chemical
     
-    df = pd.DataFrame(
-        df_list, 
-        columns=['unique_id'] + chemical_names + ['Conductivity', "Temperature", "Time"])
+    df = pd.DataFrame(percentage_composition * total_volume_mL * FACTOR, columns=chemical_names)
+    df.insert(0, "unique_id", None) # unique_id is None because it is not generated by Machine learning
+    for c in ["Conductivity", "Temperature", "Time"]:
+        df[c] = None
     return df
 
 
+def _compare_recipes(composition_id, db:Database) -> tuple:
+    """Compare the predictions in "ml_mtls" with the measurements in "measured_cond"."""
+    df_ml = db.pull(table="ml_mtls")
+    df_mc = db.pull(table="measured_cond")
+    
+    if composition_id is not None:
+        df_ml = df_ml.loc[df_ml["Composition_id"] == composition_id]
+        df_mc = df_mc.loc[df_mc["Composition_id"] == composition_id]
+    
+    mc_ids = df_mc["ml_id"].values
+    ml_ids = df_ml["unique_id"].values
+    
+    new_ml_ids = list(set(ml_ids) - set(mc_ids)) # recipes in ml_mtls but not in measured_cond
+    new_mc_ids = list(set(mc_ids) - set(ml_ids)) # recipes in measured_cond but not in ml_mtls
+    return df_ml, mc_ids, ml_ids, new_ml_ids, new_mc_ids
+
+
+def pending_recipes(composition_id=None, db:Database=None) -> pd.DataFrame:
+    """Return the predicted recipes of a composition_id which are not measured yet, in the
+    order of "ml_mtls" and in the format of `parse_input_data`. Unlike `get_new_recipes`, it does
+    not ask anything, so it can be polled.
+    """
+    if not db:
+        db = Database(db=TEST_DB)
+    df_ml, _, _, new_ml_ids, _ = _compare_recipes(composition_id, db)
+    return parse_input_data(df_ml.loc[df_ml["unique_id"].isin(new_ml_ids)])
+
+
+def training_set(
+        training=None,
+        stock_solution_indices=None,
+        num_chemical=16,
+        num_recipe=16,
+        max_num_recipe=16,
+        max_num_chemical=16,
+        seed=None,
+        method="dirichlet",
+        constraints=None
+    ) -> pd.DataFrame:
+    """Generate the training set of a composition without predictions, without asking anything.
+
+    Parameters
+    ----------
+    training : str, optional
+        "stock" to measure stock solutions, "random" for random recipes, None for no training set.
+    stock_solution_indices : list[int], optional
+        The indices (1~`max_num_chemical`) of the stock solutions to measure. The default is all.
+    num_chemical, num_recipe : int, optional
+        The number of chemicals and recipes of a random training set, capped by
+        `max_num_chemical` and `max_num_recipe`.
+    max_num_chemical, max_num_recipe : int, optional
+        The number of chemicals of a recipe and of recipes of a plate.
+    seed : int or np.random.Generator, optional
+        The seed of the random recipes, to draw the same training set again.
+    method : str, optional
+        The sampling method of the random recipes, "dirichlet", "lhs" or "sobol", see
+        `sample_recipes`.
+    constraints : list, optional
+        The constraints of the random recipes on their `num_chemical` fractions, see
+        `within_constraints`.
+
+    Returns
+    -------
+    df_input : pandas.DataFrame
+        The training set, empty if `training` is None.
+
+    Raises
+    ------
+    ValueError
+        If `training` or a stock solution index is not valid, or if not enough random recipes
+        satisfy the constraints.
+    """
+    if training is None:
+        return pd.DataFrame()
+    if training == "stock":
+        stock_solution_indices = list(stock_solution_indices or range(1, max_num_chemical + 1))
+        if not all(1 <= i <= max_num_chemical for i in stock_solution_indices):
+            raise ValueError(f"Stock solution indices must be between 1 and {max_num_chemical}.")
+        num_chemical = num_recipe = len(stock_solution_indices)
+    elif training == "random":
+        stock_solution_indices = []
+        num_chemical = min(num_chemical, max_num_chemical)
+        num_recipe = min(num_recipe, max_num_recipe)
+    else:
+        raise ValueError(f"Unknown training set '{training}', use 'stock' or 'random'.")
+    return generate_training_set(
+        num_recipe=num_recipe,
+        max_num_chemical=max_num_chemical,
+        num_chemical=num_chemical,
+        stock_solution_indices=stock_solution_indices,
+        seed=seed,
+        method=method,
+        constraints=constraints
+    )
+
+
+def select_recipes(composition_id=None, db=None, **kwargs) -> pd.DataFrame:
+    """Return the new recipes of a composition_id without asking anything: the predictions which
+    are not measured yet if there are any, else the training set described by `kwargs` (see
+    `training_set`), which is empty by default.
+    """
+    if not db:
+        db = Database(db=TEST_DB)
+    df_input = pending_recipes(composition_id, db=db)
+    if not df_input.empty:
+        return df_input
+    return training_set(**kwargs)
+
+
 def get_new_recipes(
         composition_id=None, 
         db=None, 
@@ -182,90 +416,64 @@ def get_new_recipes(
         max_num_chemical=16
     ) -> pd.DataFrame:
     """
-    Check if there are new recipes to run for the given composition_id.
+    Check if there are new recipes to run for the given composition_id, asking the user to confirm
+    and, when there are no new predictions, which training set to generate. This is the
+    interactive wrapper of `select_recipes`.
     
     This function pulls data from the "ml_mtls" table and compares it with data pulled from the "measured_cond" table.
     If for a given composition_id, there are recipes in "ml_mtls" but not in "measured_cond", it will return the new recipes.
-    Otherwise, it will return an empty DataFrame or raise an error if there are measurements but no machine learning data.
+    Otherwise, it will return an empty DataFrame or a generated training set.
     
     Args:
         composition_id (int, optional): The composition ID to check for new recipes. Defaults to None.
         db (Database, optional): The database object to use for pulling data. Defaults to None.
-        num_recipe (int, optional): The number of recipes to include in the training set. Defaults to 16.
-        num_chemical (int, optional): The number of chemicals to include in the training set. Defaults to 16.
+        max_num_recipe (int, optional): The maximum number of recipes in the training set. Defaults to 16.
+        max_num_chemical (int, optional): The maximum number of chemicals in the training set. Defaults to 16.
     
     Returns:
         pandas.DataFrame: The new recipes as a DataFrame if there are any, otherwise an empty DataFrame.
     
-    Raises:
-        ValueError: If there are machine learning data for the given composition_id but no measurements found in the database.
-    
     """
     if not db:
         db = Database(db=TEST_DB)
-    df_ml = db.pull(table="ml_mtls")
-    df_mc = db.pull(table="measured_cond")
-    
-    if composition_id is not None:
-        df_ml = df_ml.loc[df_ml["Composition_id"] == composition_id]
-        df_mc = df_mc.loc[df_mc["Composition_id"] == composition_id]
-    
-    mc_ids = df_mc["ml_id"].values
-    ml_ids = df_ml["unique_id"].values
-    
-    new_ml_ids = list(set(ml_ids) - set(mc_ids)) # recipes in ml_mtls but not in measured_cond
-    new_mc_ids = list(set(mc_ids) - set(ml_ids)) # recipes in measured_cond but not in ml_mtls
-    print(f"Found {len(mc_ids)} measurements and {len(ml_ids)} predictions for composition_id: {composition_id}")
-    print(f"{len(new_ml_ids)} predictions have yet to be measured.")
-    print(f"{len(new_mc_ids)} measurements are not found in ml_mtls table (They might be initial training set).")
-    id_ = input("Continue? [Enter] to proceed or type 'no' to exit. Type integer for a different composition ID.\n>> ")
-    if id_:
+    while True:
+        _, mc_ids, ml_ids, new_ml_ids, new_mc_ids = _compare_recipes(composition_id, db)
+        print(f"Found {len(mc_ids)} measurements and {len(ml_ids)} predictions for composition_id: {composition_id}")
+        print(f"{len(new_ml_ids)} predictions have yet to be measured.")
+        print(f"{len(new_mc_ids)} measurements are not found in ml_mtls table (They might be initial training set).")
+        id_ = input("Continue? [Enter] to proceed or type 'no' to exit. Type integer for a different composition ID.\n>> ")
+        if not id_:
+            break
         try:
-            return get_new_recipes(
-                composition_id=int(id_),
-                db=db,
-                max_num_recipe=max_num_recipe,
-                max_num_chemical=max_num_chemical
-            )
-        except:
+            composition_id = int(id_)
+        except ValueError:
             return pd.DataFrame()
 
     if new_ml_ids: # there are new recipes in machine learning data, these are the ones to measure
-        df_input = parse_input_data(df_ml.loc[df_ml["unique_id"].isin(new_ml_ids)])
         print(f"There are {len(new_ml_ids)} new recipes for composition_id: {composition_id}.")
-    else:
-        if not new_mc_ids: # Neither new measurements nor new predictions
-            print(f"No new predictions or measurements found for composition_id: {composition_id}.")
-        else: # New measurements that are not found in ml_mtls table
-            print(f"Found {len(new_mc_ids)} measurements for composition_id: {composition_id} that are not in machine learning data. They might be initial training sets.")
-        option = input("\nGenerating training set? \n1. Measure stock solutions.\n2. Generate random training set.\n3. Exit\n>> ")
-        try:
-            if int(option) == 1:
-                stock_solution_indices = input("Please provide the indices (1~16) of stock solutions to measure, separated by comma. [Enter] to measure all stock solutions.\n>> ").split(",")
-                if stock_solution_indices:
-                    stock_solution_indices = [int(i) for i in stock_solution_indices]
-                else:
-                    stock_solution_indices = [i for i in range(1, max_num_chemical + 1)]
-                num_chemical = len(stock_solution_indices)
-                num_recipe = len(stock_solution_indices)
-                if not num_recipe:
-                    raise ValueError("No stock solution indices provided. Exit.")
-            elif int(option) == 2:
-                stock_solution_indices = []
-                num_chemical = input("How many tock solutions to include in the training set? [Enter] for default number: 16\n>>")
-                num_chemical = 16 if not num_chemical else min(int(num_chemical), max_num_chemical)
-                num_recipe = input("How many new recipes to generate? [Enter] for default number: 16\n>>")
-                num_recipe = 16 if not num_recipe else min(int(num_recipe), max_num_recipe)
-            else:
-                raise ValueError("Exit")
-        except:
+        return select_recipes(composition_id, db=db)
+
+    if not new_mc_ids: # Neither new measurements nor new predictions
+        print(f"No new predictions or measurements found for composition_id: {composition_id}.")
+    else: # New measurements that are not found in ml_mtls table
+        print(f"Found {len(new_mc_ids)} measurements for composition_id: {composition_id} that are not in machine learning data. They might be initial training sets.")
+    option = input("\nGenerating training set? \n1. Measure stock solutions.\n2. Generate random training set.\n3. Exit\n>> ")
+    kwargs = {"max_num_recipe": max_num_recipe, "max_num_chemical": max_num_chemical}
+    try:
+        if int(option) == 1:
+            indices = input("Please provide the indices (1~16) of stock solutions to measure, separated by comma. [Enter] to measure all stock solutions.\n>> ")
+            kwargs["training"] = "stock"
+            kwargs["stock_solution_indices"] = [int(i) for i in indices.split(",") if i.strip()]
+        elif int(option) == 2:
+            kwargs["training"] = "random"
+            num_chemical = input("How many tock solutions to include in the training set? [Enter] for default number: 16\n>>")
+            kwargs["num_chemical"] = int(num_chemical) if num_chemical else 16
+            num_recipe = input("How many new recipes to generate? [Enter] for default number: 16\n>>")
+            kwargs["num_recipe"] = int(num_recipe) if num_recipe else 16
+        else:
             return pd.DataFrame()
-            
-        df_input = generate_training_set(
-            num_recipe=num_recipe, 
-            num_chemical=num_chemical, 
-            stock_solution_indices=stock_solution_indices
-        )
-        print(f"{num_recipe} new recipes are generated for composition_id: {composition_id}.")
-    
+        df_input = training_set(**kwargs)
+    except ValueError:
+        return pd.DataFrame()
+    print(f"{len(df_input)} new recipes are generated for composition_id: {composition_id}.")
     return df_input
@@ -1,15 +1,28 @@
 from __future__ import print_function, division
 import os
-import torch
-import yaml
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from torch.utils.data import Dataset
-from btgenerate.database.database import Database
+# torch, yaml, matplotlib and the database backend are heavy to import, so they are imported
+# inside the functions that need them. Importing this module only costs pandas and numpy.
+
+
+_TORCH_DATA = ["Dataset", "DataLoader", "BatchSampler", "RandomSampler", "SequentialSampler"]
+
+
+def __getattr__(name):
+    """Resolve the torch constants `DTYPE` and `DEVICE`, and the classes of `torch.utils.data`
+    formerly imported here, on first access."""
+    if name in _TORCH_DATA:
+        import torch.utils.data
+        return getattr(torch.utils.data, name)
+    if name == "DTYPE":
+        import torch
+        return torch.double
+    if name == "DEVICE":
+        import torch
+        return torch.device("cuda:3" if torch.cuda.is_available() else "cpu")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-DTYPE =  torch.double
-DEVICE = torch.device("cuda:3" if torch.cuda.is_available() else "cpu")
 
 _name_dict = {
     "1,2-dimethoxyethane": "DME",
@@ -18,19 +31,30 @@ _name_dict = {
     "Lithium Perchlorate": "LiClO4"
 }
 
-class AutomatDataset(Dataset):
+class AutomatDataset():
     def __init__(self, df=None, database:str="", table:str=""):
         self.database = None
         self.table = None
         self._df = df
-        if not df:
+        self._invalidate_cache()
+        if df is None:
             self.get_data(database=database, table=table)
         
     @property
     def dataframe(self):
+        """A copy of the main dataframe that is safe to modify. Use `view` for read-only access.
+        """
         return self._df.copy()
+
+    @property
+    def view(self):
+        """The main dataframe itself, without copying. It must be treated as read-only: modify
+        `dataframe` instead, or call `_invalidate_cache()` after changing it in place.
+        """
+        return self._df
     
     def get_data(self, database:str=None, table:str=None):
+        from btgenerate.database.database import Database
         try:
             df=Database(db=database).pull(table=table)
         except:
@@ -39,6 +63,16 @@ class AutomatDataset(Dataset):
             self._df = df.copy()
             self.database = database
             self.table = table
+            self._invalidate_cache()
+
+    def _invalidate_cache(self):
+        """Drop everything derived from `self._df`. Call it whenever `self._df` is replaced or
+        modified in place.
+        """
+        self._space_index = None
+        self._chemical_names = None
+        self._chemical_matrix = None
+        self._electrolyte_id_array = None
             
 
 class ChemicaltDataset(AutomatDataset):
@@ -86,6 +120,7 @@ class ChemicaltDataset(AutomatDataset):
         :param limit: str. One of "hi" (upper limit), "lo" (lower limit), or "eq" (equality)
         """
 
+        import torch
         name = f"{limit}_{state}"
         if state == "carbonate":
             states = self.find_by_space(chemicals, property="chemical_tag")
@@ -99,8 +134,8 @@ class ChemicaltDataset(AutomatDataset):
             threshold = (-1) * threshold
         constraint = (
             torch.tensor(state_indices, dtype=int),
-            torch.tensor(coefficients, dtype=DTYPE),
-            torch.tensor(threshold, dtype=DTYPE)
+            torch.tensor(coefficients, dtype=torch.double),
+            torch.tensor(threshold, dtype=torch.double)
         )
         return name, constraint
 
@@ -108,6 +143,8 @@ class ChemicaltDataset(AutomatDataset):
     def generate_constraint(self, chemicals, path=None, reduce=True):
         """Load the constraint configuration file and generate a list of constraints accordingly.
         """
+        import torch
+        import yaml
         if path is None:
             path = os.path.join(os.path.dirname(__file__), "constraint.yaml")
         with open(path, "r") as f:
@@ -118,8 +155,8 @@ class ChemicaltDataset(AutomatDataset):
                 "eq: sum_to_one",
                 (
                     torch.arange(dim, dtype=int), 
-                    torch.ones(dim, dtype=DTYPE), 
-                    torch.tensor(1, dtype=DTYPE)
+                    torch.ones(dim, dtype=torch.double), 
+                    torch.tensor(1, dtype=torch.double)
                 )
             )
         ]
@@ -150,6 +187,7 @@ class ChemicaltDataset(AutomatDataset):
         NOTE: input `x` has to be generated by BO process using `constraints`. There is no efficient
         way of forcing this requirement, so jsut keep in mind!
         """
+        import torch
         x = torch.tensor(x) # make sure x is a Tensor because constraints are of Tensor type. 
 
         within_constraints = []
@@ -198,6 +236,7 @@ class ChemicaltDataset(AutomatDataset):
                     self.chemical_names.append(new)
             # Update dataframe
             self._df = df_copy
+            self._invalidate_cache()
         else:
             return df_copy
 
@@ -208,10 +247,6 @@ class RecipeDataset(AutomatDataset):
         super().__init__(df=df, database=database, table=table)
         self.map_names() # standardize column names and chemical names
 
-    @property
-    def dataframe(self):
-        return self._df.copy()
-
     def __len__(self):
         return len(self._df)
 
@@ -226,17 +261,46 @@ class RecipeDataset(AutomatDataset):
     def chemical_names(self):
         """ Return column names that are chemicals
         """
-        return self._df.columns[~self._df.columns.isin(self.info_columns)].tolist()
+        if self._chemical_names is None:
+            self._chemical_names = self._df.columns[~self._df.columns.isin(self.info_columns)].tolist()
+        return list(self._chemical_names)
+
+    @property
+    def chemical_matrix(self):
+        """The amount of each chemical (columns in the order of `chemical_names`) as a read-only
+        float array with missing values filled with 0. Cached until the dataframe changes.
+        """
+        if self._chemical_matrix is None:
+            matrix = self._df.loc[:, self.chemical_names].fillna(0).to_numpy(dtype=float)
+            matrix.flags.writeable = False
+            self._chemical_matrix = matrix
+        return self._chemical_matrix
+
+    @property
+    def electrolyte_id_array(self):
+        """The electrolyte ID's as a read-only array. Cached until the dataframe changes.
+        """
+        if self._electrolyte_id_array is None:
+            array = self._df.loc[:, self.electrolyte_id_col].to_numpy(dtype=object)
+            array.flags.writeable = False
+            self._electrolyte_id_array = array
+        return self._electrolyte_id_array
     
     @property
     def chemicals(self):
-        df_copy = self.dataframe.fillna(0)
-        return df_copy.loc[:, self.chemical_names]
+        """Read-only dataframe of the chemicals backed by `chemical_matrix`. Call `.copy()` on
+        it before modifying.
+        """
+        return pd.DataFrame(
+            self.chemical_matrix, index=self._df.index, columns=self.chemical_names, copy=False
+        )
     
     @property
     def electrolyte_ids(self):
-        df_copy = self._df.copy()
-        return df_copy.loc[:, self.electrolyte_id_col]
+        """Read-only series of electrolyte ID's backed by `electrolyte_id_array`."""
+        return pd.Series(
+            self.electrolyte_id_array, index=self._df.index, name=self.electrolyte_id_col, copy=False
+        )
 
     @property
     def targets(self):
@@ -254,28 +318,23 @@ class RecipeDataset(AutomatDataset):
             dataframe: The renamed dataframe. 
         """
         global _name_dict
-        df_copy = self._df.copy()
 
-        if "electrolyte_id" in df_copy.columns:
+        if "electrolyte_id" in self._df.columns:
             self.electrolyte_id_col = "electrolyte_id"
-        elif "Electrolyte ID" in df_copy.columns:
+        elif "Electrolyte ID" in self._df.columns:
             self.electrolyte_id_col = "Electrolyte ID"
         else:
             self.electrolyte_id_col = None
 
         if name_dict is not None:
             _name_dict = name_dict
-        df_copy.rename(columns=_name_dict, inplace=True)
+        df_renamed = self._df.rename(columns=_name_dict) # renaming does not touch the values
         if inplace:
-            # Update chemical names
-            for old, new in _name_dict.items():
-                if old in self.chemical_names:
-                    self.chemical_names.remove(old)
-                    self.chemical_names.append(new)
-            # Update dataframe
-            self._df = df_copy
+            # Update dataframe, chemical names are derived from it
+            self._df = df_renamed
+            self._invalidate_cache()
         else:
-            return df_copy
+            return df_renamed
 
 
     def normalize(self, by="total_mass(g)", inplace=False):
@@ -293,15 +352,18 @@ class RecipeDataset(AutomatDataset):
         df : pandas.DataFrame
             The recipe of the experiment with normalized amount.
         """
+        chemical_names = self.chemical_names
         _df = self._df.copy()
-        total_mass = _df[self.chemical_names].sum(axis=1).to_numpy().reshape(-1, 1)
-        components = _df[self.chemical_names].to_numpy()
-        normalized_components = components / total_mass
+        total_mass = self.chemical_matrix.sum(axis=1).reshape(-1, 1)
+        # missing values stay missing inplace, the returned copy is filled with 0
+        components = _df.loc[:, chemical_names].to_numpy(dtype=float)
         if by is not None:
             _df[by] = 1
-        _df[self.chemical_names] = normalized_components
+        with np.errstate(divide="ignore", invalid="ignore"): # a zero total gives 0 once filled
+            _df[chemical_names] = components / total_mass
         if inplace:
             self._df = _df
+            self._invalidate_cache()
         else:
             return _df.fillna(0)
     
@@ -327,24 +389,81 @@ class RecipeDataset(AutomatDataset):
         return df_amount
     
 
+    @property
+    def space_index(self):
+        """The sub-space index of the recipes, built on first use.
+
+        Returns
+        -------
+        masks : numpy.ndarray
+            One integer per recipe (row position) whose bit `k` is set if
+            `self.chemical_names[k]` is non-zero in that recipe.
+        spaces : dict
+            Inverted index mapping each distinct mask to the row positions sharing it.
+        """
+        if self._space_index is None:
+            present = self.chemical_matrix > 0
+            # Pack the presence matrix into bytes and read each row as one (arbitrary-size) integer
+            packed = np.packbits(present, axis=1, bitorder="little")
+            masks = np.array([int.from_bytes(row.tobytes(), "little") for row in packed], dtype=object)
+            spaces = {}
+            for i, mask in enumerate(masks):
+                spaces.setdefault(mask, []).append(i)
+            spaces = {mask: np.array(rows, dtype=int) for mask, rows in spaces.items()}
+            self._space_index = (masks, spaces)
+        return self._space_index
+
+    def space_to_mask(self, space):
+        """Convert a chemical name or a list of chemical names to its sub-space bitmask."""
+        space = [space] if type(space) is str else list(space)
+        chemical_names = self.chemical_names
+        mask = 0
+        for chemical in space:
+            if chemical not in chemical_names:
+                raise KeyError(f"{chemical} is not a chemical in the dataset.")
+            mask |= 1 << chemical_names.index(chemical)
+        return mask
+
+    def mask_to_space(self, mask):
+        """Convert a sub-space bitmask back to the list of chemical names it contains."""
+        return [c for k, c in enumerate(self.chemical_names) if (mask >> k) & 1]
+
+    def select_by_space(self, space, sub_space=False, super_space=False):
+        """Return the row positions of the recipes that fall in the given space. See
+        `find_by_component` for the meaning of `sub_space` and `super_space`.
+        """
+        query = self.space_to_mask(space)
+        _, spaces = self.space_index
+        if sub_space: # recipes whose components are all within the given space
+            rows = [r for mask, r in spaces.items() if mask & ~query == 0]
+        elif super_space: # recipes that contain every component of the given space
+            rows = [r for mask, r in spaces.items() if mask & query == query]
+        else: # recipes that contain exactly the given space
+            rows = [spaces[query]] if query in spaces else []
+        if not rows:
+            return np.array([], dtype=int)
+        return np.sort(np.concatenate(rows))
+
+    def _rows_by_eid(self, electrolyte_ids):
+        """Return the row positions of the given electrolyte ID's, in the order of the table."""
+        return np.flatnonzero(pd.Index(self.electrolyte_id_array).isin(list(electrolyte_ids)))
+
+    def _space_of(self, rows):
+        """Return the chemicals that are non-zero in any of the recipes at `rows`."""
+        masks, _ = self.space_index
+        space_mask = 0
+        for mask in masks[rows]:
+            space_mask |= mask
+        return self.mask_to_space(space_mask)
+
     def find_by_component(self, space, sub_space=False, super_space=False, target="LCE"):
         """ If `sub_space`, select all recipies that contain at least the given space, otherwise
         the recipes that contain at most the given space.
         If not `inclusive`, all components in `space` should be non-zero, otherwise subspaces of 
         `space` is also selected. Only works if `sub_space` is `False`.
         """
-        _df = self.dataframe.fillna(0)
-        present_chemicals = [space] if type(space) is str else list(space)
-        absent_chemicals = [c for c in self.chemical_names if c not in space]
-        select1 = (_df.loc[:, absent_chemicals] == 0).all(axis=1) # contains sub_space
-        select2 = (_df.loc[:, present_chemicals] > 0).all(axis=1) # contains super_space
-        if sub_space: # recipes that contain at least the given space
-            select = select1
-        elif super_space: # recipes that contain at most the given space
-            select = select2
-        else: # recipes that contain exactly the given space (all should be non-zero)
-            select = select1 & select2
-        eids = self.electrolyte_ids.loc[select].tolist()
+        rows = self.select_by_space(space, sub_space=sub_space, super_space=super_space)
+        eids = self.electrolyte_id_array[rows].tolist()
         return self.find_by_eid(eids, target=target)
 
     def find_by_eid(self, electrolyte_ids, show_space=False, target="LCE"):
@@ -353,11 +472,8 @@ class RecipeDataset(AutomatDataset):
         """
         if type(electrolyte_ids) is str:
             electrolyte_ids = [electrolyte_ids]
-        _df = self.dataframe.fillna(0)
-        indices = _df.index[self.electrolyte_ids.isin(electrolyte_ids)]
-        all_chemicals = self.chemicals.loc[indices]
-        absent_chemicals = all_chemicals.columns[(all_chemicals == 0).all(axis=0)].tolist()
-        present_chemicals = [c for c in self.chemical_names if c not in absent_chemicals]
+        rows = self._rows_by_eid(electrolyte_ids)
+        present_chemicals = self._space_of(rows)
         if show_space:
             return present_chemicals
         if target == "all":
@@ -365,16 +481,66 @@ class RecipeDataset(AutomatDataset):
         elif type(target) is str or target is None:
             target =  [target]
         target = [t for t in target if t in self.info_columns]
+        chemical_names = self.chemical_names
+        columns = [chemical_names.index(c) for c in present_chemicals] # Only chemicals in presence.
         df_reduced = pd.concat(
             [
-                self.electrolyte_ids.loc[indices],
-                # Only chemicals in presence.
-                self.chemicals.loc[indices, ~all_chemicals.columns.isin(absent_chemicals)],
-                _df.loc[indices, target]
+                self.electrolyte_ids.iloc[rows],
+                pd.DataFrame(
+                    self.chemical_matrix[np.ix_(rows, columns)],
+                    index=self._df.index[rows],
+                    columns=present_chemicals
+                ),
+                self._df.iloc[rows].loc[:, target].fillna(0)
             ], axis=1
         )
         return df_reduced
 
+    def export_arrays(self, electrolyte_ids=None, target="LCE", path=None):
+        """Materialize the chemicals (X) and the targets (y) of the given recipes in one pass, as
+        contiguous float64 arrays ready for training. Only the chemicals present in the selected
+        recipes are kept and recipes with a missing target are dropped.
+
+        Parameters
+        ----------
+        electrolyte_ids : list, optional
+            The electrolyte ID's to export. The default is `None`, which exports all recipes.
+        target : str or list, optional
+            The target column(s). If it is a string `y` is 1-D. The default is "LCE".
+        path : str, optional
+            If given, save "X.npy", "y.npy" and "chemicals.json" into this directory and return
+            the arrays memory-mapped from the saved files.
+
+        Returns
+        -------
+        X : numpy.ndarray
+            Shape (N, M), the amount of each chemical.
+        y : numpy.ndarray
+            Shape (N,) or (N, T), the targets.
+        chemicals : list
+            The M chemical names, in the order of the columns of `X`.
+        """
+        targets = [target] if type(target) is str else list(target)
+        if electrolyte_ids is None:
+            rows = np.arange(len(self._df))
+        else:
+            rows = self._rows_by_eid(electrolyte_ids)
+        chemicals = self._space_of(rows)
+        columns = [self.chemical_names.index(c) for c in chemicals]
+        y = self._df.iloc[rows].loc[:, targets].to_numpy(dtype=np.float64)
+        keep = ~np.isnan(y).any(axis=1)
+        X = np.ascontiguousarray(self.chemical_matrix[np.ix_(rows[keep], columns)])
+        y = np.ascontiguousarray(y[keep, 0] if type(target) is str else y[keep])
+        if path is not None:
+            from auto.utils.tensor_dataset import RecipeTensorDataset
+            return RecipeTensorDataset(X, y, chemicals).save(path, mmap=True).arrays
+        return X, y, chemicals
+
+    def to_tensor_dataset(self, electrolyte_ids=None, target="LCE", path=None):
+        """Export the recipes with `export_arrays` and wrap them in a `RecipeTensorDataset`."""
+        from auto.utils.tensor_dataset import RecipeTensorDataset
+        return RecipeTensorDataset(*self.export_arrays(electrolyte_ids, target=target, path=path))
+
     def find_similar(
             self, 
             electrolyte_id, 
@@ -397,21 +563,16 @@ class RecipeDataset(AutomatDataset):
             return similar_space
         if type(tolerance) is float: # convert universal tolerance to chemical specific 
             tolerance = {c: tolerance for c in space}
-        similar_recipes = []
         base = df_reduced.iloc[0]
-        for idx, row in similar_space.iterrows():
-            # caculate teh percentage difference of each chemicals 
-            for chemical, t in tolerance.items():
-                percentage_diff = abs(row[chemical] - base[chemical]) / base[chemical]
-                if percentage_diff > t: # all differences should be smaller than tolerance
-                    break
-            else: # if loop finished, that means the recipe is similar to base
-                similar_recipes.append(similar_space.loc[[idx]])
-        if len(similar_recipes) == 0:
-            similar_recipes = df_reduced
-        else:
-            similar_recipes = pd.concat(similar_recipes, axis=0)
-        return similar_recipes
+        chemicals = list(tolerance.keys())
+        # caculate the percentage difference of each chemicals, all should be within tolerance
+        values = similar_space.loc[:, chemicals].to_numpy(dtype=float)
+        base_values = base[chemicals].to_numpy(dtype=float)
+        percentage_diff = np.abs(values - base_values) / base_values
+        select = (percentage_diff <= np.array(list(tolerance.values()))).all(axis=1)
+        if not select.any():
+            return df_reduced
+        return similar_space.loc[select]
 
 
     def parallel_plot(
@@ -424,6 +585,7 @@ class RecipeDataset(AutomatDataset):
         ):
         """Generate a parallel plot of non-zero components and LCE given a list of electrolyte ID's.
         """
+        import matplotlib.pyplot as plt
         _df = self.find_by_eid(electrolyte_ids, target=target)
         if fig is None:
             fig, ax = plt.subplots(figsize=(_df.shape[1]-1, 4))
@@ -474,13 +636,9 @@ class LiquidMasterTableDataset(RecipeDataset):
         ]
     
     def export_data(self, electrolyte_ids=None, target="LCE"):
-        if electrolyte_ids is not None:
-            _df = self.find_by_eid(list(electrolyte_ids), target="all")
-        chemicals = [c for c in _df.columns if c in self.chemical_names]
-        _df.dropna(axis=0, how="any", subset=target, inplace=True)
-        X = torch.from_numpy(_df.loc[:, chemicals].to_numpy(dtype=float))
-        y = torch.from_numpy(_df.loc[:, target].to_numpy(dtype=float))
-        return X, y
+        import torch
+        X, y, _ = self.export_arrays(electrolyte_ids=electrolyte_ids, target=target)
+        return torch.from_numpy(X), torch.from_numpy(y)
 
 
 class BoExpMaterialsDataset(RecipeDataset):
@@ -0,0 +1,62 @@
+import os
+import json
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader, BatchSampler, RandomSampler, SequentialSampler
+
+
+class RecipeTensorDataset(Dataset):
+    """Training data held as contiguous float64 arrays (in memory or memory-mapped `.npy`).
+    Indexing with a list of indices returns a whole batch of tensors at once, so use it with
+    `loader` (or a `BatchSampler` and `batch_size=None`) to skip per-row overhead.
+    """
+    def __init__(self, X, y, chemicals=None):
+        assert len(X) == len(y), "X and y must have the same number of rows."
+        self.X = X
+        self.y = y
+        self.chemicals = list(chemicals) if chemicals is not None else []
+
+    @property
+    def arrays(self):
+        return self.X, self.y, self.chemicals
+
+    def __len__(self):
+        return len(self.X)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            return torch.tensor(self.X[idx]), torch.tensor(self.y[idx])
+        # sorted indices read memory-mapped files sequentially, the order within a batch is irrelevant
+        idx = np.sort(np.asarray(idx, dtype=int))
+        return torch.from_numpy(self.X[idx]), torch.from_numpy(self.y[idx])
+
+    def loader(self, batch_size=256, shuffle=True, drop_last=False, **kwargs):
+        """Return a `DataLoader` that fetches one batch per `__getitem__` call."""
+        sampler = RandomSampler(self) if shuffle else SequentialSampler(self)
+        return DataLoader(
+            self,
+            sampler=BatchSampler(sampler, batch_size=batch_size, drop_last=drop_last),
+            batch_size=None, # batches are already formed by the sampler
+            **kwargs
+        )
+
+    def save(self, path, mmap=False):
+        """Save the arrays into directory `path`. If `mmap`, switch to memory-mapped arrays."""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "X.npy"), np.ascontiguousarray(self.X, dtype=np.float64))
+        np.save(os.path.join(path, "y.npy"), np.ascontiguousarray(self.y, dtype=np.float64))
+        with open(os.path.join(path, "chemicals.json"), "w") as f:
+            json.dump(self.chemicals, f)
+        if mmap:
+            self.X, self.y, self.chemicals = self.load(path, mmap=True).arrays
+        return self
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load the arrays saved by `save`, memory-mapped (read-only) by default."""
+        mode = "r" if mmap else None
+        X = np.load(os.path.join(path, "X.npy"), mmap_mode=mode)
+        y = np.load(os.path.join(path, "y.npy"), mmap_mode=mode)
+        with open(os.path.join(path, "chemicals.json"), "r") as f:
+            chemicals = json.load(f)
+        return cls(X, y, chemicals)
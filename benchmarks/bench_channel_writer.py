@@ -0,0 +1,55 @@
+"""Time of recording the DC samples of four SquidStat channels, one csv line per sample (the
+former `WriteCSV`) against the buffered binary `ChannelWriter`, including its csv export.
+
+Usage:
+>>> python benchmarks/bench_channel_writer.py --samples 200000 --channels 4
+"""
+import os
+import time
+import argparse
+import tempfile
+from auto.squidstat import ChannelWriter, export_csv
+
+
+def write_csv_lines(folder, samples, channels):
+    files = [open(os.path.join(folder, f"csv_{c}.csv"), "w") for c in range(channels)]
+    for f in files:
+        f.write("Timestamp,Working Electrode Voltage,Current\n")
+    for k in range(samples):
+        for f in files:
+            f.write(",".join(str(v) for v in [k * 1e-3, k * 1e-4, k * 1e-6]) + "\n")
+    for f in files:
+        f.close()
+
+
+def write_buffered(folder, samples, channels, export=True):
+    writers = [
+        ChannelWriter(os.path.join(folder, f"bin_{c}.bin"), echo_interval=None) for c in range(channels)
+    ]
+    for k in range(samples):
+        for writer in writers:
+            writer.add(k * 1e-3, k * 1e-4, k * 1e-6)
+    for writer in writers:
+        writer.close()
+        if export:
+            export_csv(writer.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--samples", type=int, default=200000, help="samples per channel")
+    parser.add_argument("--channels", type=int, default=4)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as folder:
+        for name, function in [
+            ("csv line per sample", lambda: write_csv_lines(folder, args.samples, args.channels)),
+            ("buffered binary", lambda: write_buffered(folder, args.samples, args.channels, False)),
+            ("buffered binary + csv export", lambda: write_buffered(folder, args.samples, args.channels)),
+        ]:
+            start = time.perf_counter()
+            function()
+            print(f"{name:30s} {time.perf_counter() - start:7.3f} s")
+
+
+if __name__ == "__main__":
+    main()
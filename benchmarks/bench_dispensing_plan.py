@@ -0,0 +1,45 @@
+"""Build time of a dispensing plan for many chemicals and formulations spread over 96-well plates.
+
+Usage:
+>>> python benchmarks/bench_dispensing_plan.py --chemicals 96 --formulations 384
+"""
+import argparse
+import time
+import numpy as np
+from auto.plan import build_plan
+from auto.layout import plate_layout
+
+
+def make_formulations(formulations=384, chemicals=96, seed=0):
+    """Random formulations using a quarter of the chemicals each, up to 3 pipette volumes."""
+    rng = np.random.default_rng(seed)
+    volumes = rng.uniform(1, 3000, size=(formulations, chemicals))
+    volumes[rng.random((formulations, chemicals)) > 0.25] = 0
+    names = [f"Chemical{i}" for i in range(1, chemicals + 1)]
+    return [dict(unique_id=j, **dict(zip(names, row.tolist()))) for j, row in enumerate(volumes)], names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark build_plan")
+    parser.add_argument("--chemicals", type=int, default=96)
+    parser.add_argument("--formulations", type=int, default=384)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    formulations, names = make_formulations(args.formulations, args.chemicals)
+    plate_96 = {"wells": {f"{r}{c}": {} for r in "ABCDEFGH" for c in range(1, 13)}}
+    plates = {n: plate_96 for n in range(1, 12)}
+    n_plates = lambda n: list(plates)[: -(-n // 96)]
+    sources, blocks = plate_layout(n_plates(args.chemicals), plates)
+    targets, _ = plate_layout(n_plates(args.formulations)[::-1], plates)
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        plan = build_plan(formulations, names, sources, targets, blocks, volume_limit=float("inf"))
+        best = min(best, time.perf_counter() - start)
+    print(f"{args.formulations} formulations x {args.chemicals} chemicals")
+    print(f"build_plan {best * 1000:10.2f} ms, {len(plan)} actions in {plan.n_blocks} blocks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Import-time benchmark of the modules used by the CLI tools. Each module is imported in a fresh
+interpreter and the best of `--repeat` runs is reported, together with the heavy packages that
+ended up being loaded.
+
+Usage:
+>>> python benchmarks/bench_import_time.py --repeat 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = [
+    "auto.ot2",
+    "auto.robots",
+    "auto.utils.dataloader",
+    "auto.utils.database",
+    "auto.utils.data",
+    "scripts.sdwf_master",
+]
+HEAVY_PACKAGES = [
+    "torch", "matplotlib", "yaml", "sqlalchemy", "btgenerate", "pandas", "numpy", "serial"
+]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [p for p in {heavy!r} if p in sys.modules]}}))
+"""
+
+
+def import_time(module, repeat=5):
+    """Return the best import time (s) of `module` and the heavy packages it loaded."""
+    best, loaded = float("inf"), []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+            cwd=ROOT_DIR, capture_output=True, text=True
+        )
+        if out.returncode:
+            return None, out.stderr.strip().splitlines()[-1:]
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        best, loaded = min(best, result["seconds"]), result["loaded"]
+    return best, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark module import time")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+    for module in args.modules:
+        seconds, loaded = import_time(module, repeat=args.repeat)
+        if seconds is None:
+            print(f"{module:<25s} failed: {loaded}")
+        else:
+            print(f"{module:<25s} {seconds * 1000:8.1f} ms  heavy: {', '.join(loaded) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Latency and peak-memory benchmark of `RecipeDataset` queries on a synthetic table shaped
+like the Liquid Master Table.
+
+Usage:
+>>> python benchmarks/bench_recipe_dataset.py --rows 20000 --chemicals 80
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from auto.utils.dataloader import LiquidMasterTableDataset
+
+
+def make_table(rows=20000, chemicals=80, max_components=6, seed=0):
+    """Random sparse recipes: each row mixes 2 to `max_components` chemicals."""
+    rng = np.random.default_rng(seed)
+    amounts = np.full((rows, chemicals), np.nan)
+    for i in range(rows):
+        k = rng.integers(2, max_components + 1)
+        columns = rng.choice(chemicals, size=k, replace=False)
+        amounts[i, columns] = rng.dirichlet(np.ones(k))
+    df = pd.DataFrame(amounts, columns=[f"chemical_{j}" for j in range(chemicals)])
+    df.insert(0, "Electrolyte ID", [f"eid-{i}" for i in range(rows)])
+    for target in ["Conductivity", "Voltage", "Cycles", "LCE"]:
+        df[target] = rng.random(rows)
+    return df
+
+
+def measure(func, repeat=5):
+    """Return the best wall time (s) and the peak traced memory (MB) of `func`."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RecipeDataset queries")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--chemicals", type=int, default=80)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    ds = LiquidMasterTableDataset(df=make_table(rows=args.rows, chemicals=args.chemicals))
+    eid = ds.dataframe["Electrolyte ID"].iloc[0]
+    space = ds.find_by_eid(eid, show_space=True)
+    tensors = ds.to_tensor_dataset(target="LCE")
+    queries = {
+        "find_by_eid": lambda: ds.find_by_eid([eid], target="all"),
+        "find_by_component": lambda: ds.find_by_component(space, sub_space=True),
+        "find_similar": lambda: ds.find_similar(eid, tolerance=0.5),
+        "normalize": lambda: ds.normalize(),
+        "export_arrays": lambda: ds.export_arrays(target="LCE"),
+        "tensor_epoch": lambda: sum(len(X) for X, _ in tensors.loader(batch_size=256)),
+    }
+    print(f"{args.rows} recipes x {args.chemicals} chemicals")
+    for name, query in queries.items():
+        seconds, peak = measure(query, repeat=args.repeat)
+        print(f"{name:<20s} {seconds * 1000:10.2f} ms {peak:10.2f} MB peak")
+
+
+if __name__ == "__main__":
+    main()
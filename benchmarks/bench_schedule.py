@@ -0,0 +1,91 @@
+"""Simulated time of dispensing and measuring a plate, with the measurements after all the
+dispensing or interleaved with it (`OT2.schedule`). The clock of the dummy protocol context counts
+the delays of the protocol and a fixed time per instrument move. With --trace, the simulated time
+of the interleaved run is broken down per phase, chemical and well (`OT2.trace_summary`).
+
+Usage:
+>>> python benchmarks/bench_schedule.py --experiment scripts/sdwf_demo --move-time 2 --trace
+"""
+import os
+import csv
+import json
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+from auto import protocol_api
+from auto.ot2 import OT2
+from auto.telemetry import Tracer
+from auto.pump_raspi.raspi_comm import PumpController, RaspiChannel, RaspiStandIn
+
+
+class SimulatedConductivityMeter():
+    """Record the simulated time at which each formulation is measured."""
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.times = {}
+
+    def read_cond(self, uid, append=True, row=None):
+        self.times[uid] = self.protocol.elapsed
+
+
+def write_formulations(path, n_formulations, n_chemicals, seed=0):
+    """Random formulations, each mixing 2 to 6 chemicals."""
+    rng = np.random.default_rng(seed)
+    names = [f"Chemical{i}" for i in range(1, n_chemicals + 1)]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["unique_id"] + names)
+        for j in range(n_formulations):
+            volumes = np.zeros(n_chemicals)
+            chemicals = rng.choice(n_chemicals, size=rng.integers(2, 7), replace=False)
+            volumes[chemicals] = rng.integers(100, 2000, size=chemicals.size)
+            writer.writerow([j] + volumes.tolist())
+
+
+def run(config, formulation_path, interleave, move_time, pump_address):
+    protocol = protocol_api.ProtocolContext(move_time=move_time)
+    ot2 = OT2(protocol, config=config)
+    ot2.pump = PumpController(RaspiChannel(pump_address))
+    ot2.generate_dispensing_queue(formula_input_path=formulation_path, volume_limit=float("inf"))
+    ot2.tracer = Tracer(clock=lambda: protocol.elapsed)
+    cond_meter = SimulatedConductivityMeter(protocol)
+    with contextlib.redirect_stdout(None):
+        ot2.run_schedule(cond_meter, interleave=interleave)
+    times = sorted(cond_meter.times.values())
+    return protocol.elapsed, times[0], sum(times) / len(times), ot2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the interleaved schedule")
+    parser.add_argument("--experiment", default=os.path.join("scripts", "sdwf_demo"))
+    parser.add_argument("--move-time", type=float, default=2.0)
+    parser.add_argument("--trace", action="store_true", help="print the time per phase, chemical and well")
+    args = parser.parse_args()
+
+    os.chdir(args.experiment) # the labware definitions are next to the configuration
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    # track the stock volumes and the actions without saving them, every run starts with full sources
+    for section in ["inventory", "trace"]:
+        config["Robots"]["OT2"].get(section, {}).pop("file", None)
+    pump = RaspiStandIn() # the pump of the Raspberry Pi
+    pump.start()
+    ot2 = OT2(protocol_api.ProtocolContext(), config=config)
+    n_formulations, n_chemicals = len(ot2._target_locations), len(ot2._source_locations)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "experiment.csv")
+        write_formulations(path, n_formulations, n_chemicals)
+        print(f"{n_formulations} formulations x {n_chemicals} chemicals, {args.move_time} s per move")
+        for interleave in [False, True]:
+            total, first, mean, ot2 = run(config, path, interleave, args.move_time, pump.address)
+            name = "interleaved" if interleave else "serial"
+            print(f"{name:<12s} total {total / 60:7.1f} min, first result {first / 60:7.1f} min, "
+                  f"mean result latency {mean / 60:7.1f} min")
+        if args.trace:
+            print(ot2.trace_summary())
+    pump.close()
+
+
+if __name__ == "__main__":
+    main()
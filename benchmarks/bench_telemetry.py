@@ -0,0 +1,43 @@
+"""Overhead of recording the OT2 actions (`auto.telemetry`): the time of a call of an empty method,
+untraced, traced in memory and traced to a json lines file.
+
+Usage:
+>>> python benchmarks/bench_telemetry.py --calls 100000
+"""
+import os
+import time
+import argparse
+import tempfile
+from auto.telemetry import Tracer, traced
+
+
+class Arm():
+    def __init__(self, tracer=None):
+        self.tracer = tracer
+
+    @traced("dispense_chemical", "source", "target", "volume")
+    def dispense_chemical(self, source=(None, None), target=(None, None), volume=0, speed_factor=1):
+        pass
+
+
+def time_calls(arm, calls):
+    start = time.perf_counter()
+    for k in range(calls):
+        arm.dispense_chemical((5, "A1"), (6, "B2"), volume=k)
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--calls", type=int, default=100000, help="calls of the traced method")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tracer = Tracer(os.path.join(tmp_dir, "trace.jsonl"))
+        for name, arm in [("untraced", Arm()), ("in memory", Arm(Tracer())), ("json lines", Arm(tracer))]:
+            print(f"{name:<12s} {time_calls(arm, args.calls) * 1e6:6.1f} us per call")
+        tracer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Time of drawing candidate recipes with `sample_recipes`, for every sampling method, against
+the former loop of one `np.random.dirichlet` call per recipe.
+
+Usage:
+>>> python benchmarks/bench_training_set.py --recipes 100000 --chemicals 16
+"""
+import time
+import argparse
+import numpy as np
+from auto.utils.data import sample_recipes
+
+
+def loop_dirichlet(n, k):
+    return np.array([np.random.dirichlet(np.ones(k), size=1).squeeze() for _ in range(n)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--chemicals", type=int, default=16)
+    args = parser.parse_args()
+    n, k = args.recipes, args.chemicals
+    constraints = [("Chemical1 < 0.2", ([0], [-1.0], -0.2))]
+    cases = [
+        ("loop of dirichlet draws", lambda: loop_dirichlet(n, k)),
+        ("batched dirichlet", lambda: sample_recipes(n, k, seed=0)),
+        ("latin hypercube", lambda: sample_recipes(n, k, method="lhs", seed=0)),
+        ("dirichlet, Chemical1 < 0.2", lambda: sample_recipes(n, k, seed=0, constraints=constraints)),
+    ]
+    try:
+        import scipy # noqa: F401
+        cases.append(("sobol", lambda: sample_recipes(n, k, method="sobol", seed=0)))
+    except ModuleNotFoundError:
+        print("scipy is not installed, skipping sobol")
+    for name, function in cases:
+        start = time.perf_counter()
+        function()
+        print(f"{name:30s} {time.perf_counter() - start:7.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,10 +8,13 @@ import argparse
 
 def main():
 
-    # Parse config file and ask user for work_dir and experiment_name
+    # Parse config file and ask user for work_dir and experiment_name, unless given as flags
+    args = parse_args()
     with open("config.json", "r") as f:
         config = json.load(f)
-    config, update_config = parse_config(config)
+    config, update_config = parse_config(
+        config, work_dir=args.work_dir, experiment_name=args.experiment_name, interactive=not args.yes
+    )
     work_dir = config["System"]["work_dir"]
     experiment_name = config["System"]["experiment_name"]
     if update_config:
@@ -42,34 +45,35 @@ def main():
     Database.push(df_metadata, table="metadata")
 
 
-def parse_args():
+def parse_args(argv=None):
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description="Run SDWF")
-    parser.add_argument("-h", "--help", action="help", help="show this help message and exit")
-    args = parser.parse_args()
+    parser.add_argument("--work-dir", help="the working directory, instead of asking")
+    parser.add_argument("--experiment-name", help="the experiment name, instead of asking")
+    parser.add_argument("-y", "--yes", action="store_true", help="use the config values without asking")
+    args = parser.parse_args(argv)
     return args
 
-def parse_config(config):
-    """Parse config file and ask user for work_dir and experiment_name"""
-    # Ask user for working directory
+def parse_config(config, work_dir=None, experiment_name=None, interactive=True):
+    """Parse config file and ask user for work_dir and experiment_name. A value given as argument
+    is used without asking; without `interactive` the config values are used for the others."""
     update_config = False
     default_work_dir = config["System"]["work_dir"]
-    work_dir = input(
-        f"\nConfirm that working directory below. [Enter] to confirm or enter your own path:\n{default_work_dir}\n"
-    )
-    if not work_dir:
-       work_dir = default_work_dir # press enter to use default path
-    else:
+    if work_dir is None and interactive:
+        # Ask user for working directory
+        work_dir = input(
+            f"\nConfirm that working directory below. [Enter] to confirm or enter your own path:\n{default_work_dir}\n"
+        )
+    if work_dir and work_dir != default_work_dir:
         config["System"]["work_dir"] = work_dir # update config file with the latest work_dir
         update_config = True
-    # Ask suer for experiment name
     default_experiment_name = config["System"]["experiment_name"]
-    experiment_name = input(
-        f"Confirm the experiment name below. [Enter] to confirm or enter your own name:\n{default_experiment_name}\n"
-    )
-    if not experiment_name:
-        experiment_name = default_experiment_name
-    else:
+    if experiment_name is None and interactive:
+        # Ask suer for experiment name
+        experiment_name = input(
+            f"Confirm the experiment name below. [Enter] to confirm or enter your own name:\n{default_experiment_name}\n"
+        )
+    if experiment_name and experiment_name != default_experiment_name:
         config["System"]["experiment_name"] = experiment_name
         update_config = True
     
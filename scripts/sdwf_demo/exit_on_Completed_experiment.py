@@ -1,5 +1,9 @@
 import sys
-from PySide2.QtCore import QIODevice, QThread, QObject, Signal
+import json
+import asyncio
+import argparse
+import threading
+from PySide2.QtCore import Qt, QIODevice, QThread, QObject, Signal
 from PySide2.QtSerialPort import QSerialPort
 from PySide2.QtWidgets import QApplication
 from SquidstatPyLibrary import AisDeviceTracker
@@ -11,15 +15,15 @@ from SquidstatPyLibrary import AisErrorCode
 from SquidstatPyLibrary import AisExperiment
 from SquidstatPyLibrary import AisInstrumentHandler
 from SquidstatPyLibrary import AisCyclicVoltammetryElement
+sys.path.append("./")
+from auto.squidstat import (
+    COLUMNS, ChannelWriter, ChannelScheduler, CycleAnalyzer, SquidStatService, export_csv, read_channel
+)
 
 
 app = QApplication([])
 
 
-def convert_to_csv_line(data_list):
-    return ','.join(str(item) for item in data_list) 
-
-
 class SerialPortReader(QObject):
     dataReceived = Signal(str)
 
@@ -44,200 +48,237 @@ class SerialPortReader(QObject):
         if self.port.isOpen():
             self.port.close()
 
-class ExperimentManager:
-    def __init__(self, total_channels):
-        self.total_channels = total_channels
-        self.running_channels = set()
-
-    def start_experiment(self, channel):
-        if channel not in self.running_channels and 0 <= channel < self.total_channels:
-            self.running_channels.add(channel)
-            return True
-        return False  # Experiment already running or invalid channel
-
-    def complete_experiment(self, channel):
-        if channel in self.running_channels:
-            self.running_channels.remove(channel)
-
-    def is_experiment_running(self, channel):
-        return channel in self.running_channels
-
-    def get_running_channels(self):
-        return list(self.running_channels)
-
-
-
-class WriteCSV:
-    def __init__(self, filename):
-        self.filename = filename
-        self.file = None
+# The parameters of the CV elements and their setters, see "jobs" in the SquidStat section of config.json
+CV_SETTERS = {
+    "start_voltage": "setStartVoltage", # V
+    "first_voltage_limit": "setFirstVoltageLimit", # V
+    "second_voltage_limit": "setSecondVoltageLimit", # V
+    "end_voltage": "setEndVoltage", # V
+    "dEdt": "setdEdt", # V/s
+    "sampling_interval": "setSamplingInterval", # s
+    "approx_max_current": "setApproxMaxCurrent", # A
+    "cycles": "setNumberOfCycles",
+    "start_voltage_vs_ocp": "setStartVoltageVsOCP",
+    "first_voltage_limit_vs_ocp": "setFirstVoltageLimitVsOCP",
+    "second_voltage_limit_vs_ocp": "setSecondVoltageLimitVsOCP",
+    "end_voltage_vs_ocp": "setEndVoltageVsOCP",
+}
+
+
+def build_experiment(definition):
+    """Build an AisExperiment from its definition, e.g.
+    {"elements": [{"type": "cv", "start_voltage": 0, ..., "repeats": 1}]}
+    """
+    experiment = AisExperiment()
+    for element in definition["elements"]:
+        if element["type"] != "cv":
+            raise ValueError(f"Unknown experiment element '{element['type']}'")
+        CvElement = AisCyclicVoltammetryElement(0.0, 2.5, 5.2, 3.0, 0.0005, 1.0)
+        for key, setter in CV_SETTERS.items():
+            if key in element:
+                getattr(CvElement, setter)(element[key])
+        experiment.appendElement(CvElement, element.get("repeats", 1))
+    return experiment
+
+
+def start_job(handler, writerThread, channel, uid, definition):
+    """Upload an experiment to a channel and start it, raise RuntimeError if the instrument fails.
+    The writer is opened first so that no sample is missed, and discarded if the start fails."""
+    writerThread.open(channel, uid)
+    try:
+        error = handler.uploadExperimentToChannel(channel, build_experiment(definition))
+        if error.value() != AisErrorCode.ErrorCode.Success:
+            raise RuntimeError(error.message())
+        error = handler.startUploadedExperiment(channel)
+        if error.value() != AisErrorCode.ErrorCode.Success:
+            raise RuntimeError(error.message())
+    except Exception:
+        writerThread.discard(channel)
+        raise
+    print(f"Job {uid} started on channel {channel}")
 
-    def write_header(self, header):
-        if self.file is None:
-            self.file = open(self.filename, 'w')
-        self.file.write(convert_to_csv_line(header) + '\n')
 
-    def write_data(self, data):
-        if self.file is not None:
-            self.file.write(convert_to_csv_line(data) + '\n')
+class MainThreadCall(QObject):
+    """Run a function in the Qt main thread and wait for its result, from any other thread. The
+    instrument handler is only used from the main thread. Create it in the main thread."""
+    called = Signal(object)
 
-    def close(self):
-        if self.file is not None:
-            self.file.close()
+    def __init__(self):
+        super().__init__()
+        self.called.connect(self._run, Qt.BlockingQueuedConnection)
+
+    def _run(self, call):
+        call()
+
+    def __call__(self, function, *args):
+        result = {}
+        def call():
+            try:
+                result["value"] = function(*args)
+            except Exception as e:
+                result["error"] = e
+        self.called.emit(call)
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+
+
+class AisBackend():
+    """The backend of `auto.squidstat.SquidStatService` driving the instrument: the OT2 starts the
+    experiments and is told when each channel completes, instead of the jobs of the config."""
+    def __init__(self, handler, writerThread, main_thread):
+        self.handler = handler
+        self.writerThread = writerThread
+        self.main_thread = main_thread
+        self.service = None # set by the service to push completions
+        self._states = {c: "idle" for c in range(handler.getNumberOfChannels())}
+        self._paths = {} # {channel: the data file of the last experiment}
+
+    def start(self, channel, uid, experiment):
+        self.main_thread(start_job, self.handler, self.writerThread, channel, uid, experiment)
+        self._states[channel] = "running"
+        self._paths[channel] = self.writerThread.writers[channel].path
+
+    def completed(self, channel):
+        self._states[channel] = "completed"
+        if self.service is not None:
+            self.service.channel_completed(channel)
+
+    def status(self):
+        return dict(self._states)
+
+    def results(self, channel):
+        data = read_channel(self._paths[channel])
+        return COLUMNS, [list(row) for row in zip(*(data[c] for c in COLUMNS))]
 
 
 class WriterThread(QThread):
     plotData = Signal(int, float, float, float)
     stopToPlot = Signal(int)
 
-    def __init__(self, numberOfchannel, experiment_manager):
+    def __init__(self, handler, analysis):
         super().__init__()
-        self.timestamps = []
-        self.voltages = []
-        self.currents = []
-        self.experiment_manager = experiment_manager
-        self.csv_writers = [WriteCSV(f'dataFile_channel{channel}.csv') for channel in range(numberOfchannel)]
+        self.handler = handler
+        self.analysis = analysis # the parameters of the CycleAnalyzer
+        self.scheduler = None # runs the jobs of the config
+        self.backend = None # or the experiments started by the OT2
+        self.writers = {} # {channel: the writer of the running experiment}
+        self.analyzers = {} # {channel: the cycle analyzer of the running experiment}
 
     def run(self):
-        for csv_writer in self.csv_writers:
-            csv_writer.write_header(['Timestamp', 'Working Electrode Voltage', 'Current'])
         self.plotData.connect(self.add_data)
         self.stopToPlot.connect(self.close)
 
+    def open(self, channel, uid):
+        # buffered binary files, exported to csv when the experiment of the channel completes
+        self.writers[channel] = ChannelWriter(
+            f'dataFile_channel{channel}_{uid}.bin', echo_interval=1.0, name=f'channel {channel}'
+        )
+        # the features of every cycle are appended as soon as the cycle completes
+        cycles_path = f'dataFile_channel{channel}_{uid}_cycles.jsonl'
+        open(cycles_path, 'w').close()
+
+        def on_cycle(features):
+            with open(cycles_path, 'a') as f:
+                f.write(json.dumps(features) + '\n')
+            print(f"channel {channel} cycle {features['cycle']}: {features}")
+            if features['failed'] and channel in self.analyzers: # not once the experiment stopped
+                print(f"Aborting {uid} on channel {channel}: the peak current is too low")
+                self.handler.stopExperiment(channel) # frees the channel for the next job
+
+        self.analyzers[channel] = CycleAnalyzer(on_cycle, **self.analysis)
+
+    def discard(self, channel):
+        """Close the writer and drop the analyzer of an experiment which did not start."""
+        self.writers.pop(channel).close()
+        self.analyzers.pop(channel, None)
+
     def add_data(self,channel, timestamp, voltage, current):
-        self.timestamps.append(timestamp)
-        self.voltages.append(voltage)
-        self.currents.append(current)
-        self.csv_writers[channel].write_data([timestamp, voltage, current])
+        self.writers[channel].add(timestamp, voltage, current)
+        self.analyzers[channel].add(timestamp, voltage, current)
 
     def close(self, channel):
-        self.csv_writers[channel].close()
-        self.experiment_manager.complete_experiment(channel)
+        self.writers[channel].close()
+        self.analyzers.pop(channel).close() # the features of the last cycle
+        export_csv(self.writers[channel].path)
+        if self.backend is not None: # pushed to the OT2
+            self.backend.completed(channel)
+        if self.scheduler is None:
+            return
+        self.scheduler.complete_experiment(channel) # starts the next job of the channel
         
-        # Check if there are no running channels left
-        if len(self.experiment_manager.get_running_channels()) == 0:
+        # Check if all the jobs are done
+        if self.scheduler.done:
+            print(self.scheduler.report())
             app.quit() 
 
 
 
+parser = argparse.ArgumentParser(description="Run the SquidStat experiments.")
+parser.add_argument("config", nargs="?", default="scripts/sdwf_demo/config.json")
+parser.add_argument("--serve", action="store_true", help="run the experiments started by the OT2")
+args = parser.parse_args()
+with open(args.config, "r") as f:
+    config = json.load(f)
+ot2_address = config["Remote Stations"]["OT2"]["ip"], config["Robots"]["SquidStat"].get("rpc_port", 23)
+config = config["Robots"]["SquidStat"]
+
 tracker = AisDeviceTracker.Instance()
+main_thread = MainThreadCall()
+
+
+def serve(backend):
+    """Serve the remote procedures to the OT2 until it closes the connection, then quit."""
+    service = SquidStatService(backend)
+    try:
+        asyncio.run(service.run(*ot2_address))
+    finally:
+        main_thread(app.quit)
 
 
 def onNewDeviceConnected(deviceName):
     print("Device is Connected: %s" % deviceName)
     handler = tracker.getInstrumentHandler(deviceName)
     if handler:
-    
-        # Initialize ExperimentManager with total number of channels
-        experiment_manager = ExperimentManager(total_channels=handler.getNumberOfChannels())
-    
-        writerThread = WriterThread(handler.getNumberOfChannels(), experiment_manager)
+        writerThread = WriterThread(handler, config.get("analysis", {}))
         writerThread.start()
 
-        
+        def launch(channel, job):
+            start_job(handler, writerThread, channel, job["uid"], job["experiment"])
 
-        handler.activeDCDataReady.connect(lambda channel, data: (
-            print("timestamp:", "{:.9f}".format(data.timestamp), "workingElectrodeVoltage: ",
-                  "{:.9f}".format(data.workingElectrodeVoltage), "current: ", "{:.9f}".format(data.current)),
+        if args.serve:
+            writerThread.backend = AisBackend(handler, writerThread, main_thread)
+        else:
+            scheduler = ChannelScheduler(handler.getNumberOfChannels(), config["jobs"], launch)
+            writerThread.scheduler = scheduler
+
+        # the samples are echoed to the console by the writers, at most once per second
+        handler.activeDCDataReady.connect(lambda channel, data: 
             writerThread.plotData.emit(channel, data.timestamp, data.workingElectrodeVoltage, data.current)
-        ))
+        )
         ### To define AC exp result data format 
         # handler.activeACDataReady.connect(lambda channel, data: print("frequency:", "{:.9f}".format(data.frequency),
         #                                                               "absoluteImpedance: ", "{:.9f}".format(
         #                                                                   data.absoluteImpedance), "phaseAngle: ",
         #                                                               "{:.9f}".format(data.phaseAngle)))
         handler.experimentNewElementStarting.connect(lambda channel, data: print("start step ", data.stepName))
+        # idle sampling is started before the next job of the channel is launched
         handler.experimentStopped.connect(lambda channel: (print("Experiment Completed: %d" % channel),
-                                                           writerThread.stopToPlot.emit(channel),
-                                                           handler.startIdleSampling(channel)))
-
-        experiment = AisExperiment()
-
-        CvElement = AisCyclicVoltammetryElement(0.0,2.5,5.2,3.0,0.0005,1.0)
-        CvElement.setStartVoltage(0) # V
-        CvElement.setFirstVoltageLimit(2.5) # V
-        CvElement.setSecondVoltageLimit(5.2) # V
-        CvElement.setEndVoltage(3) # V
-        CvElement.setdEdt(0.1)#(0.0005) # V/s
-        CvElement.setSamplingInterval(1) # s
-        CvElement.setApproxMaxCurrent(0.01) # A
-        CvElement.setNumberOfCycles(1)
-        CvElement.setStartVoltageVsOCP(True)
-        CvElement.setFirstVoltageLimitVsOCP(False)
-        CvElement.setSecondVoltageLimitVsOCP(False)
-        CvElement.setEndVoltageVsOCP(False)
-
-        print(CvElement.getName())
-        print(CvElement.getStartVoltage(), 'V start')
-        print(CvElement.getFirstVoltageLimit(), 'V first')
-        print(CvElement.getSecondVoltageLimit(), 'V second')
-        print(CvElement.getEndVoltage(), ' V end')
-        print(CvElement.getNumberOfCycles(), ' cycles')
-        print(CvElement.getdEdt(), 'V/s')
-        print(CvElement.getSamplingInterval(), 's')
-        print(CvElement.getApproxMaxCurrent(), 'A')
-        print(CvElement.isStartVoltageVsOCP(), ' Start Voltage vs OCP')
-        print(CvElement.isFirstVoltageLimitVsOCP(), ' First Voltage vs OCP')
-        print(CvElement.isSecondVoltageLimitVsOCP(), ' Second Voltage vs OCP')
-        print(CvElement.isEndVoltageVsOCP(), ' End Voltage vs OCP')
-
-        #experiment.appendElement(ccElement, 1)
-        experiment.appendElement(CvElement, 1)
-
-        error = handler.uploadExperimentToChannel(0, experiment)
-        if error.value() != AisErrorCode.ErrorCode.Success:
-            print(error.message())
-            return	
-            
-        
-        error = handler.uploadExperimentToChannel(1, experiment)
-        if error.value() != AisErrorCode.ErrorCode.Success:
-            print(error.message())
-            return	
-            
-			
-        error = handler.uploadExperimentToChannel(2, experiment)
-        if error.value() != AisErrorCode.ErrorCode.Success:
-            print(error.message())
-            return	
-            
-			
-        error = handler.uploadExperimentToChannel(3, experiment)
-        if error.value() != AisErrorCode.ErrorCode.Success:
-            print(error.message())
-            return	
-                    
-        error_value = handler.startUploadedExperiment(0).value()
-        if error_value != AisErrorCode.ErrorCode.Success:
-            print("Experiment is not started on channel 1 because: " + error.message())
-            return
-            
-        experiment_manager.start_experiment(0)    
-        
-        error_value |= handler.startUploadedExperiment(1).value()
-        if error_value != AisErrorCode.ErrorCode.Success:
-            print("Experiment is not started on channel 1 because: " + error.message())
-            return
-            
-        experiment_manager.start_experiment(1) 
-        
-        error_value |= handler.startUploadedExperiment(2).value()
-        if error_value != AisErrorCode.ErrorCode.Success:
-            print("Experiment is not started on channel 1 because: " + error.message())
-            return
-            
-        experiment_manager.start_experiment(2)     
-        
-        error_value |= handler.startUploadedExperiment(3).value()
-        if error_value != AisErrorCode.ErrorCode.Success:
-            print("Experiment is not started on channel 1 because: " + error.message())
+                                                           handler.startIdleSampling(channel),
+                                                           writerThread.stopToPlot.emit(channel)))
+
+        if args.serve:
+            threading.Thread(target=serve, args=(writerThread.backend,), daemon=True).start()
             return
-        experiment_manager.start_experiment(3) 
+        scheduler.start()
+        if scheduler.done: # every job failed to start
+            print(scheduler.report())
+            app.quit()
 
 tracker.newDeviceConnected.connect(onNewDeviceConnected)
 
-error = tracker.connectToDeviceOnComPort("COM3")
+error = tracker.connectToDeviceOnComPort(config.get("port", "COM3"))
 if error.value() != AisErrorCode.ErrorCode.Success:
     print(error.message())
 
-sys.exit(app.exec_())
\ No newline at end of file
+sys.exit(app.exec_())
@@ -1,9 +1,13 @@
+import os
 import sys
 import json
+import time
+_start = time.perf_counter()
 sys.path.append("./")
 from ot2 import OT2
 from robots import ConductivityMeter
 from opentrons import protocol_api
+print(f"Protocol modules loaded in {time.perf_counter() - _start:.1f} s")
 
 metadata={"apiLevel": "2.11"}
 
@@ -18,22 +22,17 @@ def run(protocol: protocol_api.ProtocolContext):
 
     # Execution
     ot2.pip_arm.tip_racks.append(ot2.tiprack)  # mount tiprack on pipette
-    ot2.generate_dispensing_queue(verbose=True) # generate dispensing queue
-    for sub_queue in ot2.dispensing_queue:
-        # get the block name from the first source vial
-        source = sub_queue[0][0]
-        if source is None:
-            print("Dispensing finished...")
-            break
-        # block = (source[0], 0 if "1" in source[1] or "2" in source[1] else 1) 
-        # ot2.move_cover(block, "deck", verbose=True) # uncover the block before dispensing
-        for source, target, volume, speed_factor in sub_queue:
-            ot2.dispense_chemical(source, target, volume, speed_factor, verbose=True) 
-        # ot2.move_cover("deck", block, verbose=True) # cover the block after dispensing
-
-
-    ot2.measure_conductivity(cm) # measure cond and update cond
-    cm.export_result()
+    if os.path.isfile("plan.json"): # plan compiled on the control PC
+        ot2.load_plan("plan.json", verbose=True)
+    else:
+        ot2.generate_dispensing_queue(verbose=True) # generate dispensing queue
+    try:
+        # Measure each formulation as soon as it is complete. Set move_covers=True to cover the sources.
+        ot2.run_schedule(cm, interleave=True, move_covers=False, verbose=True)
+        cm.export_result()
+    finally:
+        print(ot2.trace_summary()) # where the deck time went, up to the failure if any
+        ot2.tracer.close()
 
     print("Demo finished...")
     
@@ -1,69 +1,191 @@
 import os
+import argparse
 from auto.remote import RemoteStation
-from auto.utils.database import Database
+from auto.plan import compile_plan
+from auto.layout import config_layout
+from auto.loop import ClosedLoop
+from auto.utils.database import Database, DatabaseWriter
 from auto.utils.data import (
-    parse_output_data, 
+    parse_output_data,
     parse_metadata,
+    get_new_batch_number,
     ask_for_composition_id,
-    get_new_recipes
+    get_new_recipes,
+    select_recipes,
+    pending_recipes
 )
 import json
 
 
-def main():
-    """Main function for running SDWF experiment on OT2."""    
+def load_config(experiment_path):
     try:
-        config_path = os.path.join(os.getcwd(), "config.json")
+        config_path = os.path.join(experiment_path, "config.json")
         with open(config_path, "r") as f:
-            config = json.load(f)
+            return json.load(f)
     except FileNotFoundError:
         raise Exception(
             "Config file not found in the experiment directory.\n"
             "Please make sure you are in the experiment folder!"
         )
-    else:
-        experiment_path = os.getcwd()
+
+
+def run_plate(df_input, config, experiment_path, comp_id, db, writer, last_batch=None):
+    """Dispense and measure one plate of recipes on the OT2 and queue its results. `last_batch`
+    is the batch number of the previous plate, whose results may still be in `writer` and not in
+    the database. Return the batch number of the plate."""
+    # Save the experiment input to experiment folder
+    df_input.to_csv(os.path.join(experiment_path,"experiment.csv"), index=False)
+    # Compile and validate the dispensing plan here so the OT2 does not have to
+    compile_plan(
+        os.path.join(experiment_path, "experiment.csv"),
+        config,
+        output_path=os.path.join(experiment_path, "plan.json")
+    )
 
     # Create OT2 remote station and connect to it.
     ot2 = RemoteStation(
-        name="Automat_Control_SDWF", 
-        execution_mode="ot2", 
+        name="Automat_Control_SDWF",
+        execution_mode="ot2",
         config=config["Remote Stations"]["OT2"],
         experiment_path=experiment_path
     )
     ot2.connect()
-    
-    # Ask for composition id
-    comp_id = ask_for_composition_id()
-
-    # pull data from database and preprocess
-    db = Database(db="test_db")
-    df_input = get_new_recipes(comp_id, db=db)
-    if df_input.empty:
-        print("No new recipes to run")
-        return
-    else:
-        # Save the experiment input to experiment folder
-        df_input.to_csv(os.path.join(experiment_path,"experiment.csv"), index=False)
 
     #Update script to OT2, run SDWF experiment on OT2 and download result
     ot2.put()
     ot2.execute("make_solutions.py", mode="ot2")
     ot2.download_data()
+    # keep the volumes left in the sources, so the next plan is checked against them, and the
+    # timing of the actions, see `auto.telemetry`. Every run appends to the trace on the OT2, so
+    # the copy downloaded replaces the previous one with the history of all the plates.
+    for section in ["inventory", "trace"]:
+        data_file = config["Robots"]["OT2"].get(section, {}).get("file")
+        if data_file:
+            ot2.download_data([data_file])
     ot2.disconnect()
-    
+
     # Parse output data and metadata and push result to database
     ot2.export_metadata(comment="Another successful run of SDWF experiment on OT2.")
-    df_metadata = parse_metadata(experiment_path, db=db)
+    batch_number = int(get_new_batch_number(source="lab", db=db))
+    if last_batch is not None:
+        batch_number = max(batch_number, last_batch + 1)
+    df_metadata = parse_metadata(experiment_path, db=db, batch_number=batch_number)
     df_output = parse_output_data(
-        experiment_path, 
-        composition_id=comp_id, 
-        batch_number=df_metadata["experiment_id"].values[0],
+        experiment_path,
+        composition_id=comp_id,
+        batch_number=batch_number,
         db=db
     )
-    db.push(df_metadata, table="OT-2_dispensing")
-    db.push(df_output, table="measured_cond")
+    writer.put_frame(df_metadata, table="OT-2_dispensing")
+    writer.put_frame(df_output, table="measured_cond")
+    return batch_number
+
+
+def main(composition_id=None, interactive=True, **training):
+    """Main function for running SDWF experiment on OT2. Without `interactive`, nothing is asked:
+    the pending recipes of `composition_id` are run, or the training set described by `training`
+    (see `auto.utils.data.training_set`) when there are none."""
+    experiment_path = os.getcwd()
+    config = load_config(experiment_path)
+
+    # Ask for composition id, unless given
+    comp_id = ask_for_composition_id(composition_id)
+
+    # pull data from database and preprocess
+    db = Database(db="test_db")
+    # results are inserted in the background; rows the database refuses are spooled to a file
+    # and inserted again at the next run
+    writer = DatabaseWriter(db, spool_path=os.path.join(experiment_path, "db_spool.jsonl"))
+    writer.start()
+    if interactive:
+        df_input = get_new_recipes(comp_id, db=db)
+    else:
+        df_input = select_recipes(comp_id, db=db, **training)
+    if df_input.empty:
+        print("No new recipes to run")
+    else:
+        run_plate(df_input, config, experiment_path, comp_id, db, writer)
+    writer.close()
+    print(f"Inserted {writer.inserted} rows, spooled {writer.spooled} rows")
+
+
+def run_loop(comp_id, min_fill=None, max_wait=3600, poll_interval=60, max_plates=None):
+    """Run plates of the pending recipes of `comp_id` until stopped, see `ClosedLoop`."""
+    experiment_path = os.getcwd()
+    config = load_config(experiment_path)
+    capacity = len(config_layout(config["Robots"]["OT2"], "formula_wells", experiment_path)[0])
+
+    db = Database(db="test_db")
+    writer = DatabaseWriter(db, spool_path=os.path.join(experiment_path, "db_spool.jsonl"))
+    writer.start()
+    batches = [] # the batch number of every plate, as the last ones may not be inserted yet
+
+    def run(df_input):
+        last_batch = batches[-1] if batches else None
+        batches.append(run_plate(df_input, config, experiment_path, comp_id, db, writer, last_batch))
+
+    loop = ClosedLoop(
+        poll=lambda: pending_recipes(comp_id, db=db),
+        run=run,
+        capacity=capacity,
+        min_fill=min_fill,
+        max_wait=max_wait,
+        poll_interval=poll_interval
+    )
+    try:
+        loop.run_forever(max_plates=max_plates)
+    except KeyboardInterrupt:
+        print("Stopped")
+    finally:
+        writer.close()
+        print(loop.report())
+
+
+def cli(argv=None):
+    """The `sdwf` command."""
+    parser = argparse.ArgumentParser(description="Run the SDWF experiment on the OT2.")
+    parser.add_argument("--loop", action="store_true", help="run plates until stopped, without input")
+    parser.add_argument("--composition-id", type=int, help="the composition_id, instead of asking")
+    parser.add_argument("-y", "--yes", action="store_true", help="run one plate without asking anything")
+    parser.add_argument("--training", choices=["stock", "random"], help="the training set without predictions")
+    parser.add_argument("--stock-indices", type=int, nargs="+", help="the stock solutions to measure")
+    parser.add_argument("--num-chemical", type=int, default=16, help="chemicals of a random training set")
+    parser.add_argument("--num-recipe", type=int, default=16, help="recipes of a random training set")
+    parser.add_argument("--seed", type=int, help="the seed of a random training set, to draw it again")
+    parser.add_argument("--method", choices=["dirichlet", "lhs", "sobol"], default="dirichlet",
+                        help="the sampling of a random training set")
+    parser.add_argument("--constraints", help="a json file of the constraints of a random training set, "
+                        "[[name, [indices, coefficients, target]], ...], see auto.utils.data.within_constraints")
+    parser.add_argument("--min-fill", type=int, help="the recipes which start a plate, default a full plate")
+    parser.add_argument("--max-wait", type=float, default=3600, help="start a partial plate after (s)")
+    parser.add_argument("--poll-interval", type=float, default=60, help="time between polls (s)")
+    parser.add_argument("--plates", type=int, help="stop after this number of plates")
+    args = parser.parse_args(argv)
+    constraints = None
+    if args.constraints:
+        with open(args.constraints, "r") as f:
+            constraints = json.load(f)
+    if args.loop:
+        if args.composition_id is None:
+            parser.error("--loop requires --composition-id")
+        run_loop(args.composition_id, args.min_fill, args.max_wait, args.poll_interval, args.plates)
+    elif args.yes:
+        if args.composition_id is None:
+            parser.error("--yes requires --composition-id")
+        main(
+            args.composition_id,
+            interactive=False,
+            training=args.training,
+            stock_solution_indices=args.stock_indices,
+            num_chemical=args.num_chemical,
+            num_recipe=args.num_recipe,
+            seed=args.seed,
+            method=args.method,
+            constraints=constraints
+        )
+    else:
+        main(args.composition_id)
 
 
 if __name__ == "__main__":
-    main()
+    cli()
@@ -17,7 +17,7 @@ setup(
     ],
     entry_points={ # create scripts and add to sys.PATH
         'console_scripts': [
-            'sdwf = scripts.sdwf_master:main',
+            'sdwf = scripts.sdwf_master:cli',
         ],
     },
 )
\ No newline at end of file
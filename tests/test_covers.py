@@ -0,0 +1,40 @@
+import unittest
+from auto.covers import CoverDeck, plan_cover_moves
+
+
+class Test_CoverDeck(unittest.TestCase):
+
+    def test_plan_cover_moves(self):
+        """Test that each next cover closes the previous block and only one cover visits the deck"""
+        deck = CoverDeck(7)
+        covers = [(4, 0), (4, 1), (5, 0), (5, 1)]
+        moves = plan_cover_moves(covers, deck)
+        self.assertEqual(moves[0], [((4, 0), (7, 0))])
+        self.assertEqual(moves[1], [((4, 1), (4, 0))])
+        self.assertEqual(moves[3], [((5, 1), (5, 0))])
+        self.assertEqual(moves[4], [((7, 0), (5, 1))])
+        self.assertEqual(sum(len(m) for m in moves), len(covers) + 1)
+        self.assertEqual(deck.stacks, [0, 0])
+        self.assertEqual(deck.uncovered, set())
+
+    def test_nearest_stack(self):
+        """Test that the cover goes to the closest stack of the deck"""
+        positions = {(4, 0): (10, 0), (7, 0): (0, 100), (7, 1): (10, 100)}
+        moves = plan_cover_moves([(4, 0)], CoverDeck(7), positions)
+        self.assertEqual(moves, [[((4, 0), (7, 1))], [((7, 1), (4, 0))]])
+
+    def test_invalid_moves(self):
+        """Test that the state machine rejects impossible moves"""
+        deck = CoverDeck(7)
+        with self.assertRaises(ValueError):
+            deck.move((7, 0), (4, 0)) # the deck is empty
+        with self.assertRaises(ValueError):
+            deck.move((4, 0), (4, 1)) # the block is covered
+        deck.move((4, 0), (7, 1))
+        with self.assertRaises(ValueError):
+            deck.move((4, 0), (7, 0)) # the cover is already gone
+        self.assertEqual(deck.stacks, [0, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 import os, json
+import socket
 import unittest
 import pandas as pd
 from auto.utils.data import (
@@ -7,9 +8,23 @@ from auto.utils.data import (
     parse_output_data,
     generate_random_training_set
 )
-from auto.utils.database import Database
+from auto.utils.database import Database, DB_ADDRESS
 import math
 
+
+def database_reachable(timeout=2):
+    """Whether the MySQL server of the lab answers, for the integration tests which pull from it."""
+    try:
+        socket.create_connection(DB_ADDRESS, timeout=timeout).close()
+        with Database(db="test_db").engine.connect():
+            pass
+    except Exception:
+        return False
+    return True
+
+
+requires_database = unittest.skipUnless(database_reachable(), f"the MySQL server {DB_ADDRESS[0]} is unreachable")
+
 class Test_Data_Interface(unittest.TestCase):    
     
     data_dir = os.path.join(os.path.dirname(__file__), "test_data")
@@ -26,6 +41,7 @@ class Test_Data_Interface(unittest.TestCase):
         self.assertIn("associated_csv", metadata)
         self.assertIn("comments", metadata)
 
+    @requires_database
     def test_parse_metadata(self):
         """Test that the metadata file is parsed correctly. The input should be a dictionary and the output should be a dataframe that is consistent with "OT-2_dispensing" table in the database."""
 
@@ -42,6 +58,7 @@ class Test_Data_Interface(unittest.TestCase):
                 continue
             self.assertIn(col, columns)
     
+    @requires_database
     def test_parse_input_data_columns(self):
         """Test that the input data is parsed correctly. The input is taken from "ml_mtls" table in the database.
         The output should be a dataframe taht has the folowwing defined columns."""
@@ -65,6 +82,7 @@ class Test_Data_Interface(unittest.TestCase):
     #     self.assertEqual(total_volume_ul / 1000, expected_total_volume_ml)
     #     # self.assertTrue((expected_total_volume_ml == total_volume_ul / 1000).all())
 
+    @requires_database
     def test_parse_output_data_columns(self):
         """Test that the metadata file is parsed correctly. The input should be a dictionary and the output should be a dataframe that is consistent with "OT-2_dispensing" table in the database."""
 
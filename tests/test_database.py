@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from auto.utils.database import DatabaseWriter
+
+
+class FakeDatabase():
+    """Record the inserted batches, failing the first `failures` inserts."""
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def insert(self, table, rows):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("MySQL is unreachable")
+        self.batches.append((table, rows))
+
+
+class Test_DatabaseWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.spool_path = os.path.join(self.folder.name, "spool.jsonl")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def writer(self, database):
+        return DatabaseWriter(
+            database, spool_path=self.spool_path, batch_size=4, flush_interval=0.05, retry_delay=0.01
+        )
+
+    def test_batches(self):
+        """Test that the rows are inserted in batches of each table"""
+        database = FakeDatabase(failures=2) # retried within the same batch
+        writer = self.writer(database)
+        writer.start()
+        for k in range(6):
+            writer.put("measured_cond", {"uid": k})
+        writer.put("OT-2_dispensing", {"experiment_id": 1})
+        writer.close()
+        rows = [row["uid"] for table, batch in database.batches if table == "measured_cond" for row in batch]
+        self.assertEqual(rows, list(range(6)))
+        self.assertTrue(all(len(batch) <= 4 for _, batch in database.batches))
+        self.assertEqual(writer.inserted, 7)
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_spool(self):
+        """Test that rows are spooled when the database is unreachable and inserted at the next start"""
+        writer = self.writer(FakeDatabase(failures=100))
+        writer.start()
+        writer.put("measured_cond", {"uid": 1, "conductivity": 12.5})
+        writer.close()
+        self.assertEqual(writer.spooled, 1)
+        self.assertTrue(os.path.exists(self.spool_path))
+
+        database = FakeDatabase()
+        writer = self.writer(database)
+        writer.start()
+        writer.close()
+        self.assertEqual(database.batches, [("measured_cond", [{"uid": 1, "conductivity": 12.5}])])
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_corrupt_spool(self):
+        """Test that a corrupt spool line is set aside and the writer keeps inserting"""
+        with open(self.spool_path, "w") as f:
+            f.write('{"table": "measured_cond", "row": {"uid": 1}}\n{"table": "measu\n')
+        database = FakeDatabase()
+        writer = self.writer(database)
+        writer.start()
+        writer.put("measured_cond", {"uid": 2})
+        writer.close()
+        self.assertEqual(database.batches, [("measured_cond", [{"uid": 1}]), ("measured_cond", [{"uid": 2}])])
+        with open(self.spool_path + ".corrupt", "r") as f:
+            self.assertEqual(f.read(), '{"table": "measu\n')
+
+    def test_close_without_start(self):
+        """Test that the queued rows are inserted by close when the thread was never started"""
+        database = FakeDatabase()
+        writer = self.writer(database)
+        writer.put("measured_cond", {"uid": 1})
+        writer.close()
+        self.assertEqual(database.batches, [("measured_cond", [{"uid": 1}])])
+
+    def test_full_queue_without_start(self):
+        """Test that a writer which is not started inserts its full queue instead of blocking"""
+        database = FakeDatabase()
+        writer = DatabaseWriter(database, spool_path=self.spool_path, maxsize=3, batch_size=2)
+        for k in range(7):
+            writer.put("measured_cond", {"uid": k}, timeout=1)
+        self.assertEqual(writer.inserted, 6)
+        writer.close()
+        rows = [row["uid"] for _, batch in database.batches for row in batch]
+        self.assertEqual(rows, list(range(7)))
+        self.assertTrue(all(len(batch) <= 2 for _, batch in database.batches))
+
+
+if __name__ == "__main__":
+    unittest.main()
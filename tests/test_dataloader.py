@@ -0,0 +1,114 @@
+import unittest
+import warnings
+import tempfile
+import numpy as np
+import pandas as pd
+from auto.utils.dataloader import LiquidMasterTableDataset
+from auto.utils.tensor_dataset import RecipeTensorDataset
+
+
+class Test_RecipeDataset(unittest.TestCase):
+
+    def setUp(self):
+        df = pd.DataFrame({
+            "Electrolyte ID": ["a", "b", "c", "d"],
+            "DME": [0.5, np.nan, 0.2, 1.0],
+            "DOL": [0.5, 1.0, 0.0, 0.0],
+            "LiClO4": [0.0, 0.0, 0.8, 0.0],
+            "LCE": [0.9, 0.6, 0.8, 0.7]
+        })
+        self.ds = LiquidMasterTableDataset(df=df)
+
+    def test_space_index(self):
+        """Test that every recipe is indexed by the bitmask of its non-zero chemicals"""
+        masks, spaces = self.ds.space_index
+        self.assertEqual(len(masks), 4)
+        self.assertEqual(self.ds.mask_to_space(masks[0]), ["DME", "DOL"])
+        self.assertEqual(self.ds.mask_to_space(masks[1]), ["DOL"])
+        self.assertEqual(sum(len(rows) for rows in spaces.values()), 4)
+
+    def test_find_by_component(self):
+        """Test the exact / at most / at least sub-space queries"""
+        exact = self.ds.find_by_component(["DME", "DOL"])
+        self.assertEqual(exact["Electrolyte ID"].tolist(), ["a"])
+        at_most = self.ds.find_by_component(["DME", "DOL"], sub_space=True)
+        self.assertEqual(at_most["Electrolyte ID"].tolist(), ["a", "b", "d"])
+        at_least = self.ds.find_by_component("DME", super_space=True)
+        self.assertEqual(at_least["Electrolyte ID"].tolist(), ["a", "c", "d"])
+
+    def test_find_by_eid(self):
+        """Test that only the chemicals present in the selected recipes are returned"""
+        self.assertEqual(self.ds.find_by_eid(["a", "c"], show_space=True), ["DME", "DOL", "LiClO4"])
+        df = self.ds.find_by_eid("b")
+        self.assertEqual(list(df.columns), ["Electrolyte ID", "DOL", "LCE"])
+
+    def test_index_invalidated_on_mutation(self):
+        """Test that the index is rebuilt after the dataframe is replaced"""
+        self.ds.space_index
+        self.ds.normalize(inplace=True)
+        self.assertIsNone(self.ds._space_index)
+        self.assertEqual(self.ds.find_by_eid("d", show_space=True), ["DME"])
+
+    def test_normalize(self):
+        """Test that a zero total gives zeros and that only inplace changes the dataset, on a copy"""
+        df = pd.DataFrame({"Electrolyte ID": ["a", "b"], "DME": [1.0, 0.0], "DOL": [3.0, np.nan]})
+        ds = LiquidMasterTableDataset(df=df)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            normalized = ds.normalize()
+        self.assertEqual(normalized["DME"].tolist(), [0.25, 0.0])
+        self.assertEqual(normalized["DOL"].tolist(), [0.75, 0.0])
+        self.assertEqual(ds.view.loc[0, "DME"], 1.0)
+        self.assertNotIn("total_mass(g)", ds.view.columns)
+        ds.normalize(inplace=True)
+        self.assertEqual(ds.view.loc[0, "DOL"], 0.75)
+        self.assertEqual(ds.view.loc[0, "total_mass(g)"], 1)
+        self.assertEqual(df.loc[0, "DOL"], 3.0) # the dataframe given is not modified
+        self.assertNotIn("total_mass(g)", df.columns)
+
+    def test_read_only_accessors(self):
+        """Test that the cached arrays are shared between calls and cannot be modified"""
+        self.assertIs(self.ds.chemical_matrix, self.ds.chemical_matrix)
+        self.assertEqual(self.ds.chemical_matrix[1, 0], 0)
+        with self.assertRaises(ValueError):
+            self.ds.chemical_matrix[0, 0] = 1
+        self.assertEqual(self.ds.electrolyte_ids.tolist(), ["a", "b", "c", "d"])
+        self.assertTrue(np.isnan(self.ds.view.loc[1, "DME"]))
+
+    def test_find_similar(self):
+        """Test that similar recipes are selected within the tolerance"""
+        similar = self.ds.find_similar("d", tolerance=0.1, sub_space=True)
+        self.assertEqual(similar["Electrolyte ID"].tolist(), ["d"])
+
+    def test_export_arrays(self):
+        """Test that X and y are exported as contiguous float64 arrays of the present chemicals"""
+        X, y, chemicals = self.ds.export_arrays(["a", "b"], target="LCE")
+        self.assertEqual(chemicals, ["DME", "DOL"])
+        self.assertEqual(X.dtype, np.float64)
+        self.assertTrue(X.flags["C_CONTIGUOUS"])
+        self.assertEqual(X.shape, (2, 2))
+        self.assertEqual(y.tolist(), [0.9, 0.6])
+        X, y = self.ds.export_data(["a", "b"])
+        self.assertEqual(tuple(X.shape), (2, 2))
+
+    def test_tensor_dataset_batches(self):
+        """Test that the memory-mapped dataset serves whole batches through the DataLoader"""
+        with tempfile.TemporaryDirectory() as path:
+            ds = self.ds.to_tensor_dataset(target=["LCE"], path=path)
+            self.assertIsInstance(RecipeTensorDataset.load(path).X, np.memmap)
+            batches = list(ds.loader(batch_size=3, shuffle=False))
+            self.assertEqual([len(X) for X, _ in batches], [3, 1])
+            self.assertEqual(tuple(batches[0][1].shape), (3, 1))
+            X, y = ds[0]
+            self.assertEqual(tuple(X.shape), (3,))
+
+    def test_torch_data_reexport(self):
+        """Test that the classes of torch.utils.data can still be imported from the module"""
+        from torch.utils import data
+        from auto.utils.dataloader import Dataset, DataLoader
+        self.assertIs(Dataset, data.Dataset)
+        self.assertIs(DataLoader, data.DataLoader)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import json
+import tempfile
+import unittest
+from auto.inventory import StockInventory, liquid_height, saved_volumes
+
+
+class Test_StockInventory(unittest.TestCase):
+
+    cwd = os.path.dirname(__file__)
+    with open(os.path.join(cwd, "test_data", "automat_2x4wellplate_20ml.json"), "r") as f:
+        well = json.load(f)["wells"]["A1"]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "inventory.json")
+        self.inventory = StockInventory(self.path, clearance=1, submerge=3, warn_volume=2000)
+        self.inventory.add_well((5, "A1"), self.well, self.well["totalLiquidVolume"])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_aspiration_height(self):
+        """Test that the tip follows the liquid level down to the clearance above the bottom"""
+        full = self.inventory.height((5, "A1"))
+        self.assertAlmostEqual(full, liquid_height(self.well["totalLiquidVolume"], self.well))
+        z = self.inventory.aspiration_height((5, "A1"), 1000)
+        self.assertLess(z, full - 3)
+        self.inventory.consume((5, "A1"), 1000)
+        self.assertAlmostEqual(z, self.inventory.height((5, "A1")) - 3)
+        self.assertLess(self.inventory.aspiration_height((5, "A1"), 1000), z)
+        # the last drops are aspirated at the clearance
+        left = self.inventory.volume((5, "A1"))
+        self.assertEqual(self.inventory.aspiration_height((5, "A1"), left), 1)
+
+    def test_consume(self):
+        """Test that the volumes are saved and that the wells of unknown volume are not tracked"""
+        capacity = self.well["totalLiquidVolume"]
+        self.inventory.consume((5, "A1"), 500)
+        self.assertEqual(self.inventory.volume((5, "A1")), capacity - 500)
+        # the next run starts with the volume left
+        inventory = StockInventory(self.path)
+        inventory.add_well((5, "A1"), self.well)
+        inventory.add_well((5, "A2"), self.well)
+        self.assertEqual(inventory.volume((5, "A1")), capacity - 500)
+        self.assertIsNone(inventory.volume((5, "A2")))
+        inventory.consume((5, "A2"), 500)
+        self.assertIsNone(inventory.volume((5, "A2")))
+        self.assertEqual(saved_volumes(self.path, [(5, "A1"), (5, "A2")]), [capacity - 500, None])
+        inventory.refill((5, "A2"))
+        self.assertEqual(inventory.volume((5, "A2")), capacity)
+        # a well which gives more than it holds is left empty, the run is checked before it starts
+        inventory.consume((5, "A1"), capacity)
+        self.assertEqual(inventory.volume((5, "A1")), 0)
+
+    def test_check(self):
+        """Test that a run is warned about the sources which will run dry or low"""
+        capacity = self.well["totalLiquidVolume"]
+        self.assertEqual(self.inventory.check({(5, "A1"): 1000}), [])
+        self.assertEqual(len(self.inventory.check({(5, "A1"): capacity - 1000})), 1)
+        warnings = self.inventory.check({(5, "A1"): capacity + 1000})
+        self.assertIn("run dry", warnings[0])
+        self.inventory.add_well((5, "A2"), self.well)
+        self.assertEqual(self.inventory.check({(5, "A2"): capacity + 1000}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import pandas as pd
+from auto.loop import ClosedLoop
+
+
+class Test_ClosedLoop(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.recipes = [] # the unique_id of the recipes predicted so far
+        self.measured = set()
+        self.runs = []
+
+    def poll(self):
+        return pd.DataFrame({"unique_id": [r for r in self.recipes if r not in self.measured]})
+
+    def run_plate(self, batch):
+        self.runs.append(list(batch["unique_id"]))
+        self.now += 100
+        self.measured.update(batch["unique_id"])
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.recipes.append(len(self.recipes)) # one new prediction per poll
+
+    def loop(self, **kwargs):
+        return ClosedLoop(
+            self.poll, self.run_plate, capacity=4, poll_interval=10,
+            clock=lambda: self.now, sleep=self.sleep, **kwargs
+        )
+
+    def test_full_plates(self):
+        """Test that plates start as soon as they are full, without running a recipe twice"""
+        loop = self.loop(max_wait=None)
+        loop.run_forever(max_plates=2)
+        self.assertEqual(self.runs, [[0, 1, 2, 3], [4, 5, 6, 7]])
+        self.assertEqual(loop.report(), "2 plates, 8 recipes, 100% average fill, 617.1 plates/day")
+
+    def test_max_wait(self):
+        """Test that a partial plate starts once the first pending recipe has waited max_wait"""
+        loop = self.loop(max_wait=15)
+        loop.run_forever(max_plates=1)
+        self.assertEqual(self.runs, [[0, 1, 2]]) # recipe 0 pending since t=10, started at t=30
+        self.assertIsNone(self.loop(min_fill=10, max_wait=None).next_batch(timeout=30))
+
+    def test_failed_plate(self):
+        """Test that a failing plate does not stop the loop and that its recipes are run again"""
+        run_plate = self.run_plate
+        def fail_once(batch):
+            if not self.runs:
+                self.runs.append(None)
+                raise ValueError("infeasible plan")
+            run_plate(batch)
+        loop = ClosedLoop(
+            self.poll, fail_once, capacity=4, poll_interval=10, max_wait=None,
+            clock=lambda: self.now, sleep=self.sleep
+        )
+        loop.run_forever(max_plates=1)
+        self.assertEqual(self.runs, [None, [0, 1, 2, 3]])
+        self.assertEqual(len(loop.failures), 1)
+        self.assertIn("1 failed", loop.report())
+        # the measured recipes are no longer pending, so they are forgotten
+        loop.next_batch(timeout=0)
+        self.assertEqual(loop.submitted, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from auto.plan import (
+    DispensingPlan, build_plan, compile_plan, dispensing_actions, quantize_volumes, check_feasibility
+)
+from auto.layout import cover_blocks, plate_layout
+
+
+class Test_DispensingPlan(unittest.TestCase):
+
+    cwd = os.path.dirname(__file__)
+    config_path = os.path.join(cwd, "test_data", "config.json")
+    formulation_path = os.path.join(cwd, "test_data", "experiment.csv")
+    with open(config_path, "r") as f:
+        config = json.load(f)
+
+    def test_compile_plan(self):
+        """Test that the plan holds one action per non-zero (chemical, formulation) pair"""
+        plan = compile_plan(self.formulation_path, self.config)
+        self.assertEqual(plan.chemical_names, [f"Chemical{i}" for i in range(1, 17)])
+        self.assertEqual(plan.unique_ids, [111, 112, 113, 114, 115])
+        self.assertEqual(plan.sources[0], (4, "A1"))
+        self.assertEqual(plan.targets[0], (5, "A1"))
+        self.assertEqual(len(plan), 16 * 5)
+        self.assertEqual(plan.block_starts, [0, 20, 40, 60, 80])
+        self.assertEqual(plan.covers, [(4, 0), (4, 1), (7, 0), (7, 1)])
+        queue = plan.queue()
+        self.assertEqual(len(queue), 5) # 4 blocks of 4 chemicals and the void block
+        self.assertEqual(queue[0][0], [(4, "A1"), (5, "A1"), 2, 1])
+        self.assertEqual(queue[-1], [[(None, None), (None, None), 0, 1]])
+
+    def test_split_volume_and_viscous(self):
+        """Test that large volumes are split and viscous sources are slowed down"""
+        formulations = [{"unique_id": 1, "Chemical1": 2500, "Chemical2": 0}]
+        plan = build_plan(
+            formulations,
+            chemical_names=["Chemical1", "Chemical2"],
+            sources=[(4, "A1"), (4, "A2")],
+            targets=[(5, "A1")],
+            viscous=[[4, "A1"]],
+            pip_max_volume=1000
+        )
+        self.assertEqual(plan.volume, [1000, 1000, 500])
+        self.assertEqual([a[3] for a in plan.actions()], [0.5, 0.5, 0.5])
+        self.assertEqual(plan.block_starts, [0, 3]) # the last partial block is kept
+        self.assertEqual(plan.formulations()[0]["Chemical1"], 2500)
+
+    def test_save_and_load(self):
+        """Test that a saved plan is loaded identically and reused when the inputs are unchanged"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "plan.json")
+            plan = compile_plan(self.formulation_path, self.config, output_path=path)
+            loaded = DispensingPlan.load(path)
+            self.assertEqual(loaded.to_dict(), plan.to_dict())
+            self.assertEqual(loaded.queue(), plan.queue())
+            plan.save(path)
+            with open(path, "r") as f:
+                d = json.load(f)
+            d["volume"][0] = 123 # a plan with the same inputs is not compiled again
+            with open(path, "w") as f:
+                json.dump(d, f)
+            self.assertEqual(compile_plan(self.formulation_path, self.config, output_path=path).volume[0], 123)
+
+    def test_recompile_on_inventory(self):
+        """Test that a saved plan is compiled again when the stock volumes or the labware change"""
+        config = json.loads(json.dumps(self.config))
+        config["Robots"]["OT2"]["inventory"] = {"file": "inventory.json"}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ["experiment.csv", "automat_2x4wellplate_20ml.json", "automat_2x4wellplate_50ml.json"]:
+                shutil.copy2(os.path.join(self.cwd, "test_data", name), tmp_dir)
+            formulation_path = os.path.join(tmp_dir, "experiment.csv")
+            path = os.path.join(tmp_dir, "plan.json")
+            inputs = compile_plan(formulation_path, config, output_path=path).inputs
+            self.assertIn("automat_2x4wellplate_20ml.json", inputs)
+            # the Chemical1 source was depleted by a former run
+            with open(os.path.join(tmp_dir, "inventory.json"), "w") as f:
+                json.dump({"volumes": {"4:A1": 5}}, f) # 10 uL are needed
+            with self.assertRaises(ValueError):
+                compile_plan(formulation_path, config, output_path=path)
+            with open(os.path.join(tmp_dir, "inventory.json"), "w") as f:
+                json.dump({"volumes": {"4:A1": 15}}, f)
+            compile_plan(formulation_path, config, output_path=path)
+            # the dead volume cannot be aspirated
+            config["Robots"]["OT2"]["inventory"]["dead_volume"] = 10
+            with self.assertRaises(ValueError):
+                compile_plan(formulation_path, config, output_path=path)
+
+    def test_validate(self):
+        """Test that inconsistent plans are rejected"""
+        plan = compile_plan(self.formulation_path, self.config)
+        plan.target[0] = 99
+        plan.volume[1] = 5000
+        with self.assertRaises(ValueError) as context:
+            plan.validate()
+        self.assertIn("Target index out of range", str(context.exception))
+        self.assertIn("Volumes must be positive", str(context.exception))
+
+    def test_volume_limit(self):
+        """Test that a chemical exceeding the volume limit is rejected"""
+        with self.assertRaises(ValueError):
+            compile_plan(self.formulation_path, self.config, volume_limit=5)
+
+    def test_dispensing_actions(self):
+        """Test that the actions are computed chemical by chemical from the volume matrix"""
+        actions = dispensing_actions([[2500, 0], [0, 300]], pip_max_volume=1000, liquid_classes=[1, 0])
+        self.assertEqual(actions["source"].tolist(), [0, 0, 0, 1])
+        self.assertEqual(actions["target"].tolist(), [0, 0, 0, 1])
+        self.assertEqual(actions["volume"].tolist(), [1000, 1000, 500, 300])
+        self.assertEqual(actions["liquid_class"].tolist(), [1, 1, 1, 0])
+
+    def test_cover_blocks(self):
+        """Test that the wells of a plate are grouped by cover from its definition"""
+        plate = {"wells": {f"{r}{c}": {} for r in "AB" for c in range(1, 5)}}
+        self.assertEqual(cover_blocks(plate), [["A1", "A2", "B1", "B2"], ["A3", "A4", "B3", "B4"]])
+        plate_96 = {"wells": {f"{r}{c}": {} for r in "ABCDEFGH" for c in range(1, 13)}}
+        blocks = cover_blocks(plate_96)
+        self.assertEqual(len(blocks), 24)
+        self.assertEqual(blocks[6], ["C1", "C2", "D1", "D2"])
+        self.assertEqual(len(cover_blocks(plate_96, cover_shape=[8, 12])[0]), 96)
+
+    def test_multiple_plates(self):
+        """Test more than 16 chemicals and formulations spread over several plates"""
+        plate = {"wells": {f"{r}{c}": {} for r in "AB" for c in range(1, 5)}}
+        plate_96 = {"wells": {f"{r}{c}": {} for r in "ABCDEFGH" for c in range(1, 13)}}
+        sources, blocks = plate_layout([1, 2, 3], {1: plate, 2: plate, 3: plate})
+        targets, _ = plate_layout([5, 6], {5: plate_96, 6: plate_96})
+        names = [f"Chemical{i}" for i in range(1, 21)]
+        formulations = [dict(unique_id=j, **{name: 10 for name in names}) for j in range(100)]
+        plan = build_plan(formulations, names, sources, targets, blocks=blocks)
+        self.assertEqual(len(plan), 20 * 100)
+        self.assertEqual(plan.covers, [(1, 0), (1, 1), (2, 0), (2, 1), (3, 0)])
+        self.assertEqual(plan.sources[-1], (3, "B2"))
+        self.assertEqual(plan.targets[-1], (6, "B2"))
+        plan.validate()
+
+    def test_quantize_volumes(self):
+        """Test that volumes are rounded to the pipette and sub-minimum transfers are dropped"""
+        volumes, dropped = quantize_volumes([[123.46, 4.0], [0, 1049.96]], resolution=0.1, min_volume=5)
+        self.assertEqual(volumes.tolist(), [[123.5, 0], [0, 1050.0]])
+        self.assertEqual(dropped.tolist(), [[0, 1]])
+        # the 50 uL remainder of 1050 uL is merged with the previous action
+        actions = dispensing_actions(volumes, pip_max_volume=1000, min_volume=100)
+        self.assertEqual(actions["volume"].tolist(), [123.5, 525.0, 525.0])
+        # an odd number of steps is split on the grid and the total is kept
+        actions = dispensing_actions([[1050.5]], pip_max_volume=1000, min_volume=100, resolution=0.5)
+        self.assertEqual(actions["volume"].tolist(), [525.0, 525.5])
+        actions = dispensing_actions([[1051]], pip_max_volume=1000, min_volume=100, resolution=1)
+        self.assertEqual(actions["volume"].tolist(), [525.0, 526.0])
+
+    def test_feasibility(self):
+        """Test that every overfilled target and depleted source is reported at once"""
+        errors = check_feasibility(
+            [[15000, 6000], [8000, 1000]], ["Chemical1", "Chemical2"], ["f1", "f2"],
+            capacities=[20000, 20000], stocks=[20000, 50000]
+        )
+        self.assertEqual(errors, [
+            "Formulation f1 needs 21000 uL but its well holds 20000 uL.",
+            "Volume of Chemical1 (23000 uL) exceeds 20000 uL.",
+        ])
+        names = ["Chemical1", "Chemical2"]
+        formulations = [{"unique_id": "f1", "Chemical1": 15000, "Chemical2": 6000}]
+        with self.assertRaises(ValueError) as context:
+            build_plan(formulations, names, [(1, "A1"), (1, "A2")], [(2, "A1")], capacities=[20000])
+        self.assertIn("Formulation f1 needs 21000 uL", str(context.exception))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import time
+import socket
+import unittest
+from auto.pump_raspi.raspi_comm import PumpController, RaspiChannel, RaspiStandIn, get_conductivity
+
+
+class Test_RaspiChannel(unittest.TestCase):
+
+    def setUp(self):
+        self.server = RaspiStandIn(conductivity=12.5)
+        self.server.start()
+        self.channel = RaspiChannel(self.server.address, timeout=0.2, retries=3)
+        self.pump = PumpController(self.channel)
+
+    def tearDown(self):
+        self.channel.close()
+        self.server.close()
+
+    def test_start_and_stop(self):
+        """Test that the start returns at once and the pump runs for the requested duration"""
+        start = time.monotonic()
+        self.pump.start(5)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertTrue(self.server.running)
+        self.assertGreater(self.pump.remaining(), 4)
+        self.pump.stop()
+        self.assertFalse(self.server.running)
+        self.assertFalse(self.pump.running)
+        self.assertEqual(self.server.commands, ["pump_start 5", "pump_stop"])
+
+    def test_pump_stops_by_itself(self):
+        """Test that the pump stops at the end of its duration without a stop command"""
+        self.pump.start(0.05)
+        time.sleep(0.1)
+        self.assertFalse(self.server.running)
+        self.assertEqual(self.pump.remaining(), 0)
+
+    def test_get_conductivity(self):
+        """Test that the reading is returned in the answer"""
+        self.assertEqual(get_conductivity(self.channel), 12.5)
+
+    def test_retry_lost_packets(self):
+        """Test that lost requests are sent again and executed only once"""
+        self.server.drop = 2
+        self.pump.start(1)
+        self.assertEqual(self.server.commands, ["pump_start 1"])
+
+    def test_error_and_timeout(self):
+        """Test that unknown commands and missing answers raise"""
+        with self.assertRaises(RuntimeError):
+            self.channel.request("fly")
+        silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        silent.bind(("127.0.0.1", 0))
+        channel = RaspiChannel(silent.getsockname(), timeout=0.05, retries=1)
+        with self.assertRaises(TimeoutError):
+            channel.request("check_cond")
+        channel.close()
+        silent.close()
+
+    def test_from_config(self):
+        """Test that the address is read from the configuration"""
+        config = {"Remote Stations": {"Raspberry Pi": {"ip": "10.0.0.2", "port": 6000, "retries": 5}}}
+        channel = RaspiChannel.from_config(config)
+        self.assertEqual(channel.address, ("10.0.0.2", 6000))
+        self.assertEqual(channel.retries, 5)
+        self.assertTrue(channel.legacy) # until the Pi is updated
+        channel.close()
+
+    def test_legacy(self):
+        """Test that the legacy channel sends the bare command once without waiting"""
+        silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        silent.bind(("127.0.0.1", 0))
+        silent.settimeout(1)
+        channel = RaspiChannel(silent.getsockname(), timeout=5, legacy=True)
+        start = time.monotonic()
+        self.assertIsNone(get_conductivity(channel))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(silent.recvfrom(1024)[0], b"cond")
+        # the pump is started by the legacy trigger, and cannot be stopped
+        pump = PumpController(channel)
+        pump.start(6.5)
+        self.assertEqual(silent.recvfrom(1024)[0], b"8")
+        pump.stop()
+        self.assertGreater(pump.remaining(), 5)
+        silent.settimeout(0.1)
+        with self.assertRaises(socket.timeout):
+            silent.recvfrom(1024) # nothing is sent
+        channel.close()
+        silent.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
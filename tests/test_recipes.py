@@ -0,0 +1,107 @@
+import unittest
+import numpy as np
+from unittest import mock
+import pandas as pd
+from auto.utils.data import (
+    ask_for_composition_id, select_recipes, training_set, sample_recipes, within_constraints
+)
+
+
+class FakeDatabase():
+    """Serve the "ml_mtls" and "measured_cond" tables from data frames."""
+    def __init__(self, ml_ids, measured_ids, composition_id=1):
+        chemicals = {f"Chemical{i}": [1 / 16] * len(ml_ids) for i in range(1, 17)}
+        self.tables = {
+            "ml_mtls": pd.DataFrame({
+                "unique_id": ml_ids, "Composition_id": composition_id,
+                "predicted_conductivity": 1.0, **chemicals
+            }),
+            "measured_cond": pd.DataFrame({"ml_id": measured_ids, "Composition_id": composition_id}),
+        }
+
+    def pull(self, table=""):
+        return self.tables[table].copy()
+
+
+class Test_Recipes(unittest.TestCase):
+
+    def test_composition_id(self):
+        """Test that a given composition_id is not asked and that bad input is asked again"""
+        with mock.patch("builtins.input", side_effect=AssertionError("asked")):
+            self.assertEqual(ask_for_composition_id(7), 7)
+        with mock.patch("builtins.input", side_effect=["x", "3"]):
+            self.assertEqual(ask_for_composition_id(), 3)
+        with mock.patch("builtins.input", return_value="x"):
+            with self.assertRaises(ValueError):
+                ask_for_composition_id(attempts=2)
+
+    def test_select_recipes(self):
+        """Test that the pending predictions are selected without asking anything"""
+        db = FakeDatabase(ml_ids=[1, 2, 3], measured_ids=[2])
+        with mock.patch("builtins.input", side_effect=AssertionError("asked")):
+            df_input = select_recipes(1, db=db, training="random")
+        self.assertEqual(sorted(df_input["unique_id"]), [1, 3])
+
+    def test_training_set(self):
+        """Test the training sets chosen by arguments when nothing is pending"""
+        db = FakeDatabase(ml_ids=[1], measured_ids=[1])
+        self.assertTrue(select_recipes(1, db=db).empty)
+        self.assertEqual(len(select_recipes(1, db=db, training="stock", stock_solution_indices=[2, 5])), 2)
+        self.assertEqual(len(training_set("random", num_recipe=40, max_num_recipe=16)), 16)
+        with self.assertRaises(ValueError):
+            training_set("stock", stock_solution_indices=[17])
+        with self.assertRaises(ValueError):
+            training_set("other")
+
+    def test_training_set_seed(self):
+        """Test that a seeded random training set is drawn again, with `max_num_chemical` columns"""
+        df = training_set("random", num_chemical=4, max_num_chemical=8, seed=3)
+        self.assertEqual(len([c for c in df.columns if c.startswith("Chemical")]), 8)
+        pd.testing.assert_frame_equal(df, training_set("random", num_chemical=4, max_num_chemical=8, seed=3))
+        with self.assertRaises(ValueError):
+            training_set("stock", stock_solution_indices=[9], max_num_chemical=8)
+
+    def test_training_set_sampling(self):
+        """Test that the sampling method and the constraints reach the random recipes"""
+        constraints = [("Chemical1 < 0.2", ([0], [-1.0], -0.2))]
+        df = training_set("random", num_chemical=4, num_recipe=10, method="lhs", constraints=constraints, seed=0)
+        x = df[[f"Chemical{i}" for i in range(1, 5)]].to_numpy(dtype=float)[1:-1] # without the dummies
+        self.assertTrue(within_constraints(x / x.sum(axis=1, keepdims=True), constraints).all())
+        self.assertFalse(df.equals(training_set("random", num_chemical=4, num_recipe=10, seed=0)))
+        with self.assertRaises(ValueError):
+            training_set("random", num_chemical=4, constraints=[("x1 > 1", ([0], [1.0], 1.0))])
+
+
+class Test_SampleRecipes(unittest.TestCase):
+
+    def test_reproducible(self):
+        """Test that seeded recipes are reproducible and lie on the simplex"""
+        for method in ["dirichlet", "lhs"]:
+            x = sample_recipes(1000, 16, method=method, seed=1)
+            np.testing.assert_array_equal(x, sample_recipes(1000, 16, method=method, seed=1))
+            np.testing.assert_allclose(x.sum(axis=1), 1)
+            self.assertTrue((x >= 0).all())
+
+    def test_latin_hypercube(self):
+        """Test that every stratum of every dimension holds exactly one point before the mapping"""
+        from auto.utils.data import _unit_cube
+        u = _unit_cube(50, 4, "lhs", np.random.default_rng(0))
+        for column in u.T:
+            self.assertEqual(sorted(np.floor(column * 50).astype(int)), list(range(50)))
+
+    def test_constraints(self):
+        """Test that recipes outside the constraints are rejected"""
+        constraints = [
+            ("Chemical1 < 0.2", ([0], [-1.0], -0.2)), # stored as -x1 > -0.2
+            ("Chemical2 + Chemical3 > 0.3", ([1, 2], [1.0, 1.0], 0.3)),
+        ]
+        x = sample_recipes(500, 4, seed=0, constraints=constraints)
+        self.assertEqual(len(x), 500)
+        self.assertTrue(within_constraints(x, constraints).all())
+        self.assertTrue((x[:, 0] < 0.2).all())
+        with self.assertRaises(ValueError):
+            sample_recipes(10, 4, seed=0, constraints=[("x1 > 1", ([0], [1.0], 1.0))], max_rounds=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,39 @@
 import os
+import shutil
+import tempfile
 import unittest
 import json
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from auto.ot2 import OT2
+from auto.robots import ConductivityMeter, read_csv_records, write_csv_records
 from auto import protocol_api
+from auto.plan import build_plan
+from auto.inventory import StockInventory
 import pandas as pd
 
+class RecordingConductivityMeter(ConductivityMeter):
+    """A conductivity meter which reads the rank of each measurement as its conductivity."""
+    def read_cond(self, uid=None, verbose=False, append=True, row=None):
+        self.result_list.append({
+            "uid": uid, "row": row, "Conductivity": len(self.result_list), "Temperature": 25.0,
+            "Time": "2024-01-01 00:00:00"
+        })
+
+
+def measure_plate(ot2:OT2, path:str) -> list:
+    """Run the schedule of `ot2` without moving the arms, export the results to the formulation
+    file `path` and return its records."""
+    cm = RecordingConductivityMeter(config={})
+    cm._formulation_input_path = path
+    ot2.lot = MagicMock()
+    ot2.cond_arm = MagicMock()
+    with patch.object(ot2, "dispense_chemical"), patch.object(ot2, "adjust"), \
+            patch.object(ot2, "rinse_cond_arm"), patch.object(ot2, "dry_cond_arm"):
+        ot2.run_schedule(cm)
+    cm.export_result()
+    return read_csv_records(path)[1]
+
+
 class Test_OT2(unittest.TestCase):
 
     cwd = os.path.dirname(__file__)
@@ -26,8 +54,134 @@ class Test_OT2(unittest.TestCase):
         )
         self.assertEqual(len(ot2.dispensing_queue), 80)
         self.assertEqual(ot2.chemical_names, [f"Chemical{i}" for i in range(1, 17)])
-        self.assertEqual(ot2.formulations.iloc[0]["location"], (5, "A1"))
-        self.assertEqual(ot2.formulations.iloc[0]["unique_id"], 111)
+        self.assertEqual(ot2.formulations[0]["location"], (5, "A1"))
+        self.assertEqual(ot2.formulations[0]["unique_id"], 111)
+
+    def test_schedule(self):
+        """Test that each formulation is measured after its last dispensing and without tip"""
+        formulations = [
+            {"unique_id": 1, "Chemical1": 100, "Chemical2": 0},
+            {"unique_id": 2, "Chemical1": 100, "Chemical2": 100},
+        ]
+        ot2 = OT2(protocol_api.ProtocolContext())
+        ot2.load_plan(build_plan(
+            formulations, ["Chemical1", "Chemical2"],
+            sources=[(4, "A1"), (4, "A3")], targets=[(5, "A1"), (5, "A2")], blocks=[(4, 0), (4, 1)]
+        ))
+        steps = [(op, arg[0]["unique_id"] if op == "measure" else arg[0]) for op, arg in ot2.schedule()]
+        self.assertEqual(steps, [
+            ("dispense", (4, "A1")), ("dispense", (4, "A1")), ("dispense", (None, None)), ("measure", 1),
+            ("dispense", (4, "A3")), ("dispense", (None, None)), ("measure", 2),
+        ])
+        serial = [op for op, _ in ot2.schedule(interleave=False)]
+        self.assertEqual(serial[-2:], ["measure", "measure"])
+
+    def test_inventory(self):
+        """Test that a plan which runs a source dry is refused and that the sources of unknown
+        volume are aspirated from at the fixed height"""
+        with open(os.path.join(self.cwd, "test_data", "automat_2x4wellplate_20ml.json"), "r") as f:
+            well = json.load(f)["wells"]["A1"]
+        ot2 = OT2(protocol_api.ProtocolContext())
+        ot2.inventory = StockInventory()
+        ot2.inventory.add_well((4, "A1"), well, volume=150)
+        ot2.inventory.add_well((4, "A3"), well)
+        plan = build_plan(
+            [{"unique_id": 1, "Chemical1": 100, "Chemical2": 100}, {"unique_id": 2, "Chemical1": 100, "Chemical2": 0}],
+            ["Chemical1", "Chemical2"],
+            sources=[(4, "A1"), (4, "A3")], targets=[(5, "A1"), (5, "A2")], blocks=[(4, 0), (4, 1)]
+        )
+        with self.assertRaises(ValueError):
+            ot2.load_plan(plan)
+        ot2.inventory.refill((4, "A1"))
+        ot2.load_plan(plan)
+        ot2.lot = MagicMock()
+        with patch.object(ot2, "pick_up_tip"), patch.object(ot2, "drop_tip"), \
+                patch.object(ot2, "dispense"), patch.object(ot2, "aspirate") as aspirate:
+            ot2.dispense_chemical((4, "A1"), (5, "A1"), 100)
+            ot2.dispense_chemical((4, "A3"), (5, "A1"), 100)
+        (known, unknown) = [kwargs["z"] for _, kwargs in aspirate.call_args_list]
+        self.assertGreater(known, 5)
+        self.assertEqual(unknown, 5)
+        self.assertEqual(ot2.inventory.volume((4, "A1")), well["totalLiquidVolume"] - 100)
+        self.assertIsNone(ot2.inventory.volume((4, "A3")))
+
+    def test_dry_legacy(self):
+        """Test that the probe keeps the fixed dwell of the legacy Pi and only waits for the
+        acknowledged pump run otherwise"""
+        for legacy, dwell in [(True, 7.5), (False, 6.5)]:
+            protocol = protocol_api.ProtocolContext(move_time=0)
+            ot2 = OT2(protocol)
+            ot2.lot = MagicMock()
+            ot2.cond_arm = MagicMock()
+            ot2.pump = MagicMock()
+            ot2.pump.channel.legacy = legacy
+            ot2.pump.remaining.return_value = 6.5
+            with patch.object(ot2, "adjust"):
+                ot2.dry_cond_arm(3)
+            self.assertEqual(protocol.elapsed, dwell)
+            ot2.pump.start.assert_called_once_with(ot2._dry_time)
+
+    def test_export_interleaved(self):
+        """Test that the results of formulations without uid go to their row when the schedule
+        measures them out of row order"""
+        formulations = [
+            {"unique_id": None, "Chemical1": 100, "Chemical2": 100},
+            {"unique_id": None, "Chemical1": 100, "Chemical2": 0},
+        ]
+        ot2 = OT2(protocol_api.ProtocolContext())
+        ot2.load_plan(build_plan(
+            formulations, ["Chemical1", "Chemical2"],
+            sources=[(4, "A1"), (4, "A3")], targets=[(5, "A1"), (5, "A2")], blocks=[(4, 0), (4, 1)]
+        ))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "experiment.csv")
+            write_csv_records(path, ["unique_id", "Chemical1", "Chemical2"], formulations)
+            records = measure_plate(ot2, path)
+        # the second formulation is complete after the first block, so it is measured first
+        self.assertEqual([r["Conductivity"] for r in records], [1, 0])
+
+    def test_run_schedule_route(self):
+        """Test that the formulations are measured in the order of the shortest route, each rinsed
+        in its nearest station"""
+        config = json.loads(json.dumps(self.config))
+        config["Robots"]["OT2"]["water_wells"] = [2, 6]
+        ot2 = OT2(protocol_api.ProtocolContext())
+        ot2.config = config
+        ot2.load_plan(build_plan(
+            [{"unique_id": i, "Chemical1": 100} for i in range(4)], ["Chemical1"],
+            sources=[(4, "A1")], targets=[(5, "B4"), (5, "A4"), (5, "B1"), (5, "A1")], blocks=[(4, 0)]
+        ))
+        # the custom labwares are loaded from the working directory, as on the robot
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(os.path.join(self.cwd, "test_data"))
+        order, rinses, _ = ot2.measurement_route()
+        self.assertNotEqual(order, sorted(order))
+        with patch.object(ot2, "dispense_chemical"), patch.object(ot2, "measure_formulation") as measure:
+            ot2.run_schedule(None)
+        measured = [(args[1]["unique_id"], args[2]) for args, _ in measure.call_args_list]
+        self.assertEqual(measured, list(zip(order, rinses)))
+
+    def test_export_route(self):
+        """Test that the results of formulations without uid go to their row when the route
+        reorders the measurements"""
+        config = json.loads(json.dumps(self.config))
+        config["Robots"]["OT2"]["water_wells"] = [2, 6]
+        formulations = [{"unique_id": None, "Chemical1": 100} for _ in range(4)]
+        ot2 = OT2(protocol_api.ProtocolContext())
+        ot2.config = config
+        ot2.load_plan(build_plan(
+            formulations, ["Chemical1"],
+            sources=[(4, "A1")], targets=[(5, "B4"), (5, "A4"), (5, "B1"), (5, "A1")], blocks=[(4, 0)]
+        ))
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(os.path.join(self.cwd, "test_data"))
+        order, _, _ = ot2.measurement_route()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "experiment.csv")
+            write_csv_records(path, ["unique_id", "Chemical1"], formulations)
+            records = measure_plate(ot2, path)
+        # the k-th formulation of the route is read k
+        self.assertEqual([records[j]["Conductivity"] for j in order], list(range(4)))
 
 
     def test_experiment_file_format(self):
@@ -54,6 +208,46 @@ class Test_OT2(unittest.TestCase):
 
 
 
+class Test_ConductivityMeter(unittest.TestCase):
+
+    cwd = os.path.dirname(__file__)
+    formulation_path = os.path.join(cwd, "test_data", "experiment.csv")
+
+    def test_export_rows(self):
+        """Test that a result with a row fills it, whatever the uid and the order of measurement"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "experiment.csv")
+            write_csv_records(path, ["unique_id", "Chemical1"], [{"unique_id": None, "Chemical1": 1}] * 4)
+            cm = ConductivityMeter(config={})
+            cm._formulation_input_path = path
+            # the measurement order of a stock training set: A2, B1, A1, B2
+            cm.result_list = [
+                {"uid": None, "row": row, "Conductivity": row / 100, "Temperature": 25.0, "Time": None}
+                for row in [1, 2, 0, 3]
+            ]
+            cm.export_result()
+            _, records = read_csv_records(path)
+        self.assertEqual([r["Conductivity"] for r in records], [0, 0.01, 0.02, 0.03])
+
+    def test_export_result(self):
+        """Test that the results are written to the formulation file in the order of measurement"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "experiment.csv")
+            shutil.copy2(self.formulation_path, path)
+            cm = ConductivityMeter(config={})
+            cm._formulation_input_path = path
+            cm.result_list = [
+                {"uid": 112, "Conductivity": 0.01, "Temperature": 25.1, "Time": "2024-01-01 00:00:00"},
+                {"uid": 115, "Conductivity": 0.02, "Temperature": 25.2, "Time": "2024-01-01 00:10:00"},
+            ]
+            cm.export_result()
+            columns, records = read_csv_records(path)
+        self.assertEqual(columns[0], "unique_id")
+        self.assertEqual([r["Conductivity"] for r in records], [None, 0.01, None, None, 0.02])
+        self.assertEqual(records[4]["Temperature"], 25.2)
+        self.assertEqual(records[0]["Chemical1"], 2)
+        self.assertEqual(cm.result_list, [])
+
 
 if __name__ == "__main__":
     # unittest.main()
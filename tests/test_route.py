@@ -0,0 +1,46 @@
+import os
+import json
+import unittest
+from auto.route import MotionModel, plan_route, well_position
+
+
+class Test_Route(unittest.TestCase):
+
+    cwd = os.path.dirname(__file__)
+    with open(os.path.join(cwd, "test_data", "automat_2x4wellplate_20ml.json"), "r") as f:
+        definition = json.load(f)
+
+    def test_motion_model(self):
+        """Test that the axes move at the same time and that faster axes shorten the travel"""
+        model = MotionModel(lift=0)
+        self.assertEqual(model.time((0, 0), (0, 0)), 0)
+        self.assertAlmostEqual(model.time((0, 0), (600, 100)), 1.0) # x is the slowest
+        self.assertAlmostEqual(model.time((0, 0), (100, 800)), 2.0) # y is the slowest
+        self.assertAlmostEqual(MotionModel({"y": 800}, lift=0).time((0, 0), (100, 800)), 1.0)
+        self.assertAlmostEqual(MotionModel(lift=25).time((0, 0), (0, 0.1)), 0.4 + 0.1 / 400)
+
+    def test_well_position(self):
+        """Test that the position of a well is the corner of its slot plus its offset"""
+        well = self.definition["wells"]["A1"]
+        self.assertEqual(well_position(1, "A1", self.definition), (well["x"], well["y"]))
+        self.assertEqual(well_position(5, "A1", self.definition), (132.5 + well["x"], 90.5 + well["y"]))
+
+    def test_plan_route(self):
+        """Test that the nearest rinse station is used and the first well is the nearest to the start"""
+        model = MotionModel(lift=0)
+        wells = [(1, "A1"), (1, "A2"), (1, "A3")]
+        positions = {(1, "A1"): (0, 0), (1, "A2"): (600, 0), (1, "A3"): (1200, 0)}
+        rinses = [((0, 400), (0, 400)), ((1200, 400), (1200, 400))]
+        sponge = (600, 400)
+        order, stations, travel_time = plan_route(wells, positions, rinses, sponge, model, start=(1200, 0))
+        self.assertEqual(order, [2, 0, 1])
+        self.assertEqual(stations, [1, 0, 0]) # A2 is as far from both stations, the first is kept
+        # from the start to A3, then each well and back to the sponge through a rinse station
+        self.assertAlmostEqual(travel_time, 0 + (1 + 1) + (1 + 1 + 1) + (1 + 1 + 1))
+        # the route is never longer than the measurement in row order with a single station
+        _, _, single = plan_route(wells, positions, rinses[:1], sponge, model, start=(1200, 0))
+        self.assertLess(travel_time, single)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+from auto.sockets import EventServer, EventClient, encode_frame, read_frame
+
+
+class Test_EventServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = EventServer("127.0.0.1", 0)
+        self.events = []
+        self.server.on("completed", lambda connection, params: self.events.append((connection.name, params)))
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_frame(self):
+        """Test that a frame is read back identically"""
+        async def roundtrip():
+            reader = asyncio.StreamReader()
+            reader.feed_data(encode_frame({"a": [1, 2]}))
+            return await read_frame(reader)
+        self.assertEqual(asyncio.run(roundtrip()), {"a": [1, 2]})
+
+    def test_many_clients(self):
+        """Test that concurrent clients are answered by name and that their events arrive"""
+        async def instrument(name, delay, stop):
+            client = EventClient(name)
+
+            @client.on("measure")
+            async def measure(connection, params):
+                await asyncio.sleep(delay)
+                return {"name": name, "channel": params["channel"]}
+
+            await client.connect("127.0.0.1", self.server.port)
+            await client.notify("completed", {"channel": 1})
+            await stop.wait()
+            await client.close()
+
+        async def run_clients(stop):
+            await asyncio.gather(*(instrument(f"station{i}", 0.2, stop) for i in range(5)))
+
+        async def main():
+            stop = asyncio.Event()
+            task = asyncio.ensure_future(run_clients(stop))
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.server.wait_for_client, "station4", 2)
+            start = loop.time()
+            results = await asyncio.gather(*(
+                loop.run_in_executor(None, self.server.request, f"station{i}", "measure", {"channel": i}, 2)
+                for i in range(5)
+            ))
+            elapsed = loop.time() - start
+            with self.assertRaises(TimeoutError):
+                await loop.run_in_executor(None, self.server.request, "station0", "measure", {"channel": 0}, 0.01)
+            with self.assertRaises(RuntimeError):
+                await loop.run_in_executor(None, self.server.request, "station0", "unknown", {}, 1)
+            stop.set()
+            await task
+            return results, elapsed
+
+        results, elapsed = asyncio.run(main())
+        self.assertEqual([r["channel"] for r in results], list(range(5)))
+        self.assertLess(elapsed, 0.8) # the five 0.2 s requests run concurrently
+        self.assertEqual(len(self.events), 5)
+
+    def test_port_in_use(self):
+        """Test that a server which cannot listen raises instead of waiting forever"""
+        with self.assertRaises(OSError):
+            EventServer("127.0.0.1", self.server.port).start()
+
+    def test_bad_frame(self):
+        """Test that a client sending a frame which is not json is disconnected and forgotten"""
+        async def main():
+            reader, writer = await asyncio.open_connection("127.0.0.1", self.server.port)
+            writer.write(encode_frame({"type": "request", "id": 1, "method": "hello", "params": {"name": "bad"}}))
+            await read_frame(reader)
+            self.assertIn("bad", self.server.clients)
+            writer.write(b"\x00\x00\x00\x03{{{")
+            self.assertEqual(await reader.read(), b"") # closed by the server
+            writer.close()
+            for _ in range(100):
+                if "bad" not in self.server.clients:
+                    break
+                await asyncio.sleep(0.01)
+        asyncio.run(main())
+        self.assertNotIn("bad", self.server.clients)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import os
+import csv
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+from auto.sockets import EventServer
+from auto.squidstat import (
+    SquidStatRPC, SquidStatService, FakeSquidStat, ChannelWriter, ChannelScheduler, CycleAnalyzer,
+    read_channel, export_csv
+)
+
+
+class Test_SquidStatRPC(unittest.TestCase):
+
+    def setUp(self):
+        self.server = EventServer("127.0.0.1", 0)
+        self.rpc = SquidStatRPC(self.server, timeout=5)
+        self.server.start()
+        self.backend = FakeSquidStat(n_channels=4, duration=0.2, n_points=5)
+        self.service = SquidStatService(self.backend)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_until_complete,
+            args=(self.service.run("127.0.0.1", self.server.port),),
+            daemon=True
+        )
+        self.thread.start()
+        self.server.wait_for_client("squidstat", timeout=5)
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(5)
+        self.loop.close()
+
+    def test_start_and_wait(self):
+        """Test that the completion of every channel is pushed without polling"""
+        start = time.monotonic()
+        for channel in range(4):
+            self.assertTrue(self.rpc.start_experiment(channel, uid=f"well_{channel}")["started"])
+        self.assertEqual(set(self.rpc.status().values()), {"running"})
+        for channel in range(4):
+            event = self.rpc.wait_completed(channel, timeout=5)
+            self.assertEqual(event["uid"], f"well_{channel}")
+        self.assertLess(time.monotonic() - start, 1.0) # the channels run concurrently
+        self.assertEqual(self.rpc.status(2), {2: "completed"})
+        results = self.rpc.results(2)
+        self.assertEqual(results["uid"], "well_2")
+        self.assertEqual(results["columns"], FakeSquidStat.COLUMNS)
+        self.assertEqual(len(results["rows"]), 5)
+
+    def test_errors(self):
+        """Test that a busy or missing channel is refused and that a wait can time out"""
+        self.rpc.start_experiment(0)
+        with self.assertRaises(RuntimeError):
+            self.rpc.start_experiment(0)
+        with self.assertRaises(RuntimeError):
+            self.rpc.start_experiment(9)
+        with self.assertRaises(TimeoutError):
+            self.rpc.wait_completed(1, timeout=0.1)
+
+
+class Test_ChannelWriter(unittest.TestCase):
+
+    def test_blocks(self):
+        """Test that the samples are written in blocks and read back in order"""
+        with tempfile.TemporaryDirectory() as folder:
+            writer = ChannelWriter(os.path.join(folder, "channel0.bin"), capacity=4, echo_interval=None)
+            for k in range(10):
+                writer.add(k, 0.1 * k, 1e-3 * k)
+            self.assertEqual(writer.count, 2) # two blocks of 4 are written
+            self.assertEqual(len(read_channel(writer.path)["Timestamp"]), 8)
+            writer.close()
+            data = read_channel(writer.path)
+            self.assertEqual(list(data["Timestamp"]), list(range(10)))
+            self.assertAlmostEqual(data["Current"][7], 7e-3)
+            with open(export_csv(writer.path), "r") as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(rows[0], ["Timestamp", "Working Electrode Voltage", "Current"])
+            self.assertEqual(len(rows), 11)
+
+
+class Test_ChannelScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.started = []
+
+    def launch(self, channel, job):
+        if job.get("fail"):
+            raise RuntimeError("upload failed")
+        self.started.append((channel, job["uid"]))
+
+    def test_refill(self):
+        """Test that a freed channel takes the next job while the others keep running"""
+        jobs = [{"uid": k} for k in range(5)] + [{"uid": 5, "channel": 1}]
+        scheduler = ChannelScheduler(2, jobs, self.launch, clock=lambda: self.now)
+        scheduler.start()
+        self.assertEqual(self.started, [(0, 0), (1, 1)])
+        self.now = 1.0
+        scheduler.complete_experiment(1)
+        self.assertEqual(self.started[-1], (1, 2))
+        self.now = 2.0
+        scheduler.complete_experiment(0)
+        scheduler.complete_experiment(1)
+        self.assertEqual(self.started[-2:], [(0, 3), (1, 4)])
+        self.now = 3.0
+        scheduler.complete_experiment(0) # the last job is pinned to channel 1
+        self.assertEqual(scheduler.get_running_channels(), [1])
+        scheduler.complete_experiment(1)
+        self.assertEqual(self.started[-1], (1, 5))
+        self.now = 4.0
+        scheduler.complete_experiment(1)
+        self.assertTrue(scheduler.done)
+        self.assertEqual(scheduler.utilization(), {0: 0.75, 1: 1.0})
+
+    def test_failed_job(self):
+        """Test that a job which fails to start is reported and skipped"""
+        jobs = [{"uid": 0, "fail": True}, {"uid": 1}]
+        scheduler = ChannelScheduler(1, jobs, self.launch, clock=lambda: self.now)
+        scheduler.start()
+        self.assertEqual(self.started, [(0, 1)])
+        self.assertIn("job 0 failed on channel 0: RuntimeError: upload failed", scheduler.report())
+        with self.assertRaises(ValueError):
+            ChannelScheduler(1, [{"uid": 0, "channel": 2}], self.launch)
+
+
+class Test_CycleAnalyzer(unittest.TestCase):
+
+    def test_cycles(self):
+        """Test that the features of each cycle are emitted as soon as the cycle completes"""
+        emitted = []
+        analyzer = CycleAnalyzer(emitted.append, onset_current=5e-4, min_peak_current=1.5e-3)
+        t = 0
+        for cycle in range(3):
+            # anodic sweep from 0 to 1 V then cathodic sweep back to 0 V, 0.01 V per second
+            sweeps = [(k, True) for k in range(0, 100)] + [(k, False) for k in range(100, 0, -1)]
+            for k, anodic in sweeps:
+                voltage = k / 100
+                current = 1e-3 * (cycle + 1) * voltage if anodic else -1e-3 * (1 - voltage)
+                analyzer.add(t, voltage, current)
+                t += 1
+            self.assertEqual(len(emitted), cycle) # the reversal at 0 V is seen in the next cycle
+        analyzer.add(t, 0.0, 0.0)
+        self.assertEqual(len(emitted), 2)
+        self.assertIsNotNone(analyzer.close())
+        self.assertEqual(len(emitted), 3)
+        first, second = emitted[0], emitted[1]
+        self.assertAlmostEqual(first["anodic_peak_current"], 0.99e-3)
+        self.assertAlmostEqual(first["anodic_peak_voltage"], 0.99)
+        self.assertAlmostEqual(first["onset_voltage"], 0.5)
+        self.assertLess(first["cathodic_peak_current"], 0)
+        self.assertTrue(first["failed"])
+        self.assertFalse(second["failed"])
+        self.assertAlmostEqual(second["onset_voltage"], 0.25)
+        self.assertGreater(first["charge"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
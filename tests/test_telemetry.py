@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from auto.telemetry import Tracer, traced, read_trace, summarize, format_summary
+
+
+class Clock():
+    """A clock which advances by one second at each reading."""
+    def __init__(self):
+        self.t = -1.0
+
+    def __call__(self):
+        self.t += 1.0
+        return self.t
+
+
+class Arm():
+    def __init__(self, tracer=None):
+        self.tracer = tracer
+
+    @traced("dispense_chemical", "source", "target", "volume")
+    def dispense_chemical(self, source=(None, None), target=(None, None), volume=0):
+        self.aspirate(volume)
+
+    @traced("aspirate", "volume", "z")
+    def aspirate(self, volume, z=5):
+        if volume < 0:
+            raise ValueError("Negative volume")
+
+    @traced("measure", well=lambda a: a["formulation"]["location"])
+    def measure(self, formulation):
+        return formulation["unique_id"]
+
+
+class Test_Tracer(unittest.TestCase):
+
+    def test_spans(self):
+        """Test that the spans are nested, record their fields and the errors"""
+        arm = Arm(Tracer(clock=Clock()))
+        arm.dispense_chemical((4, "A1"), (5, "A1"), volume=100)
+        self.assertEqual(arm.measure({"unique_id": 7, "location": (5, "A1")}), 7)
+        with self.assertRaises(ValueError):
+            arm.aspirate(-1)
+        aspirate, dispense, measure, error = arm.tracer.spans
+        self.assertEqual(aspirate, {"name": "aspirate", "start": 2.0, "duration": 1.0, "depth": 1, "volume": 100, "z": 5})
+        self.assertEqual(dispense["duration"], 3.0)
+        self.assertEqual(dispense["depth"], 0)
+        self.assertEqual(dispense["source"], (4, "A1"))
+        self.assertEqual(measure["well"], (5, "A1"))
+        self.assertEqual(error["error"], "ValueError")
+        # without a tracer the methods are not recorded
+        self.assertEqual(Arm().measure({"unique_id": 7, "location": (5, "A1")}), 7)
+
+    def test_trace_file(self):
+        """Test that the trace file holds the spans and that they are summarized"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "trace.jsonl")
+            arm = Arm(Tracer(path, clock=Clock()))
+            arm.dispense_chemical((4, "A1"), (5, "A1"), volume=100)
+            arm.dispense_chemical((4, "A2"), (5, "A1"), volume=100)
+            arm.dispense_chemical() # the void action, which drops the tip
+            arm.measure({"unique_id": 7, "location": (5, "A1")})
+            arm.tracer.close()
+            spans = read_trace(path)
+        self.assertEqual(len(spans), 7)
+        summary = summarize(spans, chemicals={(4, "A1"): "Chemical1"})
+        self.assertEqual(summary["total"], 14.0)
+        self.assertEqual(summary["phase"]["aspirate"], (3, 3.0))
+        self.assertEqual(summary["phase"]["dispense_chemical"], (3, 6.0)) # without the aspirations
+        self.assertEqual(sum(seconds for _, seconds in summary["phase"].values()), 10.0)
+        self.assertEqual(summary["chemical"], {"Chemical1": 3.0, (4, "A2"): 3.0})
+        self.assertEqual(summary["well"], {(5, "A1"): 7.0})
+        self.assertIn("Chemical1", format_summary(summary))
+
+    def test_trace_runs(self):
+        """Test that the runs are appended to the trace file and that each span is written when it ends"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "trace.jsonl")
+            for volume in [100, 200]:
+                arm = Arm(Tracer(path, clock=Clock()))
+                arm.dispense_chemical((4, "A1"), (5, "A1"), volume=volume)
+                # a run which fails before closing its tracer keeps its spans
+                self.assertEqual(len(read_trace(path)), 2)
+            first, last = read_trace(path, run=0), read_trace(path)
+            arm.tracer.close()
+        self.assertEqual(first[0]["volume"], 100)
+        self.assertEqual(last[0]["volume"], 200)
+        self.assertEqual(last[1]["start"], 1.0) # each run starts its own clock
+
+
+if __name__ == "__main__":
+    unittest.main()